@@ -0,0 +1,94 @@
+# ==============================================================================
+# AGGREGATES.PY - Indicateurs de Flotte sur Agrégats Matérialisés
+# Lecture seule des tables audit_daily_aggregates / audit_monthly_aggregates,
+# tenues à jour par triggers à chaque écriture d'audit (voir database.py) :
+# le coût d'un tableau de bord ne dépend plus du nombre d'audits bruts.
+# ==============================================================================
+from datetime import date
+from typing import Dict, List, Tuple
+
+from database import AGGREGATE_MEASURES
+
+# Indicateurs dérivés des sommes (mêmes expressions pour toutes les vues)
+_SUMS = ", ".join(f"SUM({m}) AS {m}" for m in AGGREGATE_MEASURES)
+
+
+def _month_start(d: date) -> date:
+    return d.replace(day=1)
+
+
+def _next_month(d: date) -> date:
+    return date(d.year + (d.month == 12), d.month % 12 + 1, 1)
+
+
+class FleetAggregates:
+    """
+    Une période [since, until) est découpée en mois entiers (table mensuelle, ~30x moins de lignes)
+    et en jours de bord (table journalière) : 3 ans de flotte = 36 lignes par couple engin/scénario.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def _source(self, since: date, until: date, columns="equipment_id, scenario_code") -> Tuple[str, tuple]:
+        """Sous-requête UNION ALL (period, columns, mesures) couvrant [since, until)"""
+        measures = ", ".join(AGGREGATE_MEASURES)
+        parts, params = [], []
+        m_start = since if since.day == 1 else _next_month(since)
+        m_end = _month_start(until)
+        if m_start < m_end:
+            day_ranges = [(since, m_start), (m_end, until)]
+            parts.append(f"SELECT month AS period, {columns}, {measures} FROM audit_monthly_aggregates WHERE month >= ? AND month < ?")
+            params += [m_start.isoformat()[:7], m_end.isoformat()[:7]]
+        else: day_ranges = [(since, until)]
+        for start, end in day_ranges:
+            if start >= end: continue
+            parts.append(f"SELECT day AS period, {columns}, {measures} FROM audit_daily_aggregates WHERE day >= ? AND day < ?")
+            params += [start.isoformat(), end.isoformat()]
+        if not parts:  # Période vide
+            parts.append(f"SELECT NULL AS period, {columns}, {measures} FROM audit_daily_aggregates WHERE 0")
+        return " UNION ALL ".join(parts), tuple(params)
+
+    @staticmethod
+    def _derive(row) -> Dict:
+        r = dict(row)
+        n = r.get('n_audits') or 0
+        est = r.get('fuel_estimated_l') or 0
+        r['excess_l'] = (r.get('fuel_declared_l') or 0) - est
+        r['deviation_pct'] = r['excess_l'] / est * 100 if est > 0 else 0.0
+        r['mean_deviation_pct'] = (r.get('deviation_sum') or 0) / n if n else 0.0
+        r['anomaly_rate_pct'] = (r.get('n_anomalie') or 0) / n * 100 if n else 0.0
+        r['suspect_rate_pct'] = (r.get('n_suspect') or 0) / n * 100 if n else 0.0
+        return r
+
+    def kpis(self, since: date, until: date) -> Dict:
+        src, params = self._source(since, until)
+        row = self.db.execute_read(
+            f"SELECT {_SUMS}, COUNT(DISTINCT equipment_id) AS n_equipment FROM ({src})", params
+        )[0]
+        return self._derive(row)
+
+    def by_month(self, since: date, until: date) -> List[Dict]:
+        src, params = self._source(since, until)
+        rows = self.db.execute_read(f"SELECT substr(period, 1, 7) AS month, {_SUMS} FROM ({src}) GROUP BY 1 ORDER BY 1", params)
+        return [self._derive(r) for r in rows]
+
+    def by_equipment(self, since: date, until: date, limit=20) -> List[Dict]:
+        """Engins triés par excédent de carburant déclaré (litres au-dessus de l'estimation)"""
+        src, params = self._source(since, until)
+        rows = self.db.execute_read(
+            f"SELECT equipment_id, {_SUMS} FROM ({src}) GROUP BY equipment_id "
+            f"ORDER BY SUM(fuel_declared_l) - SUM(fuel_estimated_l) DESC LIMIT ?", (*params, limit)
+        )
+        return [self._derive(r) for r in rows]
+
+    def by_scenario(self, since: date, until: date) -> List[Dict]:
+        src, params = self._source(since, until)
+        rows = self.db.execute_read(f"SELECT scenario_code, {_SUMS} FROM ({src}) GROUP BY scenario_code ORDER BY n_audits DESC", params)
+        return [self._derive(r) for r in rows]
+
+    def rebuild(self):
+        """Recalcul complet (base chaude + archives attachées), ex. après un import direct en SQL"""
+        self.db.refresh_archives()
+        with self.db.write_transaction("aggregates_rebuild") as conn:
+            self.db.rebuild_aggregates(conn.cursor())
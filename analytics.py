@@ -5,10 +5,20 @@
 
 import numpy as np
 from typing import Dict, List, Tuple, Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from collections import deque
+import json
 import logging
+import math
+import threading
+import time
 from datetime import datetime
 
+from shared_cache import SharedCache
+from metrics import timed
+from archive import AuditArchive, BY_EQUIPMENT
+from database import hot_query, CONFIG_VALUE
+
 # Configuration du logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -39,6 +49,34 @@ class AnomalyDetectionResult:
     threshold_exceeded: Dict[str, float]
     historical_baseline: Optional[float] = None
     historical_std: Optional[float] = None
+    drift: Optional[Dict[str, float]] = None  # Statistiques CUSUM / EWMA de l'engin (pas des seuils)
+
+@dataclass
+class BatchDetectionResult:
+    """Résultats colonnes de detect_batch (un élément par observation)"""
+    verdict: np.ndarray
+    z_score: np.ndarray
+    severity: np.ndarray
+    confidence: np.ndarray
+    has_history: np.ndarray
+
+@dataclass
+class RollingWindowStats:
+    """Fenêtre glissante des derniers écarts d'un engin (moyenne / M2 de Welford)"""
+    equipment_id: str
+    window: deque = field(default_factory=deque)  # Plus ancien -> plus récent
+    mean: float = 0.0
+    m2: float = 0.0
+    updates_since_resync: int = 0
+
+    @property
+    def count(self) -> int:
+        return len(self.window)
+
+    @property
+    def std(self) -> float:
+        n = len(self.window)
+        return math.sqrt(max(self.m2, 0.0) / (n - 1)) if n >= 2 else 0.0
 
 @dataclass
 class EquipmentLearningOverride:
@@ -81,6 +119,11 @@ class DetailedLoadFactorManager:
     
     @classmethod
     def get_scenarios_by_category(cls, category_prefix: str) -> Dict[str, LoadScenario]:
+        """Résultat partagé entre sessions (catalogue constant) : ne pas modifier"""
+        return SharedCache.get_instance().get_or_load('catalog', ('scenarios', category_prefix), lambda: cls._filter_scenarios(category_prefix))
+
+    @classmethod
+    def _filter_scenarios(cls, category_prefix: str) -> Dict[str, LoadScenario]:
         filtered = {}
         for code, scenario in cls.LOAD_SCENARIOS.items():
             if scenario.category == category_prefix:
@@ -103,26 +146,47 @@ class IntelligentAnomalyDetector:
     # Seuils absolus (Cold Start)
     ABS_THRESHOLD_CRITICAL = 25.0 # %
     ABS_THRESHOLD_WARNING = 15.0 # %
+    ABS_SAFETY_NET = 30.0 # % (Écart énorme signalé même si le Z-score est OK)
+    MIN_HISTORY = 3
+    DRIFT_CONFIDENCE = 0.75
     
     RECOMMENDATIONS = {
         'FUEL_THEFT': ["Vérifier la traçabilité carburant", "Contrôler le bouchon de réservoir", "Confronter le chauffeur"],
         'FUEL_LEAK': ["Inspecter le réservoir (fuite)", "Vérifier les joints injecteurs", "Contrôler le circuit de retour"],
-        'COLD_START': ["Continuez à enregistrer des audits pour affiner la précision de l'IA"]
+        'COLD_START': ["Continuez à enregistrer des audits pour affiner la précision de l'IA"],
+        'DRIFT_UP': ["Dérive lente : comparer les pleins successifs aux relevés de jauge", "Rechercher un siphonnage progressif"],
+        'DRIFT_DOWN': ["Sous-consommation persistante : recalibrer le profil de l'engin"],
     }
     
-    def detect_anomaly(self, equipment_id, deviation_pct, historical_deviations=None, scenario_code=None) -> AnomalyDetectionResult:
+    @timed("gencontrol_detect_seconds", mode="single")
+    def detect_anomaly(self, equipment_id, deviation_pct, historical_deviations=None, scenario_code=None,
+                       baseline: Optional[RollingWindowStats] = None, drift=None) -> AnomalyDetectionResult:
+        """
+        baseline : statistiques glissantes précalculées (RollingStatsStore) ;
+        si fourni, historical_deviations est ignoré.
+        drift : état de dérive de l'engin après cet audit (drift.DriftState) ; une dérive à la hausse
+        rend SUSPECT un audit NORMAL (le Z-score s'habitue à une dérive lente).
+        """
         if historical_deviations is None: historical_deviations = []
+        hist_mean, hist_std = None, None
         
         # 1. Calcul Z-Score (Si historique suffisant)
-        if len(historical_deviations) >= 3:
+        if baseline is not None and baseline.count >= self.MIN_HISTORY:
+            mean_val, std_val = baseline.mean, baseline.std
+            has_history = True
+        elif baseline is None and len(historical_deviations) >= self.MIN_HISTORY:
             mean_val = np.mean(historical_deviations)
             std_val = np.std(historical_deviations, ddof=1)
+            has_history = True
+        else:
+            has_history = False
+        
+        if has_history:
+            hist_mean, hist_std = float(mean_val), float(std_val)
             if std_val < 1e-10: std_val = 1.0 # Éviter division par zéro
             z_score = (deviation_pct - mean_val) / std_val
-            has_history = True
         else:
             z_score = 0.0
-            has_history = False
             
         abs_dev = abs(deviation_pct)
         abs_z = abs(z_score)
@@ -144,7 +208,7 @@ class IntelligentAnomalyDetector:
                 confidence = 0.80
             else:
                 # Filet de sécurité : Si Z-score OK mais écart énorme (>30%), on signale quand même
-                if abs_dev > 30.0:
+                if abs_dev > self.ABS_SAFETY_NET:
                     verdict = "ANOMALIE"
                     confidence = 0.70
         else:
@@ -158,15 +222,84 @@ class IntelligentAnomalyDetector:
                 severity = "MEDIUM"
                 confidence = 0.60
         
-        # 3. Génération des recommandations
+        # 3. Dérive lente (CUSUM / EWMA sur tout l'historique)
+        alarm = getattr(drift, 'alarm', None)
+        drift_stats = {'cusum_pos': drift.cusum_pos, 'cusum_neg': drift.cusum_neg, 'ewma': drift.ewma} if drift is not None else None
+        if alarm == 'DRIFT_UP' and verdict == "NORMAL":
+            verdict, severity, confidence = "SUSPECT", "MEDIUM", self.DRIFT_CONFIDENCE
+        
+        # 4. Génération des recommandations
         recs = []
         if verdict != "NORMAL":
             if deviation_pct < -5.0: # Conso déclarée < Théorie (Peu probable sauf erreur saisie)
                  recs = ["Vérifier calibration compteur (Sous-consommation anormale)"]
             elif deviation_pct > 5.0: # Conso déclarée > Théorie (Vol ou Fuite)
                  recs = self.RECOMMENDATIONS['FUEL_THEFT'] + self.RECOMMENDATIONS['FUEL_LEAK']
+        if alarm: recs = recs + self.RECOMMENDATIONS[alarm]
         
-        return AnomalyDetectionResult(verdict, z_score, deviation_pct, confidence, recs, severity, {})
+        return AnomalyDetectionResult(verdict, z_score, deviation_pct, confidence, recs, severity, {}, hist_mean, hist_std, drift_stats)
+
+    # --- VERSION VECTORISÉE (Ré-audits, imports, flottes) ---
+    @classmethod
+    def window_baselines(cls, windows) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Moyenne / écart-type (ddof=1) / taille de chaque fenêtre d'historique.
+        Les fenêtres de même taille sont empilées en une matrice contiguë et réduites
+        par ligne : mêmes résultats, au bit près, que np.mean/np.std sur chaque liste.
+        """
+        n = len(windows)
+        mean, std = np.full(n, np.nan), np.full(n, np.nan)
+        count = np.fromiter((len(w) for w in windows), dtype=np.int64, count=n)
+        for size in np.unique(count):
+            if size < cls.MIN_HISTORY: continue
+            idx = np.flatnonzero(count == size)
+            block = np.array([windows[i] for i in idx], dtype=float)
+            mean[idx] = block.mean(axis=1)
+            std[idx] = block.std(axis=1, ddof=1)
+        return mean, std, count
+
+    @timed("gencontrol_detect_seconds", mode="vectorized")
+    def score_from_baselines(self, deviation_pct, mean, std, count) -> BatchDetectionResult:
+        """Logique de décision hybride de detect_anomaly appliquée à des tableaux"""
+        dev = np.asarray(deviation_pct, dtype=float)
+        has_history = np.asarray(count) >= self.MIN_HISTORY
+        std = np.where(np.asarray(std) < 1e-10, 1.0, std) # Éviter division par zéro
+        with np.errstate(invalid='ignore', divide='ignore'):
+            z_score = np.where(has_history, (dev - mean) / std, 0.0)
+        abs_dev, abs_z = np.abs(dev), np.abs(z_score)
+        
+        conditions = [
+            has_history & (abs_z > self.Z_THRESHOLD_CRITICAL),
+            has_history & (abs_z > self.Z_THRESHOLD_WARNING),
+            has_history & (abs_dev > self.ABS_SAFETY_NET),
+            ~has_history & (abs_dev > self.ABS_THRESHOLD_CRITICAL),
+            ~has_history & (abs_dev > self.ABS_THRESHOLD_WARNING),
+        ]
+        verdict = np.select(conditions, ["ANOMALIE", "SUSPECT", "ANOMALIE", "ANOMALIE", "SUSPECT"], "NORMAL").astype(object)
+        severity = np.select(conditions, ["CRITICAL", "HIGH", "LOW", "CRITICAL", "MEDIUM"], "LOW").astype(object)
+        confidence = np.select(conditions, [0.95, 0.80, 0.70, 0.90, 0.60], 0.5)
+        return BatchDetectionResult(verdict, z_score, severity, confidence, has_history)
+
+    def apply_drift(self, result: BatchDetectionResult, drift_alarms) -> BatchDetectionResult:
+        """Version lot de la règle de dérive de detect_anomaly (drift_alarms : 1 = hausse, -1 = baisse, 0)"""
+        upgrade = (np.asarray(drift_alarms) == 1) & (result.verdict == "NORMAL")
+        result.verdict = np.where(upgrade, "SUSPECT", result.verdict)
+        result.severity = np.where(upgrade, "MEDIUM", result.severity)
+        result.confidence = np.where(upgrade, self.DRIFT_CONFIDENCE, result.confidence)
+        return result
+
+    @timed("gencontrol_detect_seconds", mode="batch")
+    def detect_batch(self, equipment_ids, deviation_pct, history_windows: Dict[str, List[float]]) -> BatchDetectionResult:
+        """
+        Détection en lot : chaque observation (equipment_ids[i], deviation_pct[i]) est évaluée
+        contre la fenêtre historique de son engin (même ordre que pour detect_anomaly).
+        Résultats identiques au chemin scalaire, sans les recommandations.
+        """
+        # Factorisation par dictionnaire (plus rapide qu'un tri de chaînes via np.unique)
+        codes: Dict[str, int] = {}
+        inverse = np.fromiter((codes.setdefault(e, len(codes)) for e in equipment_ids), dtype=np.int64, count=len(equipment_ids))
+        mean, std, count = self.window_baselines([history_windows.get(e) or [] for e in codes])
+        return self.score_from_baselines(deviation_pct, mean[inverse], std[inverse], count[inverse])
 
 # =============================================================================
 # 4. MOTEUR D'APPRENTISSAGE ADAPTATIF (LE CERVEAU)
@@ -183,96 +316,298 @@ class AdaptiveLearningEngine:
         self.learning_cache = {}
         self.min_samples = min_samples
 
-    def get_equipment_override(self, equipment_id, scenario_code, db_connection) -> Optional[EquipmentLearningOverride]:
-        """Récupère le profil appris s'il existe"""
-        try:
-            query = """
+    OVERRIDE_LOOKUP = hot_query("override_lookup", """
             SELECT load_typ, learned_from_n_samples, confidence_score, last_updated 
             FROM equipment_load_overrides
             WHERE equipment_id = ? AND scenario_code = ? AND is_active = 1
-            """
-            rows = db_connection.execute_read(query, (equipment_id, scenario_code))
-            if rows:
-                r = rows[0]
-                return EquipmentLearningOverride(
-                    equipment_id, scenario_code, 
-                    r['load_typ'], 0.0, 0.0, 
-                    r['learned_from_n_samples'], r['confidence_score'],
-                    datetime.fromisoformat(r['last_updated']), True
-                )
+            """, ("EQ", "GE_OFFICE_AC"))
+
+    def get_equipment_override(self, equipment_id, scenario_code, db_connection) -> Optional[EquipmentLearningOverride]:
+        """Récupère le profil appris s'il existe (cache partagé, invalidé à chaque apprentissage)"""
+        def _load():
+            rows = db_connection.execute_read(self.OVERRIDE_LOOKUP, (equipment_id, scenario_code))
+            if not rows: return None
+            r = rows[0]
+            return EquipmentLearningOverride(
+                equipment_id, scenario_code, 
+                r['load_typ'], 0.0, 0.0, 
+                r['learned_from_n_samples'], r['confidence_score'],
+                datetime.fromisoformat(r['last_updated']), True
+            )
+        try:
+            return db_connection.cache.get_or_load('overrides', (equipment_id, scenario_code), _load)
         except Exception as e:
             logger.error(f"Erreur lecture override: {e}")
         return None
 
-    def batch_learn_from_all_equipment(self, db) -> Dict[str, int]:
+    # Mise à jour O(1) : les cumuls (somme/nb de ratios) sont stockés avec le profil,
+    # la nouvelle charge est recalculée par SQLite dans le même UPSERT.
+    # Profil sans cumuls (appris avant leur ajout, sans historique) : amorcés depuis la charge apprise
+    # et le nombre d'échantillons, pour ne pas remplacer n échantillons par un seul.
+    _RATIO_SUM_SQL = "COALESCE(ratio_sum, load_typ / :base_load * learned_from_n_samples, 0)"
+    _RATIO_COUNT_SQL = "COALESCE(ratio_count, learned_from_n_samples, 0)"
+    _LEARNED_LOAD_SQL = f"MAX(0.05, MIN(1.0, :base_load * ({_RATIO_SUM_SQL} + :ratio) / ({_RATIO_COUNT_SQL} + 1)))"
+    INCREMENTAL_UPSERT = f"""
+    INSERT INTO equipment_load_overrides
+    (equipment_id, scenario_code, load_min, load_typ, load_max, learned_from_n_samples, confidence_score, last_updated, is_active, ratio_sum, ratio_count)
+    VALUES (:eq_id, :sc_code, :load * 0.8, :load, :load * 1.2, 1, 0.9, :ts, :active, :ratio, 1)
+    ON CONFLICT (equipment_id, scenario_code) DO UPDATE SET
+        load_min = {_LEARNED_LOAD_SQL} * 0.8,
+        load_typ = {_LEARNED_LOAD_SQL},
+        load_max = {_LEARNED_LOAD_SQL} * 1.2,
+        learned_from_n_samples = COALESCE(learned_from_n_samples, 0) + 1,
+        ratio_sum = {_RATIO_SUM_SQL} + :ratio,
+        ratio_count = {_RATIO_COUNT_SQL} + 1,
+        last_updated = :ts,
+        is_active = CASE WHEN {_RATIO_COUNT_SQL} + 1 >= :min_samples THEN 1 ELSE is_active END
+    """
+
+    def learn_from_audit(self, db, equipment_id, scenario_code, fuel_declared_l, estimated_typ, verdict) -> bool:
+        """
+        APPRENTISSAGE INCRÉMENTAL : intègre un audit confirmé au profil de l'engin.
+        Seuls les audits 'NORMAL' avec une estimation valide sont appris.
+        """
+        params = self.learning_params(equipment_id, scenario_code, fuel_declared_l, estimated_typ, verdict)
+        if params is None: return False
+        try:
+            db.execute_write(self.INCREMENTAL_UPSERT, params)
+            db.cache.bump('overrides')
+            return True
+        except Exception as e:
+            logger.error(f"Erreur Learning Incrémental: {e}")
+            return False
+
+    def learning_params(self, equipment_id, scenario_code, fuel_declared_l, estimated_typ, verdict) -> Optional[Dict]:
+        """Paramètres de INCREMENTAL_UPSERT pour un audit (None s'il n'est pas apprenable) ; sert aussi aux imports en masse"""
+        if verdict != 'NORMAL' or not estimated_typ or estimated_typ <= 0: return None
+        base_scenario = DetailedLoadFactorManager.get_scenario(scenario_code)
+        if not base_scenario: return None
+        ratio = fuel_declared_l / estimated_typ
+        return {
+            'eq_id': equipment_id, 'sc_code': scenario_code, 'ratio': ratio,
+            'base_load': base_scenario.load_typ,
+            'load': max(0.05, min(1.0, base_scenario.load_typ * ratio)),
+            'ts': datetime.now().isoformat(),
+            'active': 1 if self.min_samples <= 1 else 0,
+            'min_samples': self.min_samples,
+        }
+
+    # Candidats + ratio moyen en un seul passage (voir batch_learn_from_all_equipment)
+    LEARNING_RATIOS = hot_query("learning_ratios", """
+            SELECT equipment_id, scenario_code, SUM(n) AS n_samples, SUM(rs) AS ratio_sum, SUM(rc) AS ratio_count
+            FROM (
+                SELECT equipment_id, scenario_code, COUNT(*) AS n,
+                       SUM(CASE WHEN estimated_typ > 0 THEN fuel_declared_l / estimated_typ END) AS rs,
+                       COUNT(CASE WHEN estimated_typ > 0 THEN 1 END) AS rc
+                FROM audits
+                WHERE verdict = 'NORMAL'
+                GROUP BY equipment_id, scenario_code
+                UNION ALL
+                SELECT equipment_id, scenario_code, n_samples, ratio_sum, ratio_count FROM audit_archive_learning
+            )
+            GROUP BY equipment_id, scenario_code
+            HAVING n_samples >= ?
+            """, (1,), ("audit_archive_learning",))
+
+    def batch_learn_from_all_equipment(self, db) -> Dict[str, float]:
         """
         L'ALGORITHME D'APPRENTISSAGE :
-        1. Cherche les équipements avec des audits 'NORMAL'.
-        2. Calcule le ratio moyen (Réel / Théorique).
-        3. Met à jour la charge théorique pour coller à la réalité.
+        1. Calcule en une seule requête groupée le ratio moyen (Réel / Théorique)
+           des audits 'NORMAL' de chaque couple Equipement/Scenario.
+        2. Met à jour la charge théorique pour coller à la réalité.
+        3. Écrit tous les profils appris dans une seule transaction.
+        Sert de réparation : en temps normal, learn_from_audit tient les profils à jour.
         """
         stats = {'successful': 0, 'failed': 0}
+        t_start = time.perf_counter()
         
         try:
-            # 1. Identifier les candidats (Couple Equipement/Scenario avec assez d'audits NORMAUX)
-            query_candidates = """
-            SELECT equipment_id, scenario_code, COUNT(*) as n_samples
-            FROM audits
-            WHERE verdict = 'NORMAL' 
-            GROUP BY equipment_id, scenario_code
-            HAVING n_samples >= ?
-            """
-            candidates = db.execute_read(query_candidates, (self.min_samples,))
+            # 1. Candidats + ratio moyen en un seul passage
+            # On ne prend QUE les audits validés comme "NORMAL" (on n'apprend pas des vols !)
+            # Ratio > 1.0 : la machine consomme plus que la théorie ; < 1.0 : elle consomme moins
+            # Les audits archivés contribuent par leurs agrégats (audit_archive_learning), sans ouvrir les archives
+            candidates = db.execute_read(self.LEARNING_RATIOS, (self.min_samples,))
+            t_query = time.perf_counter()
             
+            # 2. APPRENTISSAGE : Nouvelle Charge = Charge Base * Ratio Observé
+            timestamp = datetime.now().isoformat()
+            rows = []
             for cand in candidates:
-                eq_id = cand['equipment_id']
-                sc_code = cand['scenario_code']
-                n = cand['n_samples']
+                base_scenario = DetailedLoadFactorManager.get_scenario(cand['scenario_code'])
+                if not cand['ratio_count'] or not base_scenario: continue
+                avg_ratio = cand['ratio_sum'] / cand['ratio_count']
                 
-                # 2. Analyser les performances réelles
-                # On ne prend QUE les audits validés comme "NORMAL" (on n'apprend pas des vols !)
-                query_data = """
-                SELECT fuel_declared_l, estimated_typ
-                FROM audits
-                WHERE equipment_id = ? AND scenario_code = ? AND verdict = 'NORMAL'
-                """
-                audits = db.execute_read(query_data, (eq_id, sc_code))
-                
-                ratios = []
-                for a in audits:
-                    if a['estimated_typ'] > 0:
-                        # Ratio > 1.0 signifie que la machine consomme plus que la théorie
-                        # Ratio < 1.0 signifie qu'elle consomme moins
-                        ratios.append(a['fuel_declared_l'] / a['estimated_typ'])
-
-                if ratios:
-                    # Calcul de la moyenne des ratios
-                    avg_ratio = sum(ratios) / len(ratios)
-                    
-                    # On charge le scénario de base pour avoir le point de départ
-                    base_scenario = DetailedLoadFactorManager.get_scenario(sc_code)
-                    if base_scenario:
-                        base_load = base_scenario.load_typ
-                        
-                        # APPRENTISSAGE : Nouvelle Charge = Charge Base * Ratio Observé
-                        learned_load = base_load * avg_ratio
-                        
-                        # Bornes de sécurité (pour éviter des dérives absurdes)
-                        learned_load = max(0.05, min(1.0, learned_load))
-                        
-                        # 3. Sauvegarde dans la base de connaissances
-                        timestamp = datetime.now().isoformat()
-                        
-                        db.execute_write("""
-                        INSERT OR REPLACE INTO equipment_load_overrides 
-                        (equipment_id, scenario_code, load_min, load_typ, load_max, learned_from_n_samples, confidence_score, last_updated, is_active)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1)
-                        """, (eq_id, sc_code, learned_load*0.8, learned_load, learned_load*1.2, n, 0.9, timestamp))
-                        
-                        stats['successful'] += 1
+                # Bornes de sécurité (pour éviter des dérives absurdes)
+                learned_load = max(0.05, min(1.0, base_scenario.load_typ * avg_ratio))
+                rows.append((cand['equipment_id'], cand['scenario_code'], learned_load*0.8, learned_load, learned_load*1.2, cand['n_samples'], 0.9, timestamp, cand['ratio_sum'], cand['ratio_count']))
+            t_compute = time.perf_counter()
+            
+            # 3. Sauvegarde dans la base de connaissances (1 transaction)
+            if rows:
+                db.execute_many("""
+                INSERT OR REPLACE INTO equipment_load_overrides 
+                (equipment_id, scenario_code, load_min, load_typ, load_max, learned_from_n_samples, confidence_score, last_updated, is_active, ratio_sum, ratio_count)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1, ?, ?)
+                """, rows)
+                db.cache.bump('overrides')
+            t_write = time.perf_counter()
+            
+            stats['successful'] = len(rows)
+            stats['pairs_scanned'] = len(candidates)
+            stats['query_s'] = t_query - t_start
+            stats['compute_s'] = t_compute - t_query
+            stats['write_s'] = t_write - t_compute
                         
         except Exception as e:
             logger.error(f"Erreur Learning Batch: {e}")
             stats['failed'] += 1
-            
-        return stats
\ No newline at end of file
+        
+        stats['total_s'] = time.perf_counter() - t_start
+        return stats
+
+# =============================================================================
+# 5. STATISTIQUES GLISSANTES PAR ÉQUIPEMENT (BASELINE Z-SCORE)
+# =============================================================================
+
+class RollingStatsStore:
+    """
+    Cache process des fenêtres d'écarts par engin, persisté dans equipment_rolling_stats.
+    Mise à jour O(1) à chaque audit enregistré (Welford avec retrait du plus ancien) :
+    l'écran d'audit n'a plus à relire l'historique ni à recalculer moyenne/écart-type.
+    """
+    
+    WINDOW = 20         # Identique à la fenêtre historique de render_audit_page
+    RESYNC_EVERY = 64   # Recalcul exact périodique (dérive flottante de Welford)
+    # Écritures des autres processus (import CLI, ré-audit, travaux) : relues au plus tard après REFRESH_INTERVAL_S.
+    # La marge couvre les lignes horodatées avant notre dernier passage mais validées après.
+    REFRESH_INTERVAL_S = 5.0
+    COMMIT_MARGIN_S = 60.0
+    EPOCH_KEY = "ROLLING_STATS_EPOCH"   # Changé par reset() : toutes les fenêtres en mémoire sont périmées
+    STATS_LOOKUP = hot_query("rolling_stats_lookup", "SELECT window, mean, m2, last_updated FROM equipment_rolling_stats WHERE equipment_id = ?", ("EQ",))
+    STATS_CHANGED = hot_query("rolling_stats_changed", "SELECT equipment_id, last_updated FROM equipment_rolling_stats WHERE last_updated > ?", ("2025-01-01",))
+    
+    def __init__(self, db, window: int = WINDOW):
+        self.db = db
+        self.window = window
+        self._stats: Dict[str, RollingWindowStats] = {}
+        self._stamps: Dict[str, str] = {}   # last_updated de la ligne dont provient chaque fenêtre en mémoire
+        self._lock = threading.Lock()
+        self._epoch = self._read_epoch()
+        self._synced_at = time.monotonic()
+        self._synced_since = self._since()
+    
+    def get(self, equipment_id) -> RollingWindowStats:
+        with self._lock:
+            self._refresh()
+            return self._get_locked(equipment_id)
+    
+    def push(self, equipment_id, deviation_pct) -> RollingWindowStats:
+        """Intègre l'écart d'un audit enregistré et persiste la fenêtre"""
+        with self._lock:
+            self._refresh()
+            stats = self._get_locked(equipment_id)
+            self._welford_push(stats, float(deviation_pct))
+            self._persist(stats)
+            return stats
+    
+    def push_many(self, deviations_by_equipment: Dict[str, List[float]]):
+        """Écarts de plusieurs engins (ordre chronologique par engin), persistés en une seule transaction"""
+        with self._lock:
+            self._refresh()
+            updated = []
+            for equipment_id, deviations in deviations_by_equipment.items():
+                stats = self._get_locked(equipment_id)
+                for x in deviations: self._welford_push(stats, float(x))
+                updated.append(stats)
+            now = datetime.now().isoformat()
+            self.db.execute_many(
+                "INSERT OR REPLACE INTO equipment_rolling_stats (equipment_id, window, mean, m2, last_updated) VALUES (?, ?, ?, ?, ?)",
+                [(s.equipment_id, json.dumps(list(s.window)), s.mean, s.m2, now) for s in updated]
+            )
+            for s in updated: self._stamps[s.equipment_id] = now
+    
+    def reset(self):
+        """À appeler après un recalcul massif des écarts (ré-audit) : invalide aussi les caches des autres processus"""
+        with self._lock:
+            self._stats.clear(); self._stamps.clear()
+            self._epoch = datetime.now().isoformat()
+            with self.db.write_transaction("rolling_stats_reset") as conn:
+                conn.execute("DELETE FROM equipment_rolling_stats")
+                conn.execute("INSERT OR REPLACE INTO app_config (key, value) VALUES (?, ?)", (self.EPOCH_KEY, self._epoch))
+            self.db.cache.bump('config')
+    
+    def _read_epoch(self):
+        rows = self.db.execute_read(CONFIG_VALUE, (self.EPOCH_KEY,))
+        return rows[0]['value'] if rows else None
+    
+    def _since(self):
+        return datetime.fromtimestamp(time.time() - self.COMMIT_MARGIN_S).isoformat()
+    
+    def _refresh(self):
+        """Écarte les fenêtres réécrites (ou effacées) par un autre processus : rechargées à la prochaine lecture"""
+        now = time.monotonic()
+        if now - self._synced_at < self.REFRESH_INTERVAL_S: return
+        self._synced_at = now
+        since, self._synced_since = self._synced_since, self._since()
+        epoch = self._read_epoch()
+        if epoch != self._epoch:
+            self._epoch = epoch
+            self._stats.clear(); self._stamps.clear()
+            return
+        for r in self.db.execute_read(self.STATS_CHANGED, (since,)):
+            if self._stamps.get(r['equipment_id']) != r['last_updated']:
+                self._stats.pop(r['equipment_id'], None)
+    
+    def _get_locked(self, equipment_id) -> RollingWindowStats:
+        stats = self._stats.get(equipment_id)
+        if stats is None:
+            stats = self._load(equipment_id)
+            self._stats[equipment_id] = stats
+        return stats
+    
+    def _load(self, equipment_id) -> RollingWindowStats:
+        rows = self.db.execute_read(self.STATS_LOOKUP, (equipment_id,))
+        if rows:
+            r = rows[0]
+            self._stamps[equipment_id] = r['last_updated']
+            return RollingWindowStats(equipment_id, deque(json.loads(r['window']), maxlen=self.window), r['mean'], r['m2'])
+        # Première utilisation : amorçage depuis les audits (archives seulement si la base chaude ne suffit pas)
+        h_rows = AuditArchive(self.db).latest(BY_EQUIPMENT, (equipment_id,), self.window, "deviation_pct")
+        values = [r['deviation_pct'] for r in reversed(h_rows) if r['deviation_pct'] is not None]
+        stats = RollingWindowStats(equipment_id, deque(values, maxlen=self.window))
+        self._resync(stats)
+        self._persist(stats)
+        return stats
+    
+    def _persist(self, stats: RollingWindowStats):
+        now = datetime.now().isoformat()
+        self.db.execute_write(
+            "INSERT OR REPLACE INTO equipment_rolling_stats (equipment_id, window, mean, m2, last_updated) VALUES (?, ?, ?, ?, ?)",
+            (stats.equipment_id, json.dumps(list(stats.window)), stats.mean, stats.m2, now)
+        )
+        self._stamps[stats.equipment_id] = now
+    
+    @staticmethod
+    def _resync(stats: RollingWindowStats):
+        values = list(stats.window)
+        stats.mean = float(np.mean(values)) if values else 0.0
+        stats.m2 = float(np.sum((np.asarray(values) - stats.mean) ** 2)) if values else 0.0
+        stats.updates_since_resync = 0
+    
+    def _welford_push(self, stats: RollingWindowStats, x: float):
+        n = len(stats.window)
+        if n < self.window:
+            stats.window.append(x)
+            delta = x - stats.mean
+            stats.mean += delta / (n + 1)
+            stats.m2 += delta * (x - stats.mean)
+        else:
+            # Fenêtre pleine : x remplace le plus ancien y (taille constante n)
+            y = stats.window[0]
+            stats.window.append(x)
+            old_mean = stats.mean
+            stats.mean = old_mean + (x - y) / n
+            stats.m2 += (x - y) * (x - stats.mean + y - old_mean)
+        stats.updates_since_resync += 1
+        if stats.updates_since_resync >= self.RESYNC_EVERY or stats.m2 < 0:
+            self._resync(stats)
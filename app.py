@@ -5,18 +5,32 @@
 import streamlit as st
 import os
 import time
-import bcrypt  # <--- INDISPENSABLE POUR LA SÉCURITÉ
-from datetime import datetime
+import sqlite3
+from datetime import datetime, date, timedelta
 import uuid
 import urllib.parse
+import io
 
 # Imports des modules techniques
 # Assurez-vous que les fichiers database.py, security.py, etc. sont bien présents
-from database import ThreadSafeDatabase
+from database import ThreadSafeDatabase, USER_PROFILE, USER_ROLE, GRID_EQUIPMENT, GRID_JOBS, GRID_TX_HISTORY, GRID_TX_PENDING, GRID_USERS
 from security import EnhancedSecurityManager
+from passwords import PasswordHasher, HasherBusyError
 from physics import IsoWillansModel, ReferenceEngineLibrary, AtmosphericParams
-from analytics import DetailedLoadFactorManager, IntelligentAnomalyDetector, AdaptiveLearningEngine
+from analytics import DetailedLoadFactorManager, IntelligentAnomalyDetector, AdaptiveLearningEngine, RollingStatsStore
 from reports import PDFReportGenerator
+from reaudit import BulkReauditEngine
+from report_service import ReportService
+from pdf_cache import PDFCache
+from shared_cache import SharedCache
+from exports import EXPORT_FORMATS, parquet_available
+from backups import BackupManager, BackupScheduler
+from archive import AuditArchive, ArchiveScheduler, BY_EQUIPMENT, BY_USER
+from ingest import BulkAuditImporter, write_errors
+from aggregates import FleetAggregates
+from drift import DriftStore
+from jobs import JOB_STATUSES, JOB_TYPES, JobScheduler
+from metrics import METRICS, MetricsExporter
 
 st.set_page_config(
     page_title="GEN-CONTROL V1.1", 
@@ -77,9 +91,100 @@ st.markdown("""
 @st.cache_resource
 def get_db(): return ThreadSafeDatabase.get_instance()
 
+@st.cache_resource
+def get_rolling_stats(): return RollingStatsStore(get_db())
+
+@st.cache_resource
+def get_drift_store(): return DriftStore(get_db())
+
+@st.cache_resource
+def get_report_service(): return ReportService.get_instance()
+
+@st.cache_resource
+def get_pdf_cache():
+    try: max_mb = int(get_db().get_config_value("PDF_CACHE_MAX_MB", str(PDFCache.DEFAULT_MAX_MB)))
+    except (TypeError, ValueError): max_mb = PDFCache.DEFAULT_MAX_MB
+    return PDFCache.get_instance(max_bytes=max_mb * 1024 * 1024)
+
+@st.cache_resource
+def get_backup_scheduler():
+    """Gestionnaire de sauvegardes + planification automatique (un seul par processus)"""
+    db = get_db()
+    try: keep, interval = int(db.get_config_value("BACKUP_KEEP", "7")), float(db.get_config_value("BACKUP_INTERVAL_H", "24"))
+    except (TypeError, ValueError): keep, interval = 7, 24.0
+    return BackupScheduler(BackupManager(db, keep=keep), interval_h=interval).start()
+
+@st.cache_resource
+def get_archive_scheduler(): return ArchiveScheduler(AuditArchive(get_db())).start()
+
+@st.cache_resource
+def get_job_scheduler():
+    """Travaux de fond du processus ; les services partagés gardent les caches en mémoire cohérents"""
+    services = {'rolling_stats': get_rolling_stats(), 'drift': get_drift_store(), 'pdf_cache': get_pdf_cache(),
+                'backups': get_backup_scheduler().manager, 'archive': get_archive_scheduler().archive}
+    return JobScheduler(get_db(), services=services).start()
+
+@st.cache_resource
+def get_metrics_exporter():
+    """Exposition Prometheus : http://127.0.0.1:METRICS_PORT/metrics et/ou fichier METRICS_FILE (0 / vide = off)"""
+    db = get_db()
+    try: port = int(db.get_config_value("METRICS_PORT", "0"))
+    except (TypeError, ValueError): port = 0
+    return MetricsExporter(port=port, path=db.get_config_value("METRICS_FILE", "") or None).start()
+
+def render_job(job, key):
+    """Suivi d'un travail de fond : progression + annulation, ou issue + fichier produit"""
+    if job is None: return
+    label = JOB_TYPES[job['job_type']].label if job['job_type'] in JOB_TYPES else job['job_type']
+    if job['status'] in ('QUEUED', 'RUNNING'):
+        done, total = job['progress_done'] or 0, job['progress_total']
+        text = f"{label} : {'en file' if job['status'] == 'QUEUED' else 'en cours'}" + (f" ({done}/{total})" if total else "") + (f" - {job['message']}" if job['message'] else "")
+        st.progress(min(1.0, done / total) if total else 0.0, text=text)
+        c1, c2 = st.columns(2)
+        if c1.button("🔄 Actualiser", key=f"{key}_refresh"): st.rerun()
+        if c2.button("⏹️ Annuler", key=f"{key}_cancel"): get_job_scheduler().cancel(job['job_id']); st.rerun()
+    elif job['status'] == 'DONE':
+        st.success(f"{label} : terminé le {job['finished_at'][:19].replace('T', ' à ')}")
+        path = job['result'].get('path')
+        if path and os.path.exists(path):
+            with open(path, "rb") as f: st.download_button("⬇️ Télécharger", f, job['result']['file_name'], key=f"{key}_dl")
+    elif job['status'] == 'FAILED': st.error(f"{label} : échec ({job['error']})")
+    else: st.warning(f"{label} : annulé ({(job['finished_at'] or '')[:19]})")
+
+# --- GRILLES PAGINÉES (pagination par clé : coût d'une page, pas de la table) ---
+PAGE_SIZE = 25
+
+def fetch_page(key, grid, where="", params=()):
+    """Page courante de la grille `key` (GRID_* de database.py) ; la pile de curseurs repart de zéro si les filtres changent"""
+    table, order_by, columns, descending = grid
+    signature = (table, order_by, where, tuple(params), descending)
+    state = st.session_state.get(f"pager_{key}")
+    if state is None or state['sig'] != signature:
+        state = st.session_state[f"pager_{key}"] = {'sig': signature, 'cursors': [None]}
+    rows, next_cursor = st.session_state.db.paginate(table, order_by, columns, where, params, state['cursors'][-1], PAGE_SIZE, descending)
+    return rows, next_cursor
+
+def render_pager(key, next_cursor):
+    cursors = st.session_state[f"pager_{key}"]['cursors']
+    c1, c2, c3 = st.columns([1, 2, 1])
+    if c1.button("◀ Précédent", key=f"prev_{key}", disabled=len(cursors) == 1):
+        cursors.pop(); st.rerun()
+    c2.caption(f"Page {len(cursors)}")
+    if c3.button("Suivant ▶", key=f"next_{key}", disabled=next_cursor is None):
+        cursors.append(next_cursor); st.rerun()
+
+def prefix_filter(column, prefix):
+    """Recherche « commence par » compatible avec les index (intervalle au lieu de LIKE)"""
+    return f"{column} >= ? AND {column} < ?", (prefix, prefix + "\uffff")
+
 def init_session():
     if 'db' not in st.session_state: 
         st.session_state.db = get_db()
+        get_metrics_exporter()  # Métriques exposées dès le démarrage, pas seulement après une visite Admin
+    if 'rolling_stats' not in st.session_state: 
+        st.session_state.rolling_stats = get_rolling_stats()
+    if 'drift' not in st.session_state: 
+        st.session_state.drift = get_drift_store()
     if 'security' not in st.session_state: 
         st.session_state.security = EnhancedSecurityManager(st.session_state.db)
     if 'analytics' not in st.session_state: 
@@ -105,14 +210,16 @@ def render_sidebar():
         opts.append("👤 Mon Profil") # <--- NOUVEAU
         opts.append("💎 Offres & Licences")
         
-        if tier in ['PRO', 'CORPORATE']: opts.append("🧠 Intelligence")
-        if st.session_state.get('role') == 'admin': opts.append("🔐 Admin")
+        if tier in ['PRO', 'CORPORATE']: opts.extend(["📥 Import en Masse", "🧠 Intelligence"])
+        # Agrégats de toute la flotte (tous clients confondus) : réservé aux administrateurs
+        if st.session_state.get('role') == 'admin': opts.extend(["📊 Tableau de Bord Flotte", "🔐 Admin"])
         
         menu = st.radio("Navigation", opts)
         
         st.markdown("---")
         
         if st.button("Déconnexion", type="primary", use_container_width=True):
+            st.session_state.security.logout(st.session_state.get('auth_token'))
             st.session_state.clear()
             st.rerun()
 
@@ -149,9 +256,7 @@ def render_auth():
                     if success:
                         st.session_state['auth_token'] = sec.create_session_token(username, ip)
                         st.session_state['user'] = username
-                        u_data = st.session_state.db.execute_read(
-                            "SELECT role, license_tier FROM users WHERE username = ?", (username,)
-                        )
+                        u_data = st.session_state.db.execute_read(USER_ROLE, (username,))
                         st.session_state['role'] = u_data[0]['role'] if u_data else 'user'
                         st.session_state['license_tier'] = u_data[0]['license_tier'] if u_data else 'DISCOVERY'
                         st.rerun()
@@ -343,7 +448,7 @@ def render_audit_page():
     except: aging_val = 1.05
 
     try:
-        equipments = db.execute_read("SELECT equipment_id, equipment_name, profile_base, power_kw FROM equipment")
+        equipments = db.list_equipment()
         if not equipments: 
             st.warning("⚠️ Aucun équipement. Allez dans 'Calibration'."); return
             
@@ -351,9 +456,7 @@ def render_audit_page():
         selected_id = st.selectbox("Sélectionner l'engin", list(eq_options.keys()), format_func=lambda x: eq_options[x])
         eq_data = next(e for e in equipments if e['equipment_id'] == selected_id)
         
-        last_audit = db.execute_read(
-            "SELECT index_end FROM audits WHERE equipment_id = ? ORDER BY timestamp DESC LIMIT 1", (selected_id,)
-        )
+        last_audit = AuditArchive(db).latest(BY_EQUIPMENT, (selected_id,), 1, "index_end")
         suggested_start = float(last_audit[0]['index_end']) if last_audit else 0.0
     except: return
 
@@ -383,7 +486,7 @@ def render_audit_page():
 
     blocked = False
     if tier == 'DISCOVERY':
-        c = db.execute_read("SELECT COUNT(*) as c FROM audits WHERE created_by = ?", (st.session_state['user'],))[0]['c']
+        c = AuditArchive(db).count_by_user(st.session_state['user'])
         if c >= 3: blocked = True; st.error("🛑 LIMITE 3 AUDITS. Passez PRO.")
 
     if st.button("LANCER L'AUDIT", type="primary", disabled=blocked):
@@ -401,16 +504,17 @@ def render_audit_page():
                 est_fuel = pred['consumption_corrected_l_h'] * hours
                 dev = ((fuel_l - est_fuel) / est_fuel) * 100 if est_fuel > 0 else 0
                 
-                h_rows = db.execute_read("SELECT deviation_pct FROM audits WHERE equipment_id = ? ORDER BY timestamp DESC LIMIT 20", (selected_id,))
-                h_data = [r['deviation_pct'] for r in h_rows] if h_rows else []
-                anom = st.session_state.detector.detect_anomaly(selected_id, dev, h_data, scenario_code)
+                baseline = st.session_state.rolling_stats.get(selected_id)
+                drift = st.session_state.drift.preview(selected_id, dev)
+                anom = st.session_state.detector.detect_anomaly(selected_id, dev, scenario_code=scenario_code, baseline=baseline, drift=drift)
                 
                 st.session_state['last_audit'] = {
                     'eq_id': selected_id, 'eq_name': eq_data['equipment_name'], 
                     'scenario': scenario_code, 'start': start_h, 'end': end_h, 
                     'fuel': fuel_l, 'est': est_fuel, 'dev': dev, 
                     'z': anom.z_score, 'verdict': anom.verdict, 
-                    'conf': anom.confidence, 'hours': hours, 'src': src
+                    'conf': anom.confidence, 'hours': hours, 'src': src,
+                    'drift': drift.alarm, 'recs': anom.recommendations
                 }
 
     if 'last_audit' in st.session_state:
@@ -424,6 +528,9 @@ def render_audit_page():
         m1.metric("Déclaré", f"{audit['fuel']:.1f} L")
         m2.metric("Théorique", f"{audit['est']:.1f} L")
         m3.metric("Écart", f"{audit['dev']:+.1f} %", delta_color="inverse")
+        if audit.get('drift') == 'DRIFT_UP': st.warning("📈 Dérive lente détectée : surconsommation persistante sur les derniers audits (CUSUM / EWMA).")
+        elif audit.get('drift') == 'DRIFT_DOWN': st.info("📉 Sous-consommation persistante (CUSUM / EWMA).")
+        for rec in audit.get('recs', []): st.caption(f"• {rec}")
         
         st.markdown("### 💾 Sauvegarde")
         legal_check = st.checkbox("Je certifie l'exactitude des relevés terrain.")
@@ -438,15 +545,19 @@ def render_audit_page():
                         """INSERT INTO audits (audit_uuid, timestamp, created_by, equipment_id, materiel_type, materiel_name, scenario_code, index_start, index_end, power_kw, fuel_declared_l, estimated_min, estimated_typ, estimated_max, uncertainty_pct, deviation_pct, z_score, verdict, confidence_pct, validated_by_operator) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", 
                         (uid, datetime.now().isoformat(), st.session_state['user'], audit['eq_id'], eq_data['profile_base'], audit['eq_name'], audit['scenario'], audit['start'], audit['end'], eq_data['power_kw'], audit['fuel'], audit['est']*0.9, audit['est'], audit['est']*1.1, 10.0, audit['dev'], audit['z'], audit['verdict'], int(audit['conf']*100), 1)
                     )
+                    st.session_state.learning.learn_from_audit(db, audit['eq_id'], audit['scenario'], audit['fuel'], audit['est'], audit['verdict'])
+                    st.session_state.rolling_stats.push(audit['eq_id'], audit['dev'])
+                    st.session_state.drift.push(audit['eq_id'], audit['dev'])
                     st.success("Enregistré !")
-                    pdf = st.session_state.pdf_gen.generate_audit_report({
+                    # Rendu PDF en arrière-plan : la confirmation ne bloque plus
+                    st.session_state.pop('current_pdf', None)
+                    st.session_state['pending_pdf'] = get_report_service().submit({
                         'audit_uuid': uid, 'equipment_name': audit['eq_name'], 
                         'user': st.session_state['user'], 'fuel_declared': audit['fuel'], 
                         'fuel_estimated': audit['est'], 'deviation': audit['dev'], 
                         'verdict': audit['verdict'], 'scenario': audit['scenario'], 
-                        'hours': audit['hours']}, license_tier=tier
+                        'hours': audit['hours']}, license_tier=tier, cache=get_pdf_cache()
                     )
-                    st.session_state['current_pdf'] = pdf.getvalue()
                     st.session_state['current_pdf_name'] = f"AUDIT_{uid[:8]}.pdf"
                     st.rerun()
                     
@@ -455,6 +566,16 @@ def render_audit_page():
             link = f'<a href="https://wa.me/?text={urllib.parse.quote(msg_wa)}" target="_blank" class="share-btn">📲 WhatsApp</a>'
             st.markdown(link, unsafe_allow_html=True)
             
+        pending = st.session_state.get('pending_pdf')
+        if pending is not None:
+            if pending.done():
+                st.session_state.pop('pending_pdf')
+                try: st.session_state['current_pdf'] = pending.result()
+                except Exception as e: st.error(f"Erreur génération PDF : {e}")
+            else:
+                st.info("⏳ Rapport PDF en cours de génération...")
+                if st.button("🔄 Actualiser"): st.rerun()
+
         if 'current_pdf' in st.session_state:
             st.download_button("📄 PDF RAPPORT", st.session_state['current_pdf'], st.session_state['current_pdf_name'], "application/pdf", type="primary")
 
@@ -503,10 +624,7 @@ def render_calibration_page():
             elif type_eq == "Camion / Tracteur": final_kw = user_pwr / 1.36
             else: final_kw = user_pwr
             try:
-                st.session_state.db.execute_write(
-                    "INSERT INTO equipment (equipment_id, equipment_name, profile_base, power_kw) VALUES (?, ?, ?, ?)", 
-                    (eid, name, code, final_kw)
-                )
+                st.session_state.db.add_equipment(eid, name, code, final_kw)
                 st.success(f"✅ {name} Calibré"); time.sleep(1); st.rerun()
             except: 
                 st.error("ID existant.")
@@ -514,18 +632,128 @@ def render_calibration_page():
             st.warning("ID et Nom requis.")
 
     st.markdown("### 📋 Parc Calibré")
-    rows = st.session_state.db.execute_read("SELECT equipment_id, equipment_name, profile_base, power_kw FROM equipment ORDER BY created_at DESC")
+    f1, f2 = st.columns(2)
+    search = f1.text_input("Immatriculation commençant par", key="eq_search").strip()
+    profile = f2.selectbox("Profil", ["Tous", *ReferenceEngineLibrary.ENGINE_DB], key="eq_profile")
+    clauses, params = [], []
+    if search:
+        clause, p = prefix_filter("equipment_id", search); clauses.append(clause); params.extend(p)
+    if profile != "Tous": clauses.append("profile_base = ?"); params.append(profile)
+    rows, next_cursor = fetch_page("equipment", GRID_EQUIPMENT, " AND ".join(clauses), params)
     if rows: st.dataframe(rows, use_container_width=True)
+    else: st.info("Aucun équipement.")
+    render_pager("equipment", next_cursor)
 
 def render_learning_page():
     st.markdown('<div class="main-header">🧠 Intelligence</div>', unsafe_allow_html=True)
     if st.session_state.get('license_tier') == 'CORPORATE':
-        if st.button("Lancer Apprentissage"): 
-            st.session_state.learning.batch_learn_from_all_equipment(st.session_state.db)
-            st.success("OK")
+        jobs = get_job_scheduler()
+        job = jobs.latest('learn')
+        if st.button("Lancer Apprentissage", disabled=bool(job and job['status'] in ('QUEUED', 'RUNNING'))):
+            jobs.submit('learn', created_by=st.session_state.get('user')); st.rerun()
+        render_job(job, "learn")
+        if job and job['status'] == 'DONE': st.caption(f"{job['result']['successful']} profils appris en {job['result']['total_s']:.2f} s")
     else: 
         st.warning("Réservé CORPORATE")
 
+    st.markdown("---")
+    st.subheader("📑 Rapport de Flotte")
+    c1, c2 = st.columns(2)
+    d_start = c1.date_input("Du", value=date.today().replace(day=1))
+    d_end = c2.date_input("Au (inclus)", value=date.today())
+    jobs, user = get_job_scheduler(), st.session_state['user']
+    if st.button("Générer le rapport PDF"):
+        jobs.submit('fleet_report', {
+            'since': d_start.isoformat(), 'until': (d_end + timedelta(days=1)).isoformat(),
+            'created_by': None if st.session_state.get('role') == 'admin' else user,
+            'license_tier': st.session_state.get('license_tier', 'DISCOVERY'),
+            'file_name': f"FLOTTE_{d_start:%Y%m%d}_{d_end:%Y%m%d}.pdf",
+        }, created_by=user)
+        st.rerun()
+    job = jobs.latest('fleet_report', created_by=user)
+    render_job(job, "fleet_report")
+    if job and job['status'] == 'DONE':
+        parts = job['result'].get('parts', 1)
+        st.caption(f"{job['result']['pages']} audits inclus" + (f", en {parts} PDF de {PDFReportGenerator.PAGES_PER_PART} pages au plus (archive ZIP)." if parts > 1 else "."))
+
+def render_import_page():
+    st.markdown('<div class="main-header">📥 Import en Masse</div>', unsafe_allow_html=True)
+    st.caption("Exports cartes carburant / compteurs horaires : CSV (séparateur , ou ;) ou JSONL, une ligne par audit, "
+               "dans l'ordre chronologique de chaque engin.")
+    st.markdown("Colonnes : `equipment_id`, `scenario_code`, `index_start`, `index_end`, `fuel_declared_l` ; "
+                "optionnelles : `timestamp`, `load_pct`.")
+    up = st.file_uploader("Fichier d'audits", type=["csv", "jsonl", "ndjson"])
+    if up is not None and st.button("🚀 Importer", type="primary"):
+        fmt = 'csv' if up.name.lower().endswith('.csv') else 'jsonl'
+        importer = BulkAuditImporter(
+            st.session_state.db, st.session_state['user'], detector=st.session_state.detector,
+            learning=st.session_state.learning, rolling_stats=st.session_state.rolling_stats, drift=st.session_state.drift
+        )
+        status = st.empty()
+        with st.spinner("Import en cours..."):
+            report = importer.run(io.TextIOWrapper(up, encoding="utf-8-sig", newline=""), fmt,
+                                  progress_callback=lambda n: status.caption(f"{n} lignes lues..."))
+        st.session_state['import_report'] = report
+    report = st.session_state.get('import_report')
+    if report:
+        m1, m2, m3, m4 = st.columns(4)
+        m1.metric("Lignes lues", report['read'])
+        m2.metric("Audits importés", report['inserted'])
+        m3.metric("Rejetées", report['n_errors'])
+        m4.metric("Trous d'index", report['gaps'])
+        if report['verdicts']: st.write({k: v for k, v in sorted(report['verdicts'].items())})
+        if report['errors']:
+            st.dataframe(report['errors'][:200], use_container_width=True)
+            buf = io.StringIO(); write_errors(report, buf)
+            st.download_button("⬇️ Lignes rejetées (CSV)", buf.getvalue().encode("utf-8"), "import_erreurs.csv", "text/csv")
+
+def render_fleet_dashboard_page():
+    if st.session_state.get('role') != 'admin': return
+    st.markdown('<div class="main-header">📊 Tableau de Bord Flotte</div>', unsafe_allow_html=True)
+    c1, c2 = st.columns(2)
+    d_start = c1.date_input("Du", value=date.today().replace(day=1) - timedelta(days=365), key="dash_start")
+    d_end = c2.date_input("Au (inclus)", value=date.today(), key="dash_end")
+    since, until = d_start, d_end + timedelta(days=1)
+    fleet = FleetAggregates(st.session_state.db)
+
+    k = fleet.kpis(since, until)
+    if not k['n_audits']: st.info("Aucun audit sur la période."); return
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("Audits", f"{k['n_audits']:,}".replace(",", " "), f"{k['n_equipment']} engins", delta_color="off")
+    m2.metric("Déclaré / Théorique", f"{k['fuel_declared_l']:,.0f} L".replace(",", " "), f"{k['deviation_pct']:+.1f} %", delta_color="inverse")
+    m3.metric("Excédent", f"{k['excess_l']:,.0f} L".replace(",", " "))
+    m4.metric("Taux d'anomalie", f"{k['anomaly_rate_pct']:.1f} %", f"{k['suspect_rate_pct']:.1f} % suspects", delta_color="off")
+
+    months = fleet.by_month(since, until)
+    st.subheader("📈 Évolution mensuelle")
+    chart = [{'Mois': m['month'], 'Déclaré (L)': m['fuel_declared_l'], 'Théorique (L)': m['fuel_estimated_l'],
+              'Anomalies (%)': m['anomaly_rate_pct']} for m in months]
+    st.line_chart(chart, x='Mois', y=['Déclaré (L)', 'Théorique (L)'])
+    st.bar_chart(chart, x='Mois', y='Anomalies (%)')
+
+    st.subheader("🚨 Engins les plus excédentaires")
+    names = {e['equipment_id']: e['equipment_name'] for e in st.session_state.db.list_equipment()}
+    st.dataframe([{
+        'Engin': r['equipment_id'], 'Nom': names.get(r['equipment_id'], ''), 'Audits': r['n_audits'],
+        'Heures': round(r['hours'], 1), 'Excédent (L)': round(r['excess_l'], 1), 'Écart (%)': round(r['deviation_pct'], 1),
+        'Anomalies (%)': round(r['anomaly_rate_pct'], 1),
+    } for r in fleet.by_equipment(since, until)], use_container_width=True)
+
+    st.subheader("📉 Dérives en cours")
+    drifts = st.session_state.drift.alarms()
+    if not drifts: st.caption("Aucune dérive lente détectée (CUSUM / EWMA).")
+    else: st.dataframe([{
+        'Engin': d['equipment_id'], 'Nom': names.get(d['equipment_id'], ''),
+        'Sens': "📈 Surconsommation" if d['alarm'] == 'DRIFT_UP' else "📉 Sous-consommation",
+        'Depuis': (d['alarm_since'] or '')[:10], 'EWMA (%)': round(d['ewma'], 1), 'Audits suivis': d['n'],
+    } for d in drifts], use_container_width=True)
+
+    st.subheader("⚙️ Par scénario")
+    st.dataframe([{
+        'Scénario': r['scenario_code'], 'Audits': r['n_audits'], 'Écart (%)': round(r['deviation_pct'], 1),
+        'Anomalies (%)': round(r['anomaly_rate_pct'], 1),
+    } for r in fleet.by_scenario(since, until)], use_container_width=True)
+
 # --- NOUVEAU MODULE : PAGE PROFIL ---
 def render_profile_page():
     st.markdown('<div class="main-header">👤 Mon Profil & Sécurité</div>', unsafe_allow_html=True)
@@ -534,7 +762,7 @@ def render_profile_page():
     if not username: return
 
     db = st.session_state.db
-    user_data = db.execute_read("SELECT * FROM users WHERE username = ?", (username,))
+    user_data = db.execute_read(USER_PROFILE, (username,))
     
     if not user_data:
         st.error("Impossible de charger le profil.")
@@ -567,23 +795,43 @@ def render_profile_page():
             elif len(new_pwd) < 4:
                 st.error("❌ Le mot de passe est trop court.")
             else:
-                stored_hash = user['password_hash']
-                if isinstance(stored_hash, str): stored_hash = stored_hash.encode('utf-8')
+                hasher = PasswordHasher.get_instance()
+                try: pwd_ok = hasher.check_password(current_pwd, user['password_hash'])
+                except HasherBusyError as e: st.error(str(e)); return
                 
-                if bcrypt.checkpw(current_pwd.encode('utf-8'), stored_hash):
-                    new_salt = bcrypt.gensalt()
-                    new_hash = bcrypt.hashpw(new_pwd.encode('utf-8'), new_salt)
+                if pwd_ok:
                     try:
+                        new_hash = hasher.hash_password(new_pwd)
                         db.execute_write("UPDATE users SET password_hash = ? WHERE username = ?", (new_hash, username))
+                        st.session_state.security.revoke_user_sessions(username)
                         st.success("✅ Mot de passe modifié ! Déconnexion..."); time.sleep(2)
                         st.session_state.clear(); st.rerun()
                     except Exception as e: st.error(f"Erreur technique : {str(e)}")
                 else: st.error("❌ L'ancien mot de passe est incorrect.")
 
+    st.markdown("---")
+    st.subheader("📄 Mes rapports d'audit")
+    recent = AuditArchive(db).latest(BY_USER, (username,), 20)
+    if not recent: st.info("Aucun audit enregistré.")
+    else:
+        tier = st.session_state.get('license_tier', 'DISCOVERY')
+        by_uuid = {r['audit_uuid']: r for r in recent}
+        choice = st.selectbox(
+            "Audit", list(by_uuid),
+            format_func=lambda u: f"{by_uuid[u]['timestamp'][:16]} | {by_uuid[u]['materiel_name']} | {by_uuid[u]['verdict']}"
+        )
+        # Servi depuis le cache disque ; rendu (puis mis en cache) seulement s'il est absent
+        cache = get_pdf_cache()
+        pdf = cache.get(choice, tier)
+        if pdf is None:
+            with st.spinner("Génération du rapport..."):
+                pdf = get_report_service().submit(PDFReportGenerator.audit_row_to_report_data(by_uuid[choice]), tier, cache=cache).result()
+        st.download_button("📄 Télécharger", pdf, f"AUDIT_{choice[:8]}.pdf", "application/pdf")
+
 def render_admin_page():
     if st.session_state.get('role') != 'admin': return
     st.markdown('<div class="main-header">🔐 Admin QG</div>', unsafe_allow_html=True)
-    t1, t2, t3, t4 = st.tabs(["⚙️ Config", "💰 Paiements", "👥 Utilisateurs", "💾 Maintenance"])
+    t1, t2, t3, t4, t5, t6 = st.tabs(["⚙️ Config", "💰 Paiements", "👥 Utilisateurs", "💾 Maintenance", "⏱️ Travaux", "📈 Performance"])
     
     with t1:
         st.subheader("Paramètres Globaux")
@@ -595,9 +843,83 @@ def render_admin_page():
             st.session_state.db.set_config_value("AGING_FACTOR", new_aging)
             st.success("Mis à jour !"); time.sleep(1); st.rerun()
 
+        with st.expander("🔑 Sécurité (Bcrypt)"):
+            hasher = PasswordHasher.get_instance()
+            hm = hasher.metrics()
+            k1, k2, k3, k4 = st.columns(4)
+            k1.metric("File d'attente", hm['queue_depth'])
+            k2.metric("En cours", f"{hm['running']}/{hm['workers']}")
+            k3.metric("Latence p99", f"{hm['p99_ms']:.0f} ms")
+            k4.metric("Refusés", hm['rejected'])
+            new_cost = st.slider("Coût bcrypt (rounds)", 10, 14, min(14, max(10, int(hasher.rounds))), help="Les mots de passe existants sont re-hachés à la prochaine connexion.")
+            if st.button("💾 Appliquer le coût"):
+                st.session_state.db.set_config_value("BCRYPT_COST", new_cost)
+                hasher.configure(rounds=new_cost)
+                st.success("Coût mis à jour !"); time.sleep(1); st.rerun()
+
+        with st.expander("⚡ Cache Partagé (Config & Référentiels)"):
+            cache_stats = {**SharedCache.get_instance().stats(), **st.session_state.db.cache.stats()}
+            st.dataframe(
+                [{'Espace': ns, 'Version': v['version'], 'Entrées': v['entries'], 'Succès': v['hits'], 'Échecs': v['misses'],
+                  'Taux': f"{v['hits'] / (v['hits'] + v['misses']):.0%}" if v['hits'] + v['misses'] else "-"}
+                 for ns, v in cache_stats.items()],
+                use_container_width=True
+            )
+            if st.button("🗑️ Invalider le cache partagé"):
+                st.session_state.db.cache.clear(); st.rerun()
+
+        with st.expander("📄 Cache des Rapports PDF"):
+            cache = get_pdf_cache()
+            cs = cache.stats()
+            k1, k2, k3, k4 = st.columns(4)
+            k1.metric("Rapports", cs['entries'])
+            k2.metric("Taille", f"{cs['size_mb']:.1f}/{cs['max_mb']:.0f} Mo")
+            k3.metric("Succès / Échecs", f"{cs['hits']} / {cs['misses']}")
+            k4.metric("Évictions", cs['evictions'])
+            new_max = st.number_input("Taille max (Mo)", min_value=16, step=64, value=int(cs['max_mb']))
+            b1, b2 = st.columns(2)
+            if b1.button("💾 Appliquer la taille"):
+                st.session_state.db.set_config_value("PDF_CACHE_MAX_MB", new_max)
+                cache.max_bytes = int(new_max) * 1024 * 1024
+                st.success("Taille mise à jour !"); time.sleep(1); st.rerun()
+            if b2.button("🗑️ Vider le cache"):
+                cache.clear(); st.rerun()
+
+        st.markdown("---")
+        st.subheader("♻️ Ré-audit de la Flotte")
+        st.caption("Recalcule estimations, écarts et verdicts de tous les audits avec le facteur et les profils appris actuels.")
+        jobs, admin = get_job_scheduler(), st.session_state.get('user')
+        job = jobs.latest('reaudit')
+        render_job(job, "reaudit")
+        if not (job and job['status'] in ('QUEUED', 'RUNNING')):
+            if job and job['status'] == 'DONE':
+                st.caption(f"{job['result']['processed_rows']} audits recalculés, {job['result']['changed_verdicts']} verdicts modifiés, {job['result']['drift_alarms']} dérives.")
+            unfinished = BulkReauditEngine(st.session_state.db).list_unfinished_runs()
+            if unfinished:
+                run = unfinished[0]
+                st.warning(f"Ré-audit interrompu ({run['run_id']}) : {run['processed_rows']}/{run['total_rows']} audits traités.")
+                if st.button("▶️ Reprendre le ré-audit"): jobs.submit('reaudit', {'run_id': run['run_id']}, admin); st.rerun()
+            if st.button("♻️ Lancer un ré-audit complet"): jobs.submit('reaudit', created_by=admin); st.rerun()
+
+        with st.expander("🗄️ Réglages Base de Données (SQLite)"):
+            db = st.session_state.db
+            st.caption(f"Journal : {db.journal_mode} | Pool lecteurs : {db.pool_size}")
+            d1, d2 = st.columns(2)
+            sync_modes = list(db.SYNCHRONOUS_MODES)
+            cur_sync = db.get_config_value("DB_SYNCHRONOUS", "NORMAL")
+            new_sync = d1.selectbox("synchronous", sync_modes, index=sync_modes.index(cur_sync) if cur_sync in sync_modes else 1)
+            new_busy = d2.number_input("busy_timeout (ms)", min_value=0, step=500, value=int(db.get_config_value("DB_BUSY_TIMEOUT_MS", "5000")))
+            new_cache = d1.number_input("cache_size (<0 = KiB)", step=1000, value=int(db.get_config_value("DB_CACHE_SIZE", "-20000")))
+            new_mmap = d2.number_input("mmap_size (octets)", min_value=0, step=16777216, value=int(db.get_config_value("DB_MMAP_SIZE", "268435456")))
+            if st.button("💾 Appliquer les pragmas"):
+                for key, val in [("DB_SYNCHRONOUS", new_sync), ("DB_BUSY_TIMEOUT_MS", new_busy), ("DB_CACHE_SIZE", new_cache), ("DB_MMAP_SIZE", new_mmap)]:
+                    db.set_config_value(key, val)
+                db.reload_pragmas()
+                st.success("Pragmas appliqués !"); time.sleep(1); st.rerun()
+
     with t2:
         st.subheader("1. En Attente")
-        pendings = st.session_state.db.execute_read("SELECT * FROM transactions WHERE status = 'PENDING'")
+        pendings, next_pending = fetch_page("tx_pending", GRID_TX_PENDING, "status = 'PENDING'")
         if not pendings: st.info("Aucun paiement en attente.")
         for p in pendings:
             c1, c2, c3 = st.columns([2,1,1])
@@ -610,24 +932,243 @@ def render_admin_page():
             if c3.button("❌", key=f"x_{p['tx_ref']}"):
                 st.session_state.db.reject_transaction(p['tx_ref'])
                 st.rerun()
+        render_pager("tx_pending", next_pending)
             
         st.markdown("---")
         st.subheader("2. Historique")
-        history = st.session_state.db.execute_read("SELECT * FROM transactions WHERE status != 'PENDING' ORDER BY timestamp DESC LIMIT 50")
+        h1, h2 = st.columns(2)
+        tx_status = h1.selectbox("Statut", ["Tous", "APPROVED", "REJECTED"], key="tx_status")
+        tx_user = h2.text_input("Utilisateur", key="tx_user").strip()
+        clauses, params = ["status != 'PENDING'" if tx_status == "Tous" else "status = ?"], ([] if tx_status == "Tous" else [tx_status])
+        if tx_user: clauses.append("username = ?"); params.append(tx_user)
+        history, next_history = fetch_page("tx_history", GRID_TX_HISTORY, " AND ".join(clauses), params)
         if history: st.dataframe(history, use_container_width=True)
+        render_pager("tx_history", next_history)
 
     with t3: 
-        st.dataframe(st.session_state.db.execute_read("SELECT * FROM users"), use_container_width=True)
+        u1, u2, u3 = st.columns(3)
+        user_search = u1.text_input("Identifiant commençant par", key="user_search").strip()
+        user_role = u2.selectbox("Rôle", ["Tous", "user", "admin"], key="user_role")
+        user_tier = u3.selectbox("Licence", ["Toutes", "DISCOVERY", "PRO", "CORPORATE"], key="user_tier")
+        clauses, params = [], []
+        if user_search:
+            clause, p = prefix_filter("username", user_search); clauses.append(clause); params.extend(p)
+        if user_role != "Tous": clauses.append("role = ?"); params.append(user_role)
+        if user_tier != "Toutes": clauses.append("license_tier = ?"); params.append(user_tier)
+        # Jamais de hash de mot de passe ni de secret 2FA dans la grille
+        users, next_users = fetch_page("users", GRID_USERS, " AND ".join(clauses), params)
+        st.dataframe(users, use_container_width=True)
+        render_pager("users", next_users)
+        c1, c2 = st.columns([3, 1])
+        target = c1.text_input("Identifiant à déconnecter de toutes ses sessions")
+        if c2.button("🚪 Forcer la déconnexion") and target:
+            st.session_state.security.revoke_user_sessions(target)
+            st.success(f"Sessions de {target} révoquées.")
         
     with t4:
-        db_files = [f for f in os.listdir('.') if f.endswith('.db')]
-        if db_files:
-            with open(db_files[0], "rb") as f: 
-                st.download_button("⬇️ Backup", f, file_name="BACKUP.db")
-        up = st.file_uploader("Restaurer .db")
-        if up and st.button("RESTAURER"):
-            with open("gen_control_v1_1_secure.db", "wb") as f: f.write(up.getbuffer())
-            st.success("Restauré !"); time.sleep(2); st.rerun()
+        st.subheader("📤 Export des Audits")
+        e1, e2, e3 = st.columns(3)
+        exp_eq = e1.text_input("Engin (ID)", key="exp_eq")
+        exp_user = e2.text_input("Opérateur", key="exp_user")
+        exp_verdict = e3.selectbox("Verdict", ["Tous", "NORMAL", "SUSPECT", "ANOMALIE"], key="exp_verdict")
+        e4, e5, e6 = st.columns(3)
+        exp_start = e4.date_input("Du", value=None, key="exp_start")
+        exp_end = e5.date_input("Au (inclus)", value=None, key="exp_end")
+        formats = [f for f in EXPORT_FORMATS if f != 'parquet' or parquet_available()]
+        exp_fmt = e6.selectbox("Format", formats, key="exp_fmt", help=None if parquet_available() else "Parquet : installez pyarrow.")
+        jobs = get_job_scheduler()
+        if st.button("📤 Préparer l'export"):
+            jobs.submit('audit_export', {
+                'fmt': exp_fmt, 'equipment_id': exp_eq.strip() or None, 'created_by': exp_user.strip() or None,
+                'since': exp_start.isoformat() if exp_start else None,
+                'until': (exp_end + timedelta(days=1)).isoformat() if exp_end else None,
+                'verdict': None if exp_verdict == "Tous" else exp_verdict,
+            }, created_by=st.session_state.get('user'))
+            st.rerun()
+        job = jobs.latest('audit_export')
+        render_job(job, "audit_export")
+        if job and job['status'] == 'DONE': st.caption(f"{job['result']['rows']} audits exportés.")
+
+        st.markdown("---")
+        st.subheader("💾 Sauvegardes")
+        scheduler = get_backup_scheduler()
+        backups = scheduler.manager
+        b1, b2 = st.columns(2)
+        new_interval = b1.number_input("Sauvegarde automatique toutes les (h, 0 = off)", min_value=0.0, step=6.0, value=float(scheduler.interval_h))
+        new_keep = b2.number_input("Instantanés automatiques conservés", min_value=1, step=1, value=int(backups.keep))
+        if st.button("💾 Appliquer la planification"):
+            st.session_state.db.set_config_value("BACKUP_INTERVAL_H", new_interval)
+            st.session_state.db.set_config_value("BACKUP_KEEP", new_keep)
+            scheduler.interval_h, backups.keep = new_interval, int(new_keep)
+            st.success("Planification mise à jour !"); time.sleep(1); st.rerun()
+        if scheduler.last_error: st.error(f"Dernière sauvegarde automatique en échec : {scheduler.last_error}")
+
+        if st.button("📸 Sauvegarder maintenant"):
+            jobs.submit('backup', created_by=st.session_state.get('user')); st.rerun()
+        job = jobs.latest('backup')
+        render_job(job, "backup")
+        if job and job['status'] == 'DONE':
+            st.caption(f"Instantané : {job['result']['size_bytes'] / 1e6:.1f} Mo -> {job['result']['compressed_bytes'] / 1e6:.1f} Mo en {job['result']['total_s']:.1f} s")
+
+        snapshots = backups.list_snapshots()
+        if snapshots:
+            st.dataframe([{'Date': m['created_at'][:19], 'Type': m['label'], 'Taille (Mo)': round(m['size_bytes'] / 1e6, 1),
+                           'Compressé (Mo)': round(m['compressed_bytes'] / 1e6, 1), 'SHA-256': m['sha256'][:16]} for m in snapshots],
+                         use_container_width=True)
+            by_file = {m['file']: m for m in snapshots}
+            chosen = by_file[st.selectbox("Instantané", list(by_file), format_func=lambda f: f"{by_file[f]['created_at'][:19]} ({by_file[f]['label']})")]
+            s1, s2, s3 = st.columns(3)
+            with open(backups.path_of(chosen), "rb") as f:
+                s1.download_button("⬇️ Télécharger", f, file_name=chosen['file'])
+            if s2.button("🔍 Vérifier"):
+                if backups.verify(chosen): st.success("Somme de contrôle OK.")
+                else: st.error("Somme de contrôle invalide : instantané corrompu.")
+            if s3.button("♻️ Restaurer", type="primary"):
+                try:
+                    with st.spinner("Restauration..."): backups.restore(chosen)
+                    st.success("Restauré ! (instantané de sécurité créé avant la bascule)"); time.sleep(2); st.rerun()
+                except (ValueError, sqlite3.OperationalError) as e: st.error(f"Restauration refusée : {e}")
+
+        st.markdown("---")
+        up = st.file_uploader("Restaurer depuis un fichier (.db ou .db.gz)")
+        if up and st.button("RESTAURER LE FICHIER"):
+            try:
+                with st.spinner("Contrôle et restauration..."): backups.restore_uploaded(up.getvalue())
+                st.success("Restauré !"); time.sleep(2); st.rerun()
+            except (ValueError, sqlite3.OperationalError) as e: st.error(f"Restauration refusée : {e}")
+
+        st.markdown("---")
+        st.subheader("🗄️ Archivage des Audits")
+        arch_scheduler = get_archive_scheduler()
+        archive = arch_scheduler.archive
+        status = archive.status()
+        st.caption(f"Borne d'archivage : {status['cutoff'] or 'aucune'} | Dernier passage : {(status['last_run'] or 'jamais')[:19]}")
+        st.dataframe([{'Partition': alias, 'Audits': n} for alias, n in status['partitions'].items()], use_container_width=True)
+        if arch_scheduler.last_error: st.error(f"Dernier archivage automatique en échec : {arch_scheduler.last_error}")
+        a1, a2 = st.columns(2)
+        new_horizon = a1.number_input("Horizon base chaude (jours)", min_value=30, step=30, value=int(status['horizon_days']))
+        if a1.button("💾 Appliquer l'horizon"):
+            st.session_state.db.set_config_value("ARCHIVE_HORIZON_DAYS", new_horizon)
+            st.success("Horizon mis à jour !"); time.sleep(1); st.rerun()
+        if a2.button("🗄️ Archiver maintenant"):
+            jobs.submit('archive', created_by=st.session_state.get('user')); st.rerun()
+        job = jobs.latest('archive')
+        render_job(job, "archive")
+        if job and job['status'] == 'DONE': st.caption(f"{job['result']['moved']} audits archivés (avant {job['result']['cutoff']}).")
+
+        if st.button("📊 Recalculer les agrégats de flotte"):
+            jobs.submit('aggregates_rebuild', created_by=st.session_state.get('user')); st.rerun()
+        render_job(jobs.latest('aggregates_rebuild'), "aggregates_rebuild")
+
+    with t5:
+        jobs = get_job_scheduler()
+        counts = jobs.counts()
+        k = st.columns(len(JOB_STATUSES))
+        for col, status in zip(k, JOB_STATUSES): col.metric(status, counts[status])
+        if jobs.last_error: st.error(f"Répartiteur en échec : {jobs.last_error}")
+        st.caption(f"{jobs.workers} workers | un seul travail en cours par type")
+
+        j1, j2 = st.columns(2)
+        job_status = j1.selectbox("Statut", ["Tous", *JOB_STATUSES], key="job_status")
+        job_kind = j2.selectbox("Type", ["Tous", *JOB_TYPES], key="job_kind")
+        clauses, params = [], []
+        if job_status != "Tous": clauses.append("status = ?"); params.append(job_status)
+        if job_kind != "Tous": clauses.append("job_type = ?"); params.append(job_kind)
+        page, next_jobs = fetch_page("jobs", GRID_JOBS, " AND ".join(clauses), params)
+        st.dataframe([{
+            'ID': j['job_id'], 'Type': JOB_TYPES[j['job_type']].label if j['job_type'] in JOB_TYPES else j['job_type'],
+            'Statut': j['status'], 'Par': j['created_by'], 'Créé': (j['created_at'] or '')[:19],
+            'Durée (s)': round((datetime.fromisoformat(j['finished_at']) - datetime.fromisoformat(j['started_at'])).total_seconds(), 1) if j['finished_at'] and j['started_at'] else None,
+            'Progression': f"{j['progress_done']}/{j['progress_total'] or '?'}" if j['progress_done'] is not None else "",
+            'Essais': f"{j['attempts']}/{j['max_retries'] + 1}", 'Détail': j['error'] or j['message'] or "",
+        } for j in page], use_container_width=True)
+        render_pager("jobs", next_jobs)
+        r1, r2, r3, r4 = st.columns([2, 1, 1, 1])
+        target_job = r1.text_input("ID du travail", key="job_target").strip()
+        if r2.button("⏹️ Annuler", key="job_cancel") and target_job:
+            if jobs.cancel(target_job): st.success("Annulation demandée.")
+            else: st.warning("Travail introuvable ou déjà terminé.")
+        if r3.button("🔁 Relancer", key="job_retry") and target_job:
+            if jobs.retry(target_job): st.success("Travail relancé."); time.sleep(1); st.rerun()
+            else: st.warning("Seul un travail terminé peut être relancé.")
+        if r4.button("🔄 Actualiser", key="jobs_refresh"): st.rerun()
+
+        st.markdown("---")
+        st.subheader("🗓️ Planifications")
+        st.caption("Format cron : minute heure jour mois jour-de-semaine (ex. « 0 2 * * * » = chaque nuit à 2 h, « */30 8-18 * * 1-5 » = toutes les 30 min en semaine).")
+        schedules = jobs.list_schedules()
+        if schedules:
+            st.dataframe([{
+                'ID': sc['schedule_id'], 'Type': JOB_TYPES[sc['job_type']].label if sc['job_type'] in JOB_TYPES else sc['job_type'],
+                'Cron': sc['cron'], 'Actif': bool(sc['enabled']), 'Prochaine': (sc['next_run_at'] or '')[:16],
+                'Dernière': (sc['last_run_at'] or '')[:16], 'Paramètres': sc['params'] or "",
+            } for sc in schedules], use_container_width=True)
+            by_id = {sc['schedule_id']: sc for sc in schedules}
+            p1, p2, p3 = st.columns([2, 1, 1])
+            chosen = p1.selectbox("Planification", list(by_id), format_func=lambda i: f"{by_id[i]['cron']} - {by_id[i]['job_type']}")
+            if p2.button("⏯️ Activer / Suspendre"):
+                jobs.set_schedule_enabled(chosen, not by_id[chosen]['enabled']); st.rerun()
+            if p3.button("🗑️ Supprimer"):
+                jobs.delete_schedule(chosen); st.rerun()
+        n1, n2, n3 = st.columns([2, 2, 1])
+        new_type = n1.selectbox("Travail", [t for t, jt in JOB_TYPES.items() if jt.schedulable], format_func=lambda t: JOB_TYPES[t].label, key="sched_type")
+        new_cron = n2.text_input("Cron", value="0 2 * * *", key="sched_cron")
+        if n3.button("➕ Planifier"):
+            try:
+                jobs.add_schedule(new_type, new_cron, created_by=st.session_state.get('user'))
+                st.success("Planification ajoutée !"); time.sleep(1); st.rerun()
+            except ValueError as e: st.error(str(e))
+
+    with t6:
+        exporter = get_metrics_exporter()
+        st.caption(
+            f"Mesures depuis le {datetime.fromtimestamp(METRICS.started_at):%d/%m/%Y %H:%M:%S} (processus courant) | "
+            f"Prometheus : {f'http://{exporter.host}:{exporter.port}/metrics' if exporter.port else 'HTTP off'}"
+            f"{f' | fichier {exporter.path}' if exporter.path else ''}"
+        )
+        if exporter.last_error: st.error(f"Exposition des métriques : {exporter.last_error}")
+
+        waits = METRICS.lock_waits()
+        k1, k2, k3, k4 = st.columns(4)
+        writer, readers = waits.get('writer', {}), waits.get('reader_pool', {})
+        k1.metric("Attente verrou écrivain", f"{writer.get('total_s', 0.0):.2f} s", f"max {writer.get('max_ms', 0.0):.0f} ms", delta_color="off")
+        k2.metric("Attente pool lecteurs", f"{readers.get('total_s', 0.0):.2f} s", f"max {readers.get('max_ms', 0.0):.0f} ms", delta_color="off")
+        k3.metric("Écritures", writer.get('count', 0))
+        k4.metric("Lectures", readers.get('count', 0))
+
+        st.subheader("🐢 Requêtes les plus coûteuses")
+        sort_keys = {"Temps total": 'total_s', "p99": 'p99_ms', "Moyenne": 'mean_ms', "Max": 'max_ms', "Appels": 'count', "Attente verrou": 'lock_wait_s'}
+        p1, p2 = st.columns([2, 1])
+        sort_by = p1.selectbox("Trier par", list(sort_keys), key="perf_sort")
+        top_n = p2.number_input("Nombre", min_value=5, max_value=200, step=5, value=20, key="perf_top")
+        st.dataframe([{
+            'Empreinte': q['fingerprint'], 'Type': q['kind'], 'Requête': q['sql'][:160], 'Appels': q['count'],
+            'Total (s)': round(q['total_s'], 3), 'Moy. (ms)': round(q['mean_ms'], 2), 'p50 (ms)': round(q['p50_ms'], 2),
+            'p95 (ms)': round(q['p95_ms'], 2), 'p99 (ms)': round(q['p99_ms'], 2), 'Max (ms)': round(q['max_ms'], 1),
+            'Attente verrou (s)': round(q['lock_wait_s'], 3),
+        } for q in METRICS.slowest_queries(int(top_n), sort_keys[sort_by])], use_container_width=True)
+
+        st.subheader("⏱️ Chemins chauds")
+        st.dataframe([{
+            'Mesure': t['metric'].replace("gencontrol_", ""), 'Étiquettes': t['labels'], 'Appels': t['count'],
+            'Total (s)': round(t['total_s'], 3), 'Moy. (ms)': round(t['mean_ms'], 3), 'p95 (ms)': round(t['p95_ms'], 2),
+            'p99 (ms)': round(t['p99_ms'], 2), 'Max (ms)': round(t['max_ms'], 1),
+        } for t in METRICS.timers()], use_container_width=True)
+
+        m1, m2, m3 = st.columns(3)
+        m1.download_button("⬇️ Métriques (format Prometheus)", METRICS.render_prometheus(), f"metrics_{datetime.now():%Y%m%d_%H%M}.prom", "text/plain")
+        if m2.button("🔄 Actualiser", key="perf_refresh"): st.rerun()
+        if m3.button("🗑️ Remettre à zéro", key="perf_reset"): METRICS.reset(); st.rerun()
+
+        with st.expander("🔌 Exposition Prometheus"):
+            e1, e2 = st.columns(2)
+            new_port = e1.number_input("Port HTTP local (0 = off)", min_value=0, max_value=65535, step=1, value=int(exporter.port or 0))
+            new_file = e2.text_input("Fichier texte (collecteur textfile)", value=exporter.path or "")
+            if st.button("💾 Appliquer l'exposition"):
+                st.session_state.db.set_config_value("METRICS_PORT", int(new_port))
+                st.session_state.db.set_config_value("METRICS_FILE", new_file.strip())
+                exporter.stop(); get_metrics_exporter.clear()
+                st.success("Exposition mise à jour !"); time.sleep(1); st.rerun()
 
 # --- POINT D'ENTRÉE ---
 def main():
@@ -637,12 +1178,21 @@ def main():
         render_auth()
         return
 
+    sec = st.session_state.security
+    if not sec.validate_session(st.session_state['auth_token'], sec.get_remote_ip()):
+        st.session_state.clear()
+        st.warning("Session expirée ou révoquée. Veuillez vous reconnecter.")
+        init_session(); render_auth()
+        return
+
     menu = render_sidebar()
 
     if menu == "📱 Audit Terrain": render_audit_page()
     elif menu == "🎯 Calibration": render_calibration_page()
     elif menu == "👤 Mon Profil": render_profile_page() # <--- LIEN VERS LA PAGE
+    elif menu == "📥 Import en Masse": render_import_page()
     elif menu == "🧠 Intelligence": render_learning_page()
+    elif menu == "📊 Tableau de Bord Flotte": render_fleet_dashboard_page()
     elif menu == "🔐 Admin": render_admin_page()
     elif menu == "💎 Offres & Licences": render_payment_page_local()
 
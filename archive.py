@@ -0,0 +1,287 @@
+# ==============================================================================
+# ARCHIVE.PY - Partitionnement Temporel des Audits (Chaud / Froid)
+# Les audits plus anciens que l'horizon (ARCHIVE_HORIZON_DAYS) quittent la table
+# `audits` pour une base SQLite par année, attachée à toutes les connexions
+# (arch_2023.audits, ...). Lecture unifiée : seules les partitions utiles sont lues.
+# Usage : python archive.py run [--horizon-days 730] | status
+# ==============================================================================
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from database import hot_query
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[int, int], None]
+
+HOT = "main"
+PARTITION_INDEXES = {
+    'idx_arch_equipment_ts': "audits (equipment_id, timestamp)",
+    'idx_arch_created_by_ts': "audits (created_by, timestamp)",
+    'idx_arch_ts': "audits (timestamp)",
+}
+# Borne basse texte : exclut les horodatages NULL ou non ISO (affinité NUMERIC de TIMESTAMP)
+MIN_TIMESTAMP = "0001-01-01"
+# Filtres des appelants (where de select / iter_select / latest)
+BY_EQUIPMENT = "equipment_id = ?"
+BY_USER = "created_by = ?"
+
+AUDIT_QUOTA_COUNT = hot_query("audit_quota_count", "SELECT COUNT(*) AS n FROM audits WHERE created_by = ?", ("user",))
+ARCHIVE_QUOTA_COUNT = hot_query("archive_quota_count", "SELECT n FROM audit_archive_counts WHERE created_by = ?", ("user",))
+
+
+class AuditArchive:
+    """
+    Base chaude = table `audits` (horodatage >= ARCHIVE_CUTOFF, sauf déplacement en cours).
+    Archives = une base par année. Le quota DISCOVERY et l'apprentissage lisent des agrégats
+    maintenus dans la base chaude (audit_archive_counts / audit_archive_learning) au moment
+    du déplacement : ils n'ouvrent jamais les archives.
+    Le ré-audit de flotte ne recalcule que la base chaude : les archives sont figées.
+    SQLite attache au plus 10 bases par connexion par défaut (9 années d'archives).
+    """
+
+    def __init__(self, db, chunk_size=5000):
+        self.db = db
+        self.chunk_size = chunk_size
+
+    # --- PARTITIONS ---
+    def horizon_days(self) -> int:
+        try: return int(self.db.get_config_value("ARCHIVE_HORIZON_DAYS", "730"))
+        except (TypeError, ValueError): return 730
+
+    def cutoff(self) -> Optional[str]:
+        """Tout audit antérieur est en archive (ou en cours de déplacement)"""
+        value = self.db.get_config_value("ARCHIVE_CUTOFF", None)
+        return value or None
+
+    def cold_years(self) -> List[int]:
+        self.db.refresh_archives()
+        return sorted(int(alias[5:]) for alias in self.db.attached if alias.startswith("arch_"))
+
+    def partitions(self, since=None, until=None) -> List[str]:
+        """Alias à lire pour [since, until), dans l'ordre chronologique (archives puis base chaude)"""
+        cutoff = self.cutoff()
+        aliases = []
+        if not (since and cutoff and since >= cutoff):
+            for year in self.cold_years():
+                start, end = f"{year:04d}-01-01", f"{year + 1:04d}-01-01"
+                if (until is None or start < until) and (since is None or since < end):
+                    aliases.append(f"arch_{year}")
+        return aliases + [HOT]
+
+    @staticmethod
+    def _where(where, since, until):
+        clauses, params = ([f"({where})"] if where else []), []
+        if since: clauses.append("timestamp >= ?"); params.append(since)
+        if until: clauses.append("timestamp < ?"); params.append(until)
+        return (f" WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+    @classmethod
+    def stream_sql(cls, alias, columns="*", where="", since=None, until=None):
+        """Lecture d'une partition triée par horodatage : (SQL, paramètres de période)"""
+        clause, extra = cls._where(where, since, until)
+        return f"SELECT {columns} FROM {alias}.audits{clause} ORDER BY timestamp", extra
+
+    @classmethod
+    def latest_sql(cls, alias, columns="*", where=""):
+        return f"SELECT {columns} FROM {alias}.audits{cls._where(where, None, None)[0]} ORDER BY timestamp DESC LIMIT ?"
+
+    # --- LECTURE UNIFIÉE ---
+    def select(self, columns="*", where="", params=(), since=None, until=None, order_by=None, limit=None):
+        """UNION ALL des partitions utiles ; where ne doit pas préfixer les colonnes par une table"""
+        clause, extra = self._where(where, since, until)
+        aliases = self.partitions(since, until)
+        query = " UNION ALL ".join(f"SELECT {columns} FROM {alias}.audits{clause}" for alias in aliases)
+        args = [*params, *extra] * len(aliases)
+        if order_by: query += f" ORDER BY {order_by}"
+        if limit is not None: query += " LIMIT ?"; args.append(limit)
+        return self.db.execute_read(query, tuple(args))
+
+    def iter_select(self, columns="*", where="", params=(), since=None, until=None, chunk_size=1000):
+        """Flux trié par horodatage : partition après partition (les années sont disjointes), sans tri global"""
+        for alias in self.partitions(since, until):
+            query, extra = self.stream_sql(alias, columns, where, since, until)
+            yield from self.db.iter_read(query, (*params, *extra), chunk_size)
+
+    def latest(self, where="", params=(), limit=1, columns="*"):
+        """Les `limit` audits les plus récents : base chaude d'abord, archives seulement s'il en manque"""
+        rows = []
+        for alias in [HOT, *(f"arch_{y}" for y in reversed(self.cold_years()))]:
+            rows += self.db.execute_read(self.latest_sql(alias, columns, where), (*params, limit - len(rows)))
+            if len(rows) >= limit: break
+        return rows
+
+    def count_by_user(self, username) -> int:
+        hot = self.db.execute_read(AUDIT_QUOTA_COUNT, (username,))[0]['n']
+        cold = self.db.execute_read(ARCHIVE_QUOTA_COUNT, (username,))
+        return hot + (cold[0]['n'] if cold else 0)
+
+    # --- DÉPLACEMENT CHAUD -> FROID ---
+    def _main_columns(self):
+        return [r['name'] for r in self.db.execute_read("PRAGMA main.table_info(audits)")]
+
+    def _ensure_partition(self, year) -> str:
+        alias, path = f"arch_{year}", self.db.archive_path(year)
+        os.makedirs(self.db.archive_dir, exist_ok=True)
+        create_sql = self.db.execute_read("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'audits'")[0]['sql']
+        conn = sqlite3.connect(path)
+        try:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute(create_sql.replace("CREATE TABLE audits", "CREATE TABLE IF NOT EXISTS audits", 1))
+            # Colonnes ajoutées à la base chaude depuis la création de l'archive
+            present = {r[1] for r in conn.execute("PRAGMA table_info(audits)")}
+            for col in self.db.execute_read("PRAGMA main.table_info(audits)"):
+                if col['name'] not in present: conn.execute(f"ALTER TABLE audits ADD COLUMN {col['name']} {col['type']}")
+            for name, target in PARTITION_INDEXES.items():
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+            conn.commit()
+        finally: conn.close()
+        self.db.attach_database(alias, path)
+        return alias
+
+    def run(self, horizon_days=None, progress_callback: Optional[ProgressCallback] = None) -> Dict:
+        """Déplace par lots les audits plus anciens que l'horizon ; reprenable (idempotent)"""
+        horizon_days = self.horizon_days() if horizon_days is None else horizon_days
+        target = (datetime.now() - timedelta(days=horizon_days)).date().isoformat()
+        previous = self.cutoff()
+        # La borne est publiée AVANT le déplacement : une lecture [since, until) n'ignore jamais
+        # une archive qui peut déjà contenir les lignes demandées
+        if previous is None or target > previous: self.db.set_config_value("ARCHIVE_CUTOFF", target)
+
+        oldest = self.db.execute_read(
+            "SELECT MIN(timestamp) AS ts FROM audits WHERE timestamp >= ? AND timestamp < ?", (MIN_TIMESTAMP, target)
+        )[0]['ts']
+        stats = {'moved': 0, 'partitions': [], 'cutoff': max(target, previous or target)}
+        if oldest is None: return stats
+        total = self.db.execute_read(
+            "SELECT COUNT(*) AS n FROM audits WHERE timestamp >= ? AND timestamp < ?", (MIN_TIMESTAMP, target)
+        )[0]['n']
+        cols = ", ".join(self._main_columns())
+
+        for year in range(int(str(oldest)[:4]), int(target[:4]) + 1):
+            start, end = f"{year:04d}-01-01", min(f"{year + 1:04d}-01-01", target)
+            if start >= end: continue
+            alias = self._ensure_partition(year)
+            moved_year = 0
+            while True:
+                # 1) Copie validée dans l'archive seule : SQLite ne valide pas deux fichiers atomiquement en WAL
+                with self.db.write_transaction("archive_copy") as conn:
+                    conn.execute("CREATE TEMP TABLE IF NOT EXISTS _archive_batch (rid INTEGER PRIMARY KEY)")
+                    conn.execute("DELETE FROM temp._archive_batch")
+                    n = conn.execute(
+                        "INSERT INTO temp._archive_batch (rid) SELECT rowid FROM main.audits WHERE timestamp >= ? AND timestamp < ? AND audit_uuid IS NOT NULL LIMIT ?",
+                        (start, end, self.chunk_size)
+                    ).rowcount
+                    # OR IGNORE : une reprise après coupure ne duplique pas les audits déjà copiés
+                    if n > 0: conn.execute(f"INSERT OR IGNORE INTO {alias}.audits ({cols}) SELECT {cols} FROM main.audits WHERE rowid IN (SELECT rid FROM temp._archive_batch)")
+                if n <= 0: break
+                # 2) Base chaude seule : retrait des lignes dont la copie est présente dans l'archive.
+                # Les compteurs sont mis à jour dans la même transaction que la suppression : chaque audit
+                # est compté une fois, quand il quitte la base chaude (y compris une reprise après coupure
+                # entre 1 et 2, ou une restauration qui l'y a remis alors que l'archive l'avait déjà).
+                with self.db.write_transaction("archive_move") as conn:
+                    conn.execute(f"DELETE FROM temp._archive_batch WHERE NOT EXISTS (SELECT 1 FROM main.audits h JOIN {alias}.audits a ON a.audit_uuid = h.audit_uuid WHERE h.rowid = rid)")
+                    batch = "rowid IN (SELECT rid FROM temp._archive_batch)"
+                    conn.execute(f"""
+                        INSERT INTO audit_archive_counts (created_by, n)
+                        SELECT created_by, COUNT(*) FROM main.audits WHERE {batch} AND created_by IS NOT NULL GROUP BY created_by
+                        ON CONFLICT(created_by) DO UPDATE SET n = n + excluded.n
+                    """)
+                    conn.execute(f"""
+                        INSERT INTO audit_archive_learning (equipment_id, scenario_code, n_samples, ratio_sum, ratio_count)
+                        SELECT equipment_id, scenario_code, COUNT(*),
+                               COALESCE(SUM(CASE WHEN estimated_typ > 0 THEN fuel_declared_l / estimated_typ END), 0),
+                               COUNT(CASE WHEN estimated_typ > 0 THEN 1 END)
+                        FROM main.audits WHERE {batch} AND verdict = 'NORMAL' GROUP BY equipment_id, scenario_code
+                        ON CONFLICT(equipment_id, scenario_code) DO UPDATE SET
+                            n_samples = n_samples + excluded.n_samples, ratio_sum = ratio_sum + excluded.ratio_sum,
+                            ratio_count = ratio_count + excluded.ratio_count
+                    """)
+                    n = conn.execute(f"DELETE FROM main.audits WHERE {batch}").rowcount
+                if n <= 0: raise RuntimeError(f"Archivage bloqué : copie introuvable dans {alias}")
+                moved_year += n
+                stats['moved'] += n
+                if progress_callback: progress_callback(stats['moved'], total)
+            if moved_year: stats['partitions'].append(alias)
+
+        self.db.set_config_value("ARCHIVE_LAST_RUN", datetime.now().isoformat())
+        logger.info(f"Archivage : {stats['moved']} audits déplacés avant {target}")
+        return stats
+
+    def status(self) -> Dict:
+        parts = {HOT: self.db.execute_read("SELECT COUNT(*) AS n FROM main.audits")[0]['n']}
+        for year in self.cold_years():
+            parts[f"arch_{year}"] = self.db.execute_read(f"SELECT COUNT(*) AS n FROM arch_{year}.audits")[0]['n']
+        return {
+            'cutoff': self.cutoff(), 'horizon_days': self.horizon_days(),
+            'last_run': self.db.get_config_value("ARCHIVE_LAST_RUN", None), 'partitions': parts,
+        }
+
+
+# Formes émises par les appelants, contrôlées sur la base chaude (chaque archive a les mêmes index)
+_PERIOD = ("2025-01-01", "2025-02-01")
+hot_query("audit_latest_equipment", AuditArchive.latest_sql(HOT, "index_end", BY_EQUIPMENT), ("EQ", 1))
+hot_query("audit_latest_deviations", AuditArchive.latest_sql(HOT, "deviation_pct", BY_EQUIPMENT), ("EQ", 20))
+hot_query("audit_latest_user", AuditArchive.latest_sql(HOT, "*", BY_USER), ("user", 20))
+hot_query("audit_period", AuditArchive.stream_sql(HOT, "*", "", *_PERIOD)[0], _PERIOD)
+hot_query("audit_period_user", AuditArchive.stream_sql(HOT, "*", BY_USER, *_PERIOD)[0], ("user", *_PERIOD))
+
+class ArchiveScheduler:
+    """Thread de fond : un passage d'archivage par jour (ARCHIVE_LAST_RUN)"""
+    CHECK_EVERY_S = 3600.0
+    INTERVAL_H = 24.0
+
+    def __init__(self, archive: AuditArchive):
+        self.archive = archive
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="archive-scheduler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def is_due(self) -> bool:
+        last = self.archive.db.get_config_value("ARCHIVE_LAST_RUN", None)
+        try: return last is None or (datetime.now() - datetime.fromisoformat(last)).total_seconds() >= self.INTERVAL_H * 3600
+        except ValueError: return True
+
+    def _loop(self):
+        while not self._stop.wait(self.CHECK_EVERY_S):
+            try:
+                if self.is_due(): self.archive.run()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Archivage planifié échoué : {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archivage des audits GEN-CONTROL")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_run = sub.add_parser("run", help="Déplace les audits plus anciens que l'horizon")
+    p_run.add_argument("--horizon-days", type=int, default=None)
+    sub.add_parser("status")
+    args = parser.parse_args()
+
+    from database import ThreadSafeDatabase
+    archive = AuditArchive(ThreadSafeDatabase.get_instance())
+    if args.cmd == "run":
+        stats = archive.run(args.horizon_days, progress_callback=lambda done, total: print(f"\r{done}/{total}", end="", flush=True))
+        print(f"\n{stats['moved']} audits archivés (avant {stats['cutoff']}).")
+    else:
+        st = archive.status()
+        print(f"Borne : {st['cutoff']} | horizon : {st['horizon_days']} j | dernier passage : {st['last_run']}")
+        for alias, n in st['partitions'].items(): print(f"  {alias:<10} {n:>10} audits")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+# ==============================================================================
+# BACKUPS.PY - Sauvegardes à Chaud & Restauration Atomique
+# API de sauvegarde en ligne de SQLite (copie par paquets de pages, écritures
+# non bloquées), instantanés compressés + somme SHA-256, planification.
+# Usage : python backups.py create | list | verify FICHIER | restore FICHIER
+# ==============================================================================
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[int, int], None]
+
+
+class BackupManager:
+    """
+    Instantané = <nom>.db.gz + <nom>.arch_AAAA.db.gz par archive annuelle + <nom>.json
+    (manifeste : SHA-256 et taille de chaque fichier décompressé).
+    La copie passe par une connexion dédiée (hors pool) : les audits continuent pendant la sauvegarde.
+    """
+    DEFAULT_DIR = "backups"
+    PAGES_PER_STEP = 4096    # ~16 Mo par étape avec des pages de 4 Kio
+    MAX_RESTARTS = 3         # Au-delà, copie en une seule étape (lecture WAL : les écritures passent quand même)
+    COMPRESS_LEVEL = 1       # gzip rapide : plusieurs Go en quelques secondes
+    CHUNK = 1024 * 1024
+
+    def __init__(self, db, directory=DEFAULT_DIR, keep=7):
+        self.db = db
+        self.directory = directory
+        self.keep = keep
+        os.makedirs(directory, exist_ok=True)
+
+    # --- CRÉATION ---
+    def create_snapshot(self, label="auto", progress_callback: Optional[ProgressCallback] = None) -> Dict:
+        """
+        Base principale puis archives annuelles (même nom + alias). Dans cet ordre, un audit archivé
+        entre les deux copies figure dans les deux fichiers : la restauration le retire de la base
+        chaude (jamais perdu, jamais compté deux fois).
+        """
+        name = f"snapshot_{datetime.now():%Y%m%d_%H%M%S_%f}_{label}"
+        t0 = time.perf_counter()
+        gz_path = os.path.join(self.directory, f"{name}.db.gz")
+        digest, size, t_copy = self._snapshot_file(self.db.db_path, gz_path, progress_callback)
+        self.db.refresh_archives()
+        archives = []
+        for alias, path in sorted(self.db.attached.items()):
+            arch_gz = os.path.join(self.directory, f"{name}.{alias}.db.gz")
+            arch_digest, arch_size, _ = self._snapshot_file(path, arch_gz)
+            archives.append({'alias': alias, 'file': os.path.basename(arch_gz), 'sha256': arch_digest, 'size_bytes': arch_size})
+
+        manifest = {
+            'name': name, 'file': os.path.basename(gz_path), 'label': label,
+            'created_at': datetime.now().isoformat(), 'sha256': digest,
+            'size_bytes': size, 'compressed_bytes': os.path.getsize(gz_path),
+            'archives': archives, 'copy_s': t_copy - t0, 'total_s': time.perf_counter() - t0,
+        }
+        with open(os.path.join(self.directory, f"{name}.json"), "w") as f: json.dump(manifest, f, indent=2)
+        self.prune()
+        logger.info(f"Sauvegarde {name} : {size / 1e6:.1f} Mo + {len(archives)} archive(s) en {manifest['total_s']:.1f} s")
+        return manifest
+
+    def _snapshot_file(self, src_path, gz_path, progress_callback: Optional[ProgressCallback] = None):
+        """Copie en ligne de src_path compressée vers gz_path ; renvoie (SHA-256, taille, fin de copie)"""
+        fd, raw_path = tempfile.mkstemp(suffix=".db", dir=self.directory); os.close(fd)
+        try:
+            src = sqlite3.connect(src_path, check_same_thread=False)
+            dst = sqlite3.connect(raw_path)
+            try:
+                self._copy(src, dst, progress_callback)
+                dst.execute("PRAGMA journal_mode = DELETE")  # Fichier autonome (pas de -wal)
+            finally:
+                dst.close(); src.close()
+            t_copy = time.perf_counter()
+
+            digest, size = hashlib.sha256(), 0
+            with open(raw_path, "rb") as fin, gzip.open(f"{gz_path}.part", "wb", compresslevel=self.COMPRESS_LEVEL) as fout:
+                while True:
+                    block = fin.read(self.CHUNK)
+                    if not block: break
+                    digest.update(block); size += len(block)
+                    fout.write(block)
+            os.replace(f"{gz_path}.part", gz_path)
+        finally:
+            if os.path.exists(raw_path): os.remove(raw_path)
+        return digest.hexdigest(), size, t_copy
+
+    def _copy(self, src, dst, progress_callback):
+        """
+        Copie par étapes de PAGES_PER_STEP pages : le verrou de lecture n'est tenu que le temps
+        d'une étape. Une écriture d'une autre connexion fait repartir la copie au début ; si cela
+        se répète, on termine en une étape (en WAL une lecture longue ne bloque pas les écritures).
+        """
+        restarts, last_remaining = 0, None
+
+        class _TooManyRestarts(Exception): pass
+
+        def _progress(status, remaining, total):
+            nonlocal restarts, last_remaining
+            if last_remaining is not None and remaining > last_remaining:
+                restarts += 1
+                if restarts > self.MAX_RESTARTS: raise _TooManyRestarts()
+            last_remaining = remaining
+            if progress_callback: progress_callback(total - remaining, total)
+
+        try: src.backup(dst, pages=self.PAGES_PER_STEP, progress=_progress)
+        except _TooManyRestarts:
+            logger.warning("Sauvegarde relancée trop souvent : copie en une étape")
+            src.backup(dst, pages=-1)
+            if progress_callback: progress_callback(1, 1)
+
+    # --- INVENTAIRE ---
+    def list_snapshots(self) -> List[Dict]:
+        """Du plus récent au plus ancien"""
+        snapshots = []
+        for fname in os.listdir(self.directory):
+            if not fname.endswith(".json"): continue
+            try:
+                with open(os.path.join(self.directory, fname)) as f: manifest = json.load(f)
+            except (OSError, ValueError): continue
+            if os.path.exists(self.path_of(manifest)): snapshots.append(manifest)
+        return sorted(snapshots, key=lambda m: m['created_at'], reverse=True)
+
+    def path_of(self, manifest) -> str:
+        return os.path.join(self.directory, manifest['file'])
+
+    def files_of(self, manifest) -> List[str]:
+        """Tous les fichiers de l'instantané (base, archives, manifeste)"""
+        return [self.path_of(manifest), *(os.path.join(self.directory, a['file']) for a in manifest.get('archives', [])),
+                os.path.join(self.directory, f"{manifest['name']}.json")]
+
+    def last_snapshot_time(self) -> Optional[datetime]:
+        snapshots = self.list_snapshots()
+        return datetime.fromisoformat(snapshots[0]['created_at']) if snapshots else None
+
+    def prune(self):
+        """Ne garde que les `keep` instantanés automatiques les plus récents (les manuels sont conservés)"""
+        auto = [m for m in self.list_snapshots() if m['label'] == 'auto']
+        for manifest in auto[self.keep:]:
+            for path in self.files_of(manifest):
+                try: os.remove(path)
+                except FileNotFoundError: pass
+
+    def find(self, name_or_file) -> Dict:
+        for manifest in self.list_snapshots():
+            if name_or_file in (manifest['name'], manifest['file']): return manifest
+        raise ValueError(f"Instantané introuvable : {name_or_file}")
+
+    # --- VÉRIFICATION / RESTAURATION ---
+    def _decompress(self, manifest, out_path=None) -> str:
+        """Décompresse (vers out_path si fourni) et renvoie le SHA-256 du contenu"""
+        digest = hashlib.sha256()
+        with gzip.open(os.path.join(self.directory, manifest['file']), "rb") as fin, (open(out_path, "wb") if out_path else io.BytesIO()) as fout:
+            while True:
+                block = fin.read(self.CHUNK)
+                if not block: break
+                digest.update(block)
+                if out_path: fout.write(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def check_database_file(path):
+        """Refuse un fichier qui n'est pas une base GEN-CONTROL saine"""
+        conn = sqlite3.connect(path)
+        try:
+            if conn.execute("PRAGMA quick_check").fetchone()[0] != "ok":
+                raise ValueError("Base corrompue (quick_check)")
+            tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            missing = {'users', 'audits', 'equipment', 'app_config'} - tables
+            if missing: raise ValueError(f"Tables manquantes : {', '.join(sorted(missing))}")
+        except sqlite3.DatabaseError as e:
+            raise ValueError(f"Fichier SQLite invalide : {e}")
+        finally: conn.close()
+
+    def verify(self, manifest) -> bool:
+        try: return all(self._decompress(part) == part['sha256'] for part in (manifest, *manifest.get('archives', [])))
+        except (OSError, EOFError): return False  # Archive tronquée ou illisible
+
+    def _install(self, path, safety_snapshot, archives=None):
+        self.check_database_file(path)
+        if safety_snapshot: self.create_snapshot(label="pre_restore")
+        self.db.replace_database_file(path, archives)
+
+    def _extract(self, part, directory) -> str:
+        """Décompresse une partie de l'instantané dans directory (même disque que la cible : os.replace atomique)"""
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(suffix=".db", dir=directory); os.close(fd)
+        try: digest = self._decompress(part, tmp)
+        except (OSError, EOFError) as e: os.remove(tmp); raise ValueError(f"Archive illisible : {e}")
+        if digest != part['sha256']:
+            os.remove(tmp); raise ValueError(f"Somme de contrôle invalide : {part['file']}")
+        return tmp
+
+    def restore(self, manifest, safety_snapshot=True) -> Dict:
+        """
+        Décompresse et contrôle hors verrou, puis bascule base et archives sous le verrou écrivain.
+        Un instantané antérieur aux archives (pas de clé 'archives') ne restaure que la base.
+        """
+        tmp, archives = None, {}
+        try:
+            tmp = self._extract(manifest, os.path.dirname(os.path.abspath(self.db.db_path)))
+            for part in manifest.get('archives', []): archives[part['alias']] = self._extract(part, self.db.archive_dir)
+            self._install(tmp, safety_snapshot, archives if 'archives' in manifest else None)
+        finally:
+            for path in (tmp, *archives.values()):
+                if path and os.path.exists(path): os.remove(path)
+        if 'archives' in manifest:
+            # Audits archivés entre la copie de la base et celle des archives : retirés de la base chaude
+            from archive import AuditArchive
+            AuditArchive(self.db).run()
+        logger.info(f"Base restaurée depuis {manifest['file']}")
+        return manifest
+
+    def restore_uploaded(self, data, safety_snapshot=True):
+        """Restauration d'un fichier importé (.db ou .db.gz)"""
+        fd, tmp = tempfile.mkstemp(suffix=".db", dir=os.path.dirname(os.path.abspath(self.db.db_path))); os.close(fd)
+        try:
+            with open(tmp, "wb") as f:
+                if data[:2] == b"\x1f\x8b":
+                    try:
+                        with gzip.GzipFile(fileobj=io.BytesIO(data)) as gz: shutil.copyfileobj(gz, f, self.CHUNK)
+                    except (OSError, EOFError) as e: raise ValueError(f"Archive illisible : {e}")
+                else: f.write(data)
+            self._install(tmp, safety_snapshot)
+        finally:
+            if os.path.exists(tmp): os.remove(tmp)
+
+
+class BackupScheduler:
+    """Thread de fond : un instantané automatique dès que le dernier a plus de interval_h heures"""
+    CHECK_EVERY_S = 60.0
+
+    def __init__(self, manager: BackupManager, interval_h: float = 24.0):
+        self.manager = manager
+        self.interval_h = interval_h
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="backup-scheduler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def is_due(self) -> bool:
+        if self.interval_h <= 0: return False
+        last = self.manager.last_snapshot_time()
+        return last is None or (datetime.now() - last).total_seconds() >= self.interval_h * 3600
+
+    def _loop(self):
+        while not self._stop.wait(self.CHECK_EVERY_S):
+            try:
+                if self.is_due(): self.manager.create_snapshot()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Sauvegarde planifiée échouée : {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sauvegardes GEN-CONTROL")
+    parser.add_argument("--dir", default=BackupManager.DEFAULT_DIR)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("create")
+    sub.add_parser("list")
+    p_verify = sub.add_parser("verify"); p_verify.add_argument("snapshot")
+    p_restore = sub.add_parser("restore"); p_restore.add_argument("snapshot")
+    args = parser.parse_args()
+
+    from database import ThreadSafeDatabase
+    manager = BackupManager(ThreadSafeDatabase.get_instance(), args.dir)
+    if args.cmd == "create":
+        m = manager.create_snapshot(label="manual")
+        print(f"{m['file']} : {m['size_bytes'] / 1e6:.1f} Mo -> {m['compressed_bytes'] / 1e6:.1f} Mo en {m['total_s']:.1f} s")
+    elif args.cmd == "list":
+        for m in manager.list_snapshots():
+            print(f"{m['created_at'][:19]}  {m['label']:<12} {m['size_bytes'] / 1e6:9.1f} Mo  {m['file']}")
+    elif args.cmd == "verify":
+        ok = manager.verify(manager.find(args.snapshot))
+        print("OK" if ok else "SOMME DE CONTRÔLE INVALIDE")
+        if not ok: raise SystemExit(1)
+    elif args.cmd == "restore":
+        manager.restore(manager.find(args.snapshot))
+        print("Base restaurée.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+# ==============================================================================
+# BENCHMARKS.PY - Mesures de Performance (Hors Streamlit)
+# Usage : python benchmarks.py connections [--queries 5000]
+#         python benchmarks.py query-plans [--db chemin.db]   (code retour 1 si scan complet)
+#         python benchmarks.py detector [--sizes 10000 100000 1000000]
+#         python benchmarks.py logins [--concurrency 100] [--cost 12]
+#         python benchmarks.py suite [--fleets 10 1000 100000] [--json out.json]
+#                                    [--compare reference.json] [--tolerance 0.25]
+# ==============================================================================
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from database import ThreadSafeDatabase
+from analytics import AdaptiveLearningEngine, DetailedLoadFactorManager, IntelligentAnomalyDetector
+from archive import AuditArchive
+from aggregates import FleetAggregates
+from passwords import PasswordHasher
+from physics import AtmosphericParams, IsoWillansModel, ReferenceEngineLibrary
+from reports import PDFReportGenerator
+from security import EnhancedSecurityManager
+
+
+def make_bench_database(db_path):
+    """Instance ThreadSafeDatabase isolée sur un fichier temporaire (hors singleton de l'app)"""
+    bench_cls = type("BenchDatabase", (ThreadSafeDatabase,), {"_instance": None, "DB_PATH": db_path})
+    return bench_cls.get_instance()
+
+
+def _seed_equipment(db, n=50):
+    for i in range(n):
+        db.execute_write(
+            "INSERT OR IGNORE INTO equipment (equipment_id, equipment_name, profile_base, power_kw) VALUES (?, ?, ?, ?)",
+            (f"EQ-{i:04d}", f"Engin {i}", "GENERIC_GE", 80.0)
+        )
+
+
+def _connect_per_call_read(db_path, query, params=()):
+    """Chemin historique : 1 connexion ouverte/fermée par requête"""
+    conn = sqlite3.connect(db_path, check_same_thread=False); conn.row_factory = sqlite3.Row
+    try: return conn.execute(query, params).fetchall()
+    finally: conn.close()
+
+
+def bench_connections(n_queries=5000):
+    """Compare les requêtes/s : connexion par appel vs pool de ThreadSafeDatabase"""
+    query = "SELECT equipment_id, equipment_name, profile_base, power_kw FROM equipment"
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        db = make_bench_database(db_path)
+        _seed_equipment(db)
+
+        t0 = time.perf_counter()
+        for _ in range(n_queries): _connect_per_call_read(db_path, query)
+        legacy_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        for _ in range(n_queries): db.execute_read(query)
+        pooled_s = time.perf_counter() - t0
+        db.reset_pool()
+
+    results = {
+        'queries': n_queries,
+        'connect_per_call_qps': n_queries / legacy_s,
+        'pooled_qps': n_queries / pooled_s,
+    }
+    results['speedup'] = results['pooled_qps'] / results['connect_per_call_qps']
+    return results
+
+
+def check_query_plans(db_path=None):
+    """EXPLAIN QUERY PLAN sur toutes les requêtes de HOT_QUERIES ; renvoie les scans complets"""
+    if db_path: return make_bench_database(db_path).find_full_scans()
+    with tempfile.TemporaryDirectory() as tmp:
+        db = make_bench_database(os.path.join(tmp, "plans.db"))
+        offenders = db.find_full_scans()
+        db.reset_pool()
+    return offenders
+
+
+def make_detection_dataset(n_obs, n_equipment=None, window=20, seed=42):
+    """Observations synthétiques (engin, écart %) + fenêtre historique par engin"""
+    rng = np.random.default_rng(seed)
+    n_equipment = n_equipment or max(1, n_obs // 50)
+    eq_names = np.array([f"EQ-{i:06d}" for i in range(n_equipment)], dtype=object)
+    equipment_ids = eq_names[rng.integers(0, n_equipment, n_obs)]
+    deviations = rng.normal(2.0, 12.0, n_obs)
+    # Tailles variées : démarrage à froid (< 3), historique partiel et fenêtre pleine
+    sizes = rng.integers(0, window + 1, n_equipment)
+    histories = {eq: list(rng.normal(0.0, rng.uniform(1.0, 10.0), size)) for eq, size in zip(eq_names, sizes)}
+    return equipment_ids, deviations, histories
+
+
+def bench_detector(sizes=(10_000, 100_000, 1_000_000), scalar_max=100_000):
+    """
+    detect_anomaly (boucle Python) vs detect_batch. Au-delà de scalar_max observations,
+    le temps scalaire est extrapolé à partir d'un échantillon (marqué 'scalar_estimated').
+    Les verdicts / Z-scores / sévérités / confiances de l'échantillon sont comparés.
+    """
+    detector = IntelligentAnomalyDetector()
+    results = []
+    for n in sizes:
+        eq_ids, devs, histories = make_detection_dataset(n)
+        t0 = time.perf_counter()
+        batch = detector.detect_batch(eq_ids, devs, histories)
+        batch_s = time.perf_counter() - t0
+
+        n_scalar = min(n, scalar_max)
+        t0 = time.perf_counter()
+        scalar = [detector.detect_anomaly(eq_ids[i], devs[i], histories[eq_ids[i]]) for i in range(n_scalar)]
+        scalar_s = (time.perf_counter() - t0) * (n / n_scalar)
+
+        mismatches = sum(
+            1 for i, r in enumerate(scalar)
+            if (r.verdict, r.severity, r.confidence) != (batch.verdict[i], batch.severity[i], batch.confidence[i])
+            or not (r.z_score == batch.z_score[i] or (np.isnan(r.z_score) and np.isnan(batch.z_score[i])))
+        )
+        results.append({
+            'observations': n, 'scalar_s': scalar_s, 'batch_s': batch_s,
+            'speedup': scalar_s / batch_s if batch_s else float('inf'),
+            'scalar_estimated': n_scalar < n, 'checked': n_scalar, 'mismatches': mismatches,
+        })
+    return results
+
+
+def bench_logins(concurrency=100, cost=PasswordHasher.DEFAULT_ROUNDS, n_users=10):
+    """
+    Charge : `concurrency` connexions simultanées via EnhancedSecurityManager.verify_password,
+    avec l'admission par défaut du pool (latences = connexions acceptées, les refus sont comptés à part)
+    """
+    hasher = PasswordHasher(rounds=cost)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = make_bench_database(os.path.join(tmp, "logins.db"))
+        sec = EnhancedSecurityManager(db, hasher=hasher)
+        for i in range(n_users): sec.create_user(f"operateur{i}", "terrain-2025")
+
+        for _ in range(10):  # Étalonnage du coût, comme au démarrage de l'application
+            if hasher.metrics()['cost_ms']: break
+            time.sleep(0.5)
+        latencies, rejected_ms, failures = [], [], []
+        start = threading.Barrier(concurrency)
+        def _login(i):
+            start.wait()
+            t0 = time.perf_counter()
+            ok, msg = sec.verify_password(f"operateur{i % n_users}", "terrain-2025", "127.0.0.1")
+            (latencies if ok else rejected_ms).append(time.perf_counter() - t0)
+            if not ok: failures.append(msg)
+
+        threads = [threading.Thread(target=_login, args=(i,)) for i in range(concurrency)]
+        t0 = time.perf_counter()
+        for t in threads: t.start()
+        for t in threads: t.join()
+        wall_s = time.perf_counter() - t0
+        db.reset_pool()
+
+    def pct(values, q):
+        lat = sorted(values)
+        return lat[min(len(lat) - 1, int(q * len(lat)))] * 1000 if lat else 0.0
+    hm = hasher.metrics()
+    return {
+        'concurrency': concurrency, 'cost': cost, 'workers': hasher.max_workers, 'cost_ms': hm['cost_ms'], 'max_wait_ms': hm['max_wait_ms'],
+        'wall_s': wall_s, 'p50_ms': pct(latencies, 0.50), 'p95_ms': pct(latencies, 0.95), 'p99_ms': pct(latencies, 0.99),
+        'failures': len(failures) - hm['rejected'], 'rejected': hm['rejected'], 'rejected_p99_ms': pct(rejected_ms, 0.99),
+    }
+
+
+# --- SUITE DE BOUT EN BOUT (résultats JSON comparables entre commits) ---
+SUITE_FLEETS = (10, 1_000, 100_000)
+SUITE_SCHEMA = 1
+AUDIT_INSERT = (
+    "INSERT INTO audits (audit_uuid, timestamp, created_by, equipment_id, materiel_type, materiel_name, scenario_code, "
+    "index_start, index_end, power_kw, fuel_declared_l, estimated_min, estimated_typ, estimated_max, uncertainty_pct, "
+    "deviation_pct, z_score, verdict, confidence_pct, validated_by_operator) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+_SCENARIO_CATEGORY = {'GE': 'GE', 'TRUCK': 'TRUCK', 'OTHER': 'TP'}
+
+
+def make_fleet(n_machines, seed=42):
+    """Parc synthétique : (equipment_id, code moteur, puissance kW, scénario) par machine"""
+    rnd = random.Random(seed)
+    engines = sorted(ReferenceEngineLibrary.ENGINE_DB)
+    scenarios = {cat: sorted(c for c, s in DetailedLoadFactorManager.LOAD_SCENARIOS.items() if s.category == cat) for cat in ('GE', 'TRUCK', 'TP')}
+    fleet = []
+    for i in range(n_machines):
+        code = rnd.choice(engines)
+        meta = ReferenceEngineLibrary.get_metadata(code)
+        fleet.append((f"EQ-{i:06d}", code, meta['power'], rnd.choice(scenarios[_SCENARIO_CATEGORY[meta['type']]])))
+    return fleet
+
+
+def make_audit_rows(fleet, audits_per_machine, seed=42, start=None):
+    """Audits synthétiques (ordre de AUDIT_INSERT), écarts ~ N(2, 12) %, étalés sur un an"""
+    rng = np.random.default_rng(seed)
+    n = len(fleet) * audits_per_machine
+    idx = np.tile(np.arange(len(fleet)), audits_per_machine)  # Audits de chaque engin étalés sur la période
+    codes = [fleet[i][1] for i in idx]
+    k, b = IsoWillansModel.coefficients_for_engines(codes)
+    power = np.array([fleet[i][2] for i in idx])
+    load = np.array([DetailedLoadFactorManager.LOAD_SCENARIOS[fleet[i][3]].load_typ * 100 for i in idx])
+    hours = rng.uniform(2.0, 12.0, n)
+    est = IsoWillansModel.predict_consumption_array(load, 0, 25, 1.05, power, k, b) * hours
+    dev = rng.normal(2.0, 12.0, n)
+    fuel = est * (1 + dev / 100)
+    start = start or datetime.now() - timedelta(days=365)
+    offsets = np.sort(rng.uniform(0, 365 * 86400, n))
+    verdicts = np.where(np.abs(dev) > 30, 'ANOMALIE', np.where(np.abs(dev) > 20, 'SUSPECT', 'NORMAL'))
+    return [
+        (str(uuid.uuid4()), (start + timedelta(seconds=float(offsets[j]))).isoformat(), f"operateur{j % 20}",
+         fleet[i][0], fleet[i][1], f"Engin {i}", fleet[i][3], 0.0, float(hours[j]), fleet[i][2], float(fuel[j]),
+         float(est[j]) * 0.9, float(est[j]), float(est[j]) * 1.1, 10.0, float(dev[j]), 0.0, str(verdicts[j]), 90, 1)
+        for j, i in enumerate(idx)
+    ]
+
+
+def make_fleet_database(db_path, n_machines, audits_per_machine=5, seed=42, chunk=50_000):
+    """Base de bench peuplée : n_machines engins et leurs audits (écritures groupées)"""
+    db = make_bench_database(db_path)
+    fleet = make_fleet(n_machines, seed)
+    db.execute_many(
+        "INSERT INTO equipment (equipment_id, equipment_name, profile_base, power_kw) VALUES (?, ?, ?, ?)",
+        [(eq, f"Engin {i}", code, power) for i, (eq, code, power, _) in enumerate(fleet)]
+    )
+    rows = make_audit_rows(fleet, audits_per_machine, seed)
+    for i in range(0, len(rows), chunk): db.execute_many(AUDIT_INSERT, rows[i:i + chunk])
+    return db, fleet
+
+
+def _measure(fn, ops, repeat):
+    """fn() exécute `ops` opérations ; médiane/min sur `repeat` essais, ramenés à une opération"""
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter(); fn(); runs.append((time.perf_counter() - t0) / ops)
+    med = statistics.median(runs)
+    return {'ops': ops, 'repeat': repeat, 'median_us': med * 1e6, 'min_us': min(runs) * 1e6,
+            'max_us': max(runs) * 1e6, 'ops_per_s': 1 / med if med else float('inf')}
+
+
+def _suite_fleet(n_machines, repeat, audits_per_machine, seed, sample=2_000):
+    """Mesures dépendant de la taille du parc (une base temporaire par taille)"""
+    rnd = random.Random(seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        db, fleet = make_fleet_database(os.path.join(tmp, "suite.db"), n_machines, audits_per_machine, seed)
+        seed_s = time.perf_counter() - t0
+        picks = [rnd.choice(fleet) for _ in range(min(sample, 10 * n_machines))]
+        atmo = AtmosphericParams(0, 25)
+        models = [IsoWillansModel.from_reference_data(code, power) for _, code, power, _ in picks]
+        loads = [DetailedLoadFactorManager.LOAD_SCENARIOS[sc].load_typ * 100 for *_, sc in picks]
+        detector = IntelligentAnomalyDetector()
+        eq_ids, devs, histories = make_detection_dataset(len(picks), n_equipment=n_machines, seed=seed)
+        learning = AdaptiveLearningEngine(min_samples=3)
+        archive = AuditArchive(db)
+        fleet_stats = FleetAggregates(db)
+        period = (date.today() - timedelta(days=400), date.today() + timedelta(days=1))
+        fresh = make_audit_rows(fleet, -(-1000 // n_machines), seed + 1)[:1000]  # >= 1000 nouveaux audits
+
+        def _predict():
+            for model, load in zip(models, loads): model.predict_consumption(load, atmo, aging_factor=1.05)
+        def _detect():
+            for eq, dev in zip(eq_ids, devs): detector.detect_anomaly(eq, dev, histories[eq])
+        def _last_audit():
+            for eq, *_ in picks[:500]: archive.latest("equipment_id = ?", (eq,), 1, "index_end")
+        def _history_page():
+            for eq, *_ in picks[:500]: db.paginate("audits", ("timestamp",), "audit_uuid, verdict", "equipment_id = ?", (eq,), page_size=20, descending=True)
+        def _dashboard():
+            fleet_stats.kpis(*period); fleet_stats.by_month(*period); fleet_stats.by_equipment(*period); fleet_stats.by_scenario(*period)
+        def _write_one():
+            for row in fresh[:200]: db.execute_write(AUDIT_INSERT, (str(uuid.uuid4()), *row[1:]))
+        def _write_batch():
+            db.execute_many(AUDIT_INSERT, [(str(uuid.uuid4()), *row[1:]) for row in fresh[:1000]])
+
+        cases = {
+            'predict_consumption': (_predict, len(picks)),
+            'detect_anomaly': (_detect, len(picks)),
+            'batch_learn': (lambda: learning.batch_learn_from_all_equipment(db), 1),
+            'db_read_last_audit': (_last_audit, len(picks[:500])),
+            'db_read_history_page': (_history_page, len(picks[:500])),
+            'fleet_dashboard': (_dashboard, 1),
+            'db_write_audit': (_write_one, len(fresh[:200])),
+            'db_write_batch_1000': (_write_batch, 1),
+        }
+        results = [{'name': name, 'fleet': n_machines, **_measure(fn, ops, repeat)} for name, (fn, ops) in cases.items()]
+        results.append({'name': 'seed_database', 'fleet': n_machines, 'ops': 1, 'repeat': 1,
+                        'median_us': seed_s * 1e6, 'min_us': seed_s * 1e6, 'max_us': seed_s * 1e6, 'ops_per_s': 1 / seed_s})
+        db.reset_pool()
+    return results
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError): return None
+
+
+def bench_suite(fleets=SUITE_FLEETS, repeat=5, audits_per_machine=5, seed=42):
+    """
+    Pipeline d'audit de bout en bout sur des parcs synthétiques (prédiction, détection,
+    apprentissage, lectures/écritures SQLite) + rendu PDF (indépendant du parc, fleet = 0).
+    Données déterministes (seed) : deux exécutions sur la même machine sont comparables.
+    """
+    generator = PDFReportGenerator()
+    pdf_data = {'audit_uuid': str(uuid.UUID(int=seed)), 'equipment_name': "Engin 0", 'user': "operateur0",
+                'fuel_declared': 120.0, 'fuel_estimated': 100.0, 'deviation': 20.0, 'verdict': 'SUSPECT',
+                'scenario': 'GE_OFFICE_AC', 'hours': 8.0}
+    results = [{'name': 'pdf_audit_report', 'fleet': 0,
+                **_measure(lambda: [generator.generate_audit_report(pdf_data) for _ in range(5)], 5, repeat)}]
+    for n in fleets: results.extend(_suite_fleet(n, repeat, audits_per_machine, seed))
+    return {
+        'schema': SUITE_SCHEMA, 'created_at': datetime.now().isoformat(), 'commit': _git_commit(),
+        'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+        'params': {'fleets': list(fleets), 'repeat': repeat, 'audits_per_machine': audits_per_machine, 'seed': seed},
+        'results': results,
+    }
+
+
+def compare_suites(reference, current, tolerance=0.25):
+    """Lignes (nom, parc, réf µs, actuel µs, ratio, régression) ; régression si médiane > réf * (1 + tolérance)"""
+    ref = {(r['name'], r['fleet']): r for r in reference['results'] if r['name'] != 'seed_database'}
+    rows = []
+    for r in current['results']:
+        base = ref.get((r['name'], r['fleet']))
+        if base is None: continue
+        ratio = r['median_us'] / base['median_us'] if base['median_us'] else float('inf')
+        rows.append((r['name'], r['fleet'], base['median_us'], r['median_us'], ratio, ratio > 1 + tolerance))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks GEN-CONTROL")
+    sub = parser.add_subparsers(dest="bench", required=True)
+    p_conn = sub.add_parser("connections", help="Pool de connexions vs connexion par requête")
+    p_conn.add_argument("--queries", type=int, default=5000)
+    p_plans = sub.add_parser("query-plans", help="Échoue si une requête applicative fait un scan complet")
+    p_plans.add_argument("--db", default=None, help="Base à contrôler (défaut : base vierge temporaire)")
+    p_det = sub.add_parser("detector", help="detect_anomaly scalaire vs detect_batch")
+    p_det.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    p_det.add_argument("--scalar-max", type=int, default=100_000, help="Au-delà, temps scalaire extrapolé")
+    p_login = sub.add_parser("logins", help="Latence de connexion sous charge (bcrypt)")
+    p_login.add_argument("--concurrency", type=int, default=100)
+    p_login.add_argument("--cost", type=int, default=PasswordHasher.DEFAULT_ROUNDS)
+    p_suite = sub.add_parser("suite", help="Pipeline d'audit de bout en bout, résultats JSON")
+    p_suite.add_argument("--fleets", type=int, nargs="+", default=list(SUITE_FLEETS), help="Tailles de parc (machines)")
+    p_suite.add_argument("--repeat", type=int, default=5)
+    p_suite.add_argument("--audits-per-machine", type=int, default=5)
+    p_suite.add_argument("--seed", type=int, default=42)
+    p_suite.add_argument("--json", default=None, help="Fichier de résultats (défaut : sortie standard)")
+    p_suite.add_argument("--compare", default=None, help="Résultats de référence : code retour 1 si régression")
+    p_suite.add_argument("--tolerance", type=float, default=0.25, help="Ralentissement toléré (0.25 = +25 %%)")
+    args = parser.parse_args()
+
+    if args.bench == "connections":
+        res = bench_connections(args.queries)
+        print(f"Connexion par appel : {res['connect_per_call_qps']:.0f} req/s")
+        print(f"Pool                : {res['pooled_qps']:.0f} req/s  (x{res['speedup']:.1f})")
+    elif args.bench == "query-plans":
+        offenders = check_query_plans(args.db)
+        for name, plan in offenders.items():
+            print(f"SCAN COMPLET : {name} -> {' | '.join(plan)}")
+        if offenders: sys.exit(1)
+        print("OK : aucune requête applicative ne parcourt une table complète.")
+    elif args.bench == "detector":
+        results = bench_detector(args.sizes, args.scalar_max)
+        for res in results:
+            est = " (extrapolé)" if res['scalar_estimated'] else ""
+            print(f"{res['observations']:>9} obs | scalaire {res['scalar_s']:8.3f} s{est} | lot {res['batch_s']:7.3f} s "
+                  f"| x{res['speedup']:.0f} | écarts {res['mismatches']}/{res['checked']}")
+        if any(res['mismatches'] for res in results): sys.exit(1)
+    elif args.bench == "logins":
+        res = bench_logins(args.concurrency, args.cost)
+        print(f"{res['concurrency']} connexions simultanées (coût {res['cost']} = {res['cost_ms']:.0f} ms, {res['workers']} workers, attente max {res['max_wait_ms']:.0f} ms) en {res['wall_s']:.2f} s")
+        print(f"Acceptées : p50 {res['p50_ms']:.0f} ms | p95 {res['p95_ms']:.0f} ms | p99 {res['p99_ms']:.0f} ms | échecs {res['failures']}")
+        print(f"Refusées (HasherBusyError) : {res['rejected']} | p99 {res['rejected_p99_ms']:.0f} ms")
+    elif args.bench == "suite":
+        suite = bench_suite(args.fleets, args.repeat, args.audits_per_machine, args.seed)
+        if args.json:
+            with open(args.json, "w") as f: json.dump(suite, f, indent=2)
+            for r in suite['results']:
+                print(f"{r['name']:<22} {r['fleet']:>7} engins | {r['median_us']:12.1f} µs/op | {r['ops_per_s']:12.1f} op/s")
+        else: print(json.dumps(suite, indent=2))
+        if args.compare:
+            with open(args.compare) as f: reference = json.load(f)
+            rows = compare_suites(reference, suite, args.tolerance)
+            for name, fleet, ref_us, cur_us, ratio, slow in rows:
+                print(f"{'RÉGRESSION' if slow else 'ok':<10} {name:<22} {fleet:>7} engins | {ref_us:10.1f} -> {cur_us:10.1f} µs (x{ratio:.2f})", file=sys.stderr)
+            if any(row[-1] for row in rows): sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
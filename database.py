@@ -1,39 +1,497 @@
 # ==============================================================================
 # DATABASE.PY - VERSION CORRECTIVE (Fixe le crash Admin)
 # ==============================================================================
+import importlib
+import os
+import re
 import sqlite3
 import threading
-import bcrypt
+import queue
+import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from passwords import PasswordHasher
+from shared_cache import SharedCache
+from metrics import METRICS
+
+# ------------------------------------------------------------------------------
+# INDEX VERSIONNÉS : incrémenter INDEX_VERSION à chaque modification de la liste
+# ------------------------------------------------------------------------------
+INDEX_VERSION = 6
+INDEXES = {
+    # Historique récent d'un engin (index_end suggéré, fenêtre Z-score)
+    'idx_audits_equipment_ts': "audits (equipment_id, timestamp)",
+    # Quota DISCOVERY + rapports de flotte par opérateur et période
+    'idx_audits_created_by_ts': "audits (created_by, timestamp)",
+    # Rapports / exports par période (toute la flotte)
+    'idx_audits_ts': "audits (timestamp)",
+    # Apprentissage : audits NORMAUX groupés par couple engin/scénario
+    'idx_audits_verdict_eq_scenario': "audits (verdict, equipment_id, scenario_code)",
+    # Anti-abus inscription
+    'idx_users_signup_ip': "users (signup_ip, created_at)",
+    # Paiements en attente / historique
+    'idx_tx_username_status': "transactions (username, status)",
+    'idx_tx_status_ts': "transactions (status, timestamp)",
+    'idx_tx_timestamp': "transactions (timestamp)",
+    # Grilles paginées (tri par date de création)
+    'idx_users_created': "users (created_at)",
+    'idx_equipment_created': "equipment (created_at)",
+    # Travaux de fond : file (statut + échéance) et moniteur (plus récents d'abord)
+    'idx_jobs_status_scheduled': "jobs (status, scheduled_at)",
+    'idx_jobs_type_created': "jobs (job_type, created_at)",
+    'idx_jobs_created': "jobs (created_at)",
+    # Fenêtres Z-score / états de dérive réécrits par un autre processus (_refresh des caches)
+    'idx_rolling_stats_updated': "equipment_rolling_stats (last_updated)",
+    'idx_drift_state_updated': "equipment_drift_state (last_updated)",
+}
+# Index remplacés par une version précédente (supprimés au démarrage)
+OBSOLETE_INDEXES = ['idx_audits_created_by']
+
+# ------------------------------------------------------------------------------
+# AGRÉGATS MATÉRIALISÉS : engin × scénario × jour (et × mois), tenus à jour par triggers
+# Incrémenter AGGREGATE_VERSION à chaque modification : triggers recréés, agrégats recalculés
+# ------------------------------------------------------------------------------
+AGGREGATE_VERSION = 1
+AGGREGATE_TABLES = {'audit_daily_aggregates': ('day', 10), 'audit_monthly_aggregates': ('month', 7)}
+AGGREGATE_MEASURES = {
+    'n_audits': "1",
+    'hours': "COALESCE({r}.index_end - {r}.index_start, 0)",
+    'fuel_declared_l': "COALESCE({r}.fuel_declared_l, 0)",
+    'fuel_estimated_l': "COALESCE({r}.estimated_typ, 0)",
+    'deviation_sum': "COALESCE({r}.deviation_pct, 0)",
+    'n_normal': "CASE WHEN {r}.verdict = 'NORMAL' THEN 1 ELSE 0 END",
+    'n_suspect': "CASE WHEN {r}.verdict = 'SUSPECT' THEN 1 ELSE 0 END",
+    'n_anomalie': "CASE WHEN {r}.verdict = 'ANOMALIE' THEN 1 ELSE 0 END",
+}
+AGGREGATE_UPDATE_COLUMNS = "timestamp, equipment_id, scenario_code, index_start, index_end, fuel_declared_l, estimated_typ, deviation_pct, verdict"
+
+
+def aggregate_upsert_sql(table, row, sign="", source=None):
+    """
+    Ajoute (sign "") ou retire (sign "-") un audit `row` (NEW / OLD dans un trigger) de `table` ;
+    avec source (alias de base), agrège toute la table audits de cette base (recalcul).
+    """
+    key, width = AGGREGATE_TABLES[table]
+    if source is None: values, tail = ", ".join(f"{sign}({e.format(r=row)})" for e in AGGREGATE_MEASURES.values()), ""
+    else: values, tail = ", ".join(f"SUM({e.format(r=row)})" for e in AGGREGATE_MEASURES.values()), f" FROM {source}.audits AS {row}"
+    return (
+        f"INSERT INTO {table} ({key}, equipment_id, scenario_code, {', '.join(AGGREGATE_MEASURES)}) "
+        f"SELECT substr({row}.timestamp, 1, {width}), {row}.equipment_id, COALESCE({row}.scenario_code, ''), {values}{tail} "
+        f"WHERE {row}.timestamp IS NOT NULL AND {row}.equipment_id IS NOT NULL" + (" GROUP BY 1, 2, 3" if source else "")
+        + f" ON CONFLICT ({key}, equipment_id, scenario_code) DO UPDATE SET "
+        + ", ".join(f"{m} = {m} + excluded.{m}" for m in AGGREGATE_MEASURES)
+    )
+
+
+def aggregate_trigger_ddl():
+    """
+    Pas de trigger DELETE : le seul effacement d'audits est le déplacement vers les archives,
+    et les audits archivés restent comptés dans les agrégats.
+    """
+    upserts = lambda row, sign: "; ".join(aggregate_upsert_sql(t, row, sign) for t in AGGREGATE_TABLES)
+    return {
+        'trg_audits_agg_insert': f"CREATE TRIGGER trg_audits_agg_insert AFTER INSERT ON audits BEGIN {upserts('NEW', '')}; END",
+        'trg_audits_agg_update': (
+            f"CREATE TRIGGER trg_audits_agg_update AFTER UPDATE OF {AGGREGATE_UPDATE_COLUMNS} ON audits "
+            f"BEGIN {upserts('OLD', '-')}; {upserts('NEW', '')}; END"
+        ),
+    }
+
+# ------------------------------------------------------------------------------
+# REQUÊTES CONTRÔLÉES : chaque module déclare ses requêtes chaudes avec hot_query()
+# et exécute la constante renvoyée. tests/test_query_plans.py (et `python benchmarks.py
+# query-plans`) passent le SQL réellement émis à EXPLAIN QUERY PLAN.
+# ------------------------------------------------------------------------------
+HOT_QUERIES = {}  # nom -> (SQL, paramètres factices, scan complet toléré : True ou tables lues en entier à dessein)
+QUERY_MODULES = ('database', 'analytics', 'archive', 'aggregates', 'drift', 'exports', 'jobs', 'payments', 'reaudit', 'report_service', 'security')
+
+
+def hot_query(name, sql, params=(), allow_scan=False):
+    """Enregistre une requête applicative pour le contrôle des plans ; renvoie sql inchangé"""
+    if HOT_QUERIES.get(name, (sql,))[0] != sql: raise ValueError(f"Requête contrôlée déclarée deux fois : {name}")
+    HOT_QUERIES[name] = (sql, params, allow_scan)
+    return sql
+
+
+def registered_hot_queries():
+    """Importe les modules déclarants : la liste couvre toute l'application (hors app.py, qui utilise leurs constantes)"""
+    for module in QUERY_MODULES: importlib.import_module(module)
+    return dict(HOT_QUERIES)
+
+
+def keyset_page_sql(table, order_by, columns="*", where="", with_cursor=False, descending=False):
+    """Requête d'une page par clé (voir ThreadSafeDatabase.paginate) : tri order_by puis rowid"""
+    keys = [*order_by, "rowid"]
+    direction, op = ("DESC", "<") if descending else ("ASC", ">")
+    clauses = [f"({where})"] if where else []
+    if with_cursor: clauses.append(f"({', '.join(keys)}) {op} ({', '.join('?' * len(keys))})")
+    return (
+        f"SELECT {columns}, {', '.join(f'{k} AS _k{i}' for i, k in enumerate(keys))} FROM {table}"
+        + (f" WHERE {' AND '.join(clauses)}" if clauses else "")
+        + f" ORDER BY {', '.join(f'{k} {direction}' for k in keys)} LIMIT ?"
+    )
+
+
+def paged_grid(name, table, order_by, columns, descending=True, samples=(("", ()),)):
+    """
+    Grille paginée de l'Admin : (table, tri, colonnes, sens), passée telle quelle à fetch_page.
+    samples = filtres (where, paramètres) que l'écran peut composer, contrôlés avec et sans curseur.
+    """
+    cursor = ("2025-01-01",) * len(order_by) + (10,)
+    for i, (where, params) in enumerate(samples):
+        for with_cursor in (False, True):
+            hot_query(f"page_{name}_{i}{'_next' if with_cursor else ''}", keyset_page_sql(table, order_by, columns, where, with_cursor, descending),
+                      (*params, *(cursor if with_cursor else ()), 26))
+    return table, tuple(order_by), columns, descending
+
+
+CONFIG_VALUE = hot_query("config_value", "SELECT value FROM app_config WHERE key = ?", ("AGING_FACTOR",))
+EQUIPMENT_LIST = hot_query("equipment_list", "SELECT equipment_id, equipment_name, profile_base, power_kw FROM equipment ORDER BY created_at DESC", (), True)
+USER_ROLE = hot_query("user_role", "SELECT role, license_tier FROM users WHERE username = ?", ("admin",))
+USER_PROFILE = hot_query("user_profile", "SELECT * FROM users WHERE username = ?", ("admin",))
+TX_OWNER = hot_query("tx_owner", "SELECT username FROM transactions WHERE tx_ref = ?", ("REF",))
+
+# Grilles de l'Admin (filtres : préfixe d'identifiant en intervalle, listes déroulantes en égalité)
+GRID_EQUIPMENT = paged_grid("equipment", "equipment", ("created_at",), "equipment_id, equipment_name, profile_base, power_kw, created_at", samples=(
+    ("", ()), ("equipment_id >= ? AND equipment_id < ? AND profile_base = ?", ("GE", "GE\uffff", "GENERIC_GE"))))
+GRID_USERS = paged_grid("users", "users", ("created_at",), "id, username, role, license_tier, email, phone, company_name, subscription_end, signup_ip, created_at", samples=(
+    ("", ()), ("username >= ? AND username < ? AND role = ? AND license_tier = ?", ("a", "a\uffff", "user", "PRO"))))
+GRID_TX_PENDING = paged_grid("tx_pending", "transactions", ("timestamp",), "*", descending=False, samples=(("status = 'PENDING'", ()),))
+GRID_TX_HISTORY = paged_grid("tx_history", "transactions", ("timestamp",), "*", samples=(
+    ("status != 'PENDING'", ()), ("status = ? AND username = ?", ("APPROVED", "user"))))
+GRID_JOBS = paged_grid("jobs", "jobs", ("created_at",), "job_id, job_type, status, created_by, created_at, started_at, finished_at, attempts, max_retries, progress_done, progress_total, message, error", samples=(
+    ("", ()), ("status = ? AND job_type = ?", ("DONE", "learn"))))
 
 class ThreadSafeDatabase:
     _instance = None
     _lock = threading.Lock()
 
+    DB_PATH = "gen_control_v1_1_secure.db"
+    DEFAULT_POOL_SIZE = 8           # Surchargé par app_config.DB_POOL_SIZE
+    POOL_TIMEOUT_S = 30.0           # Attente max d'une connexion libre
+    HEALTH_CHECK_INTERVAL_S = 30.0  # Une connexion inactive plus longtemps est revérifiée
+
+    # Pragmas appliqués à chaque connexion (clé app_config -> (pragma, défaut))
+    PRAGMA_DEFAULTS = {
+        'DB_SYNCHRONOUS': ('synchronous', 'NORMAL'),      # Sûr en WAL, évite un fsync par commit
+        'DB_CACHE_SIZE': ('cache_size', '-20000'),        # Négatif = KiB (~20 Mo par connexion)
+        'DB_MMAP_SIZE': ('mmap_size', '268435456'),       # 256 Mo de lecture mappée
+        'DB_BUSY_TIMEOUT_MS': ('busy_timeout', '5000'),   # Attente du verrou fichier
+    }
+    SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
     def __new__(cls):
         if cls._instance is None:
             with cls._lock:
                 if cls._instance is None:
                     cls._instance = super(ThreadSafeDatabase, cls).__new__(cls)
-                    cls._instance.db_path = "gen_control_v1_1_secure.db"
+                    cls._instance.db_path = cls.DB_PATH
+                    cls._instance.archive_dir = f"{os.path.splitext(cls.DB_PATH)[0]}_archive"
                     cls._instance._init_database()
+                    cls._instance._init_pool()
         return cls._instance
 
     def get_connection(self):
         return sqlite3.connect(self.db_path, check_same_thread=False)
 
-    def execute_read(self, query, params=()):
-        with self._lock:
-            conn = self.get_connection(); conn.row_factory = sqlite3.Row; cursor = conn.cursor()
-            try: cursor.execute(query, params); return cursor.fetchall()
+    # --- MODE WAL & PRAGMAS (Lecteurs concurrents, écrivain unique) ---
+    def _load_pragmas(self):
+        pragmas = []
+        for key, (name, default) in self.PRAGMA_DEFAULTS.items():
+            value = str(self._read_config_raw(key, default)).strip().upper()
+            if name == 'synchronous':
+                if value not in self.SYNCHRONOUS_MODES: value = default
+            else:
+                try: value = str(int(value))
+                except ValueError: value = default
+            pragmas.append((name, value))
+        return pragmas
+
+    def _configure_connection(self, conn):
+        self._sync_pragmas(conn)
+        self._sync_attachments(conn)
+        return conn
+
+    def _sync_pragmas(self, conn):
+        # À chaque sortie du pool : une connexion occupée pendant reload_pragmas est mise à jour ensuite
+        version, pragmas = self._pragma_state
+        if self._conn_pragma_version.get(id(conn)) == version: return
+        for name, value in pragmas:
+            conn.execute(f"PRAGMA {name} = {value}")
+        self._conn_pragma_version[id(conn)] = version
+
+    # --- ARCHIVES ATTACHÉES (une base SQLite par année, voir archive.py) ---
+    ARCHIVE_FILE_RE = re.compile(r"audits_(\d{4})\.db")
+
+    def archive_path(self, year):
+        return os.path.join(self.archive_dir, f"audits_{int(year)}.db")
+
+    def _scan_archives(self):
+        """alias -> chemin des archives présentes sur disque"""
+        if not os.path.isdir(self.archive_dir): return {}
+        found = {}
+        for fname in sorted(os.listdir(self.archive_dir)):
+            m = self.ARCHIVE_FILE_RE.fullmatch(fname)
+            if m: found[f"arch_{m.group(1)}"] = os.path.join(self.archive_dir, fname)
+        return found
+
+    @property
+    def attached(self):
+        return dict(self._attached)
+
+    def refresh_archives(self):
+        """Attache les archives créées depuis le démarrage (ex. par la CLI dans un autre processus)"""
+        for alias, path in self._scan_archives().items():
+            if alias not in self._attached: self.attach_database(alias, path)
+
+    def attach_database(self, alias, path):
+        """Enregistre une base attachée ; chaque connexion l'attache à sa prochaine utilisation"""
+        with self._pool_lock:
+            if self._attached.get(alias) == path: return
+            self._attached = {**self._attached, alias: path}
+            self._attach_version += 1
+
+    def _sync_attachments(self, conn):
+        # Hors transaction uniquement (connexions inactives du pool ou écrivain entre deux commits)
+        version = self._attach_version
+        if self._conn_attach_version.get(id(conn)) == version: return
+        present = {row[1] for row in conn.execute("PRAGMA database_list")}
+        for alias, path in self._attached.items():
+            if alias not in present: conn.execute(f"ATTACH DATABASE ? AS {alias}", (path,))
+        self._conn_attach_version[id(conn)] = version
+
+    def reload_pragmas(self):
+        """Relit les pragmas dans app_config ; chaque connexion les applique à sa prochaine utilisation"""
+        pragmas = self._load_pragmas()
+        with self._pool_lock: self._pragma_state = (self._pragma_state[0] + 1, pragmas)
+
+    # --- POOL DE CONNEXIONS (Lecteurs réutilisables + 1 écrivain dédié) ---
+    def _init_pool(self):
+        try: size = int(self._read_config_raw("DB_POOL_SIZE", self.DEFAULT_POOL_SIZE))
+        except (TypeError, ValueError): size = self.DEFAULT_POOL_SIZE
+        self.pool_size = max(1, size)
+        self._pragma_state = (0, self._load_pragmas())  # (version, pragmas) remplacés ensemble
+        self._conn_pragma_version = {}  # id(connexion) -> version des pragmas appliquée
+        self._write_lock = threading.Lock()
+        conn = self.get_connection()
+        try: self.journal_mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+        finally: conn.close()
+        self._readers = queue.LifoQueue(maxsize=self.pool_size)  # (conn, dernier_usage)
+        self._readers_created = 0
+        self._pool_lock = threading.Lock()
+        self._file_gate = threading.Event(); self._file_gate.set()  # Fermé pendant un remplacement de fichier
+        self._writer = None
+        self._writer_last_used = 0.0
+        # Config / parc / profils appris partagés entre sessions (invalidés à chaque écriture)
+        self.cache = SharedCache()
+        self._attached = self._scan_archives()
+        self._attach_version = 0
+        self._conn_attach_version = {}  # id(connexion) -> version des attachements appliquée
+
+    def _read_config_raw(self, key, default):
+        """Lecture de config hors pool (utilisée pendant l'initialisation)"""
+        conn = self.get_connection()
+        try:
+            row = conn.execute("SELECT value FROM app_config WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else default
+        finally: conn.close()
+
+    def _open_reader(self):
+        conn = self._configure_connection(self.get_connection()); conn.row_factory = sqlite3.Row
+        return conn
+
+    def _is_healthy(self, conn, last_used):
+        if time.monotonic() - last_used < self.HEALTH_CHECK_INTERVAL_S: return True
+        try: conn.execute("SELECT 1").fetchone(); return True
+        except sqlite3.Error: return False
+
+    def _discard(self, conn):
+        self._conn_attach_version.pop(id(conn), None)
+        self._conn_pragma_version.pop(id(conn), None)
+        try: conn.close()
+        except sqlite3.Error: pass
+
+    def _acquire_reader(self):
+        while True:
+            if not self._file_gate.is_set() and not self._file_gate.wait(self.POOL_TIMEOUT_S):
+                raise sqlite3.OperationalError("Restauration en cours")
+            try: conn, last_used = self._readers.get_nowait()
+            except queue.Empty:
+                with self._pool_lock:
+                    # Porte vérifiée sous le verrou : aucune connexion créée après le décompte d'un remplacement
+                    if not self._file_gate.is_set(): continue
+                    create = self._readers_created < self.pool_size
+                    if create: self._readers_created += 1
+                if create: return self._open_reader()
+                try: conn, last_used = self._readers.get(timeout=self.POOL_TIMEOUT_S)
+                except queue.Empty: raise sqlite3.OperationalError("Pool de connexions saturé")
+            break
+        if not self._is_healthy(conn, last_used):
+            self._discard(conn); conn = self._open_reader()
+        self._sync_pragmas(conn)
+        self._sync_attachments(conn)
+        return conn
+
+    def _release_reader(self, conn):
+        try: self._readers.put_nowait((conn, time.monotonic()))
+        except queue.Full:
+            # Pool réduit entre-temps : on ferme l'excédent
+            self._discard(conn)
+            with self._pool_lock: self._readers_created -= 1
+
+    def _get_writer(self):
+        """Connexion d'écriture unique (appelée sous _write_lock)"""
+        if self._writer is None or not self._is_healthy(self._writer, self._writer_last_used):
+            if self._writer is not None: self._discard(self._writer)
+            self._writer = self._configure_connection(self.get_connection())
+        self._sync_pragmas(self._writer)
+        self._sync_attachments(self._writer)
+        self._writer_last_used = time.monotonic()
+        return self._writer
+
+    def reset_pool(self):
+        """Ferme toutes les connexions inactives (ex: avant une restauration de fichier)"""
+        with self._write_lock:
+            while True:
+                try: conn, _ = self._readers.get_nowait()
+                except queue.Empty: break
+                self._discard(conn)
+                with self._pool_lock: self._readers_created -= 1
+            if self._writer is not None:
+                self._discard(self._writer); self._writer = None
+        self.cache.clear()  # Le fichier peut avoir été remplacé
+
+    def replace_database_file(self, new_path, archives=None):
+        """
+        Restauration : remplace atomiquement le fichier de base par new_path.
+        Sous le verrou écrivain, les nouvelles lectures sont suspendues et les lectures en cours
+        terminées (connexions rendues au pool) ; le WAL est intégré puis toutes les connexions
+        fermées avant os.replace. Le schéma courant est ensuite réappliqué (migrations, index).
+        archives (alias -> fichier) : jeu complet d'archives installé en même temps ; les archives
+        absentes du jeu sont supprimées (leurs audits sont dans la base restaurée). None : inchangées.
+        """
+        with self._write_lock:
+            drained = []
+            try:
+                with self._pool_lock:
+                    self._file_gate.clear()
+                    expected = self._readers_created
+                deadline = time.monotonic() + self.POOL_TIMEOUT_S
+                while len(drained) < expected:
+                    try: drained.append(self._readers.get(timeout=max(0.0, deadline - time.monotonic()))[0])
+                    except queue.Empty: raise sqlite3.OperationalError("Lectures en cours : restauration impossible, réessayez")
+                writer = self._get_writer()
+                writer.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                for conn in drained: self._discard(conn)
+                drained = []
+                with self._pool_lock: self._readers_created = 0
+                self._discard(writer); self._writer = None
+                os.replace(new_path, self.db_path)
+                if archives is not None: self._replace_archives(archives)
+                self._init_database()
+                conn = self.get_connection()
+                try: self.journal_mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+                finally: conn.close()
+            except Exception:
+                for conn in drained: self._readers.put_nowait((conn, time.monotonic()))
+                raise
+            finally:
+                self._file_gate.set()
+        self.cache.clear()
+
+    def _replace_archives(self, archives):
+        """Toutes connexions fermées : les WAL des anciennes archives ne doivent pas être rejoués sur les nouvelles"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        for alias, path in self._scan_archives().items():
+            if alias in archives: continue
+            for stale in (path, path + "-wal", path + "-shm"):
+                if os.path.exists(stale): os.remove(stale)
+        for alias, src in archives.items():
+            path = self.archive_path(alias[5:])
+            for suffix in ("-wal", "-shm"):
+                if os.path.exists(path + suffix): os.remove(path + suffix)
+            os.replace(src, path)
+            conn = sqlite3.connect(path)
+            try: conn.execute("PRAGMA journal_mode = WAL")
             finally: conn.close()
+        with self._pool_lock:
+            self._attached = self._scan_archives()
+            self._attach_version += 1
+
+    def execute_read(self, query, params=()):
+        # Pas de verrou global : en WAL les lecteurs ne bloquent pas l'écrivain
+        t0 = time.perf_counter()
+        conn = self._acquire_reader()
+        t1 = time.perf_counter()
+        try: return conn.execute(query, params).fetchall()
+        finally:
+            self._release_reader(conn)
+            METRICS.observe_query(query, 'read', time.perf_counter() - t1, t1 - t0, 'reader_pool')
+
+    # --- PAGINATION PAR CLÉ (coût O(taille de page), quel que soit le rang de la page) ---
+    def paginate(self, table, order_by=(), columns="*", where="", params=(), after=None, page_size=50, descending=False):
+        """
+        Une page de `table` triée par order_by puis rowid (départage), à partir du curseur `after`
+        renvoyé par la page précédente. Renvoie (lignes en dict, curseur suivant ou None).
+        table / order_by / columns / where sont des identifiants du code, jamais une saisie utilisateur.
+        Les colonnes de tri doivent être non NULL et indexées pour éviter tri et parcours complet.
+        """
+        keys = [*order_by, "rowid"]
+        query = keyset_page_sql(table, order_by, columns, where, after is not None, descending)
+        args = [*params, *(after if after is not None else ())]
+        rows = self.execute_read(query, (*args, page_size + 1))
+        next_cursor = tuple(rows[page_size - 1][f'_k{i}'] for i in range(len(keys))) if len(rows) > page_size else None
+        page = [{k: r[k] for k in r.keys() if not k.startswith('_k')} for r in rows[:page_size]]
+        return page, next_cursor
+
+    def iter_read(self, query, params=(), chunk_size=1000):
+        """Lecture en flux (fetchmany) : mémoire bornée quel que soit le nombre de lignes"""
+        t0 = time.perf_counter()
+        conn = self._acquire_reader(); cursor = None
+        t1 = time.perf_counter()
+        try:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows: break
+                yield from rows
+        finally:
+            if cursor is not None: cursor.close()
+            self._release_reader(conn)
+            METRICS.observe_query(query, 'stream', time.perf_counter() - t1, t1 - t0, 'reader_pool')
 
     def execute_write(self, query, params=()):
-        with self._lock:
-            conn = self.get_connection(); cursor = conn.cursor()
-            try: cursor.execute(query, params); conn.commit()
+        t0 = time.perf_counter()
+        with self._write_lock:
+            t1 = time.perf_counter()
+            conn = self._get_writer()
+            try: conn.execute(query, params); conn.commit()
             except Exception as e: conn.rollback(); raise e
-            finally: conn.close()
+            finally: METRICS.observe_query(query, 'write', time.perf_counter() - t1, t1 - t0, 'writer')
+
+    def execute_many(self, query, seq_of_params):
+        """Écriture groupée : toutes les lignes dans une seule transaction"""
+        t0 = time.perf_counter()
+        with self._write_lock:
+            t1 = time.perf_counter()
+            conn = self._get_writer()
+            try: conn.executemany(query, seq_of_params); conn.commit()
+            except Exception as e: conn.rollback(); raise e
+            finally: METRICS.observe_query(query, 'many', time.perf_counter() - t1, t1 - t0, 'writer')
+
+    @contextmanager
+    def write_transaction(self, name="write_transaction"):
+        """
+        Plusieurs écritures atomiques sur la connexion écrivain (commit en sortie, rollback sur erreur).
+        Mesurée comme une seule « requête » `name` : le verrou est tenu pour toute la transaction.
+        """
+        t0 = time.perf_counter()
+        with self._write_lock:
+            t1 = time.perf_counter()
+            conn = self._get_writer()
+            try: yield conn; conn.commit()
+            except Exception: conn.rollback(); raise
+            finally: METRICS.observe_query(f"TRANSACTION {name}", 'transaction', time.perf_counter() - t1, t1 - t0, 'writer')
 
     def _init_database(self):
         conn = self.get_connection(); c = conn.cursor()
@@ -41,37 +499,134 @@ class ThreadSafeDatabase:
         c.execute('''CREATE TABLE IF NOT EXISTS equipment (equipment_id TEXT PRIMARY KEY, equipment_name TEXT, profile_base TEXT, power_kw REAL, is_calibrated INTEGER DEFAULT 0, last_calibration TIMESTAMP, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
         c.execute('''CREATE TABLE IF NOT EXISTS audits (audit_uuid TEXT PRIMARY KEY, timestamp TIMESTAMP, created_by TEXT, equipment_id TEXT, materiel_type TEXT, materiel_name TEXT, scenario_code TEXT, index_start REAL, index_end REAL, power_kw REAL, fuel_declared_l REAL, estimated_min REAL, estimated_typ REAL, estimated_max REAL, uncertainty_pct REAL, deviation_pct REAL, z_score REAL, verdict TEXT, confidence_pct INTEGER, validated_by_operator INTEGER)''')
         c.execute('''CREATE TABLE IF NOT EXISTS equipment_load_overrides (equipment_id TEXT, scenario_code TEXT, load_min REAL, load_typ REAL, load_max REAL, learned_from_n_samples INTEGER, confidence_score REAL, last_updated TIMESTAMP, is_active INTEGER DEFAULT 1, PRIMARY KEY (equipment_id, scenario_code))''')
+        c.execute('''CREATE TABLE IF NOT EXISTS equipment_rolling_stats (equipment_id TEXT PRIMARY KEY, window TEXT, mean REAL, m2 REAL, last_updated TIMESTAMP)''')
+        c.execute('''CREATE TABLE IF NOT EXISTS equipment_drift_state (equipment_id TEXT PRIMARY KEY, n INTEGER NOT NULL DEFAULT 0, ewma REAL NOT NULL DEFAULT 0, cusum_pos REAL NOT NULL DEFAULT 0, cusum_neg REAL NOT NULL DEFAULT 0, alarm TEXT, alarm_since TIMESTAMP, last_updated TIMESTAMP)''')
+        c.execute('''CREATE TABLE IF NOT EXISTS revoked_tokens (jti TEXT PRIMARY KEY, username TEXT, revoked_at REAL, expires_at REAL)''')
+        c.execute('''CREATE TABLE IF NOT EXISTS session_cutoffs (username TEXT PRIMARY KEY, revoked_before REAL)''')
+        # Agrégats des audits archivés (quota et apprentissage sans ouvrir les archives)
+        c.execute('''CREATE TABLE IF NOT EXISTS audit_archive_counts (created_by TEXT PRIMARY KEY, n INTEGER NOT NULL DEFAULT 0)''')
+        c.execute('''CREATE TABLE IF NOT EXISTS audit_archive_learning (equipment_id TEXT, scenario_code TEXT, n_samples INTEGER NOT NULL DEFAULT 0, ratio_sum REAL NOT NULL DEFAULT 0, ratio_count INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (equipment_id, scenario_code))''')
+        measures = ", ".join(f"{m} {'INTEGER' if m.startswith('n_') else 'REAL'} NOT NULL DEFAULT 0" for m in AGGREGATE_MEASURES)
+        for table, (key, _) in AGGREGATE_TABLES.items():
+            c.execute(f"CREATE TABLE IF NOT EXISTS {table} ({key} TEXT NOT NULL, equipment_id TEXT NOT NULL, scenario_code TEXT NOT NULL, {measures}, PRIMARY KEY ({key}, equipment_id, scenario_code)) WITHOUT ROWID")
+        c.execute('''CREATE TABLE IF NOT EXISTS reaudit_runs (run_id TEXT PRIMARY KEY, started_at TIMESTAMP, finished_at TIMESTAMP, status TEXT, aging_factor REAL, total_rows INTEGER, processed_rows INTEGER DEFAULT 0, changed_verdicts INTEGER DEFAULT 0, cursor_equipment_id TEXT, cursor_timestamp TIMESTAMP, cursor_rowid INTEGER)''')
+        c.execute('''CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, job_type TEXT NOT NULL, params TEXT, status TEXT NOT NULL, created_by TEXT, created_at TIMESTAMP, scheduled_at TIMESTAMP, started_at TIMESTAMP, finished_at TIMESTAMP, heartbeat_at TIMESTAMP, attempts INTEGER NOT NULL DEFAULT 0, max_retries INTEGER NOT NULL DEFAULT 0, progress_done INTEGER, progress_total INTEGER, message TEXT, result TEXT, error TEXT, cancel_requested INTEGER NOT NULL DEFAULT 0, schedule_id TEXT)''')
+        c.execute('''CREATE TABLE IF NOT EXISTS job_schedules (schedule_id TEXT PRIMARY KEY, job_type TEXT NOT NULL, params TEXT, cron TEXT NOT NULL, enabled INTEGER NOT NULL DEFAULT 1, next_run_at TIMESTAMP, last_run_at TIMESTAMP, last_job_id TEXT, created_by TEXT, created_at TIMESTAMP)''')
         c.execute('''CREATE TABLE IF NOT EXISTS transactions (tx_ref TEXT PRIMARY KEY, username TEXT, amount REAL, status TEXT, payment_method TEXT, mobile_money_id TEXT, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
         
         # C'EST ICI LA CLÉ DU PROBLÈME : LA TABLE CONFIG
         c.execute('''CREATE TABLE IF NOT EXISTS app_config (key TEXT PRIMARY KEY, value TEXT)''')
         c.execute("INSERT OR IGNORE INTO app_config (key, value) VALUES ('AGING_FACTOR', '1.05')")
+        c.execute("INSERT OR IGNORE INTO app_config (key, value) VALUES ('DB_POOL_SIZE', ?)", (str(self.DEFAULT_POOL_SIZE),))
+        for key, (_, default) in self.PRAGMA_DEFAULTS.items():
+            c.execute("INSERT OR IGNORE INTO app_config (key, value) VALUES (?, ?)", (key, default))
+        c.execute("INSERT OR IGNORE INTO app_config (key, value) VALUES ('BCRYPT_COST', ?)", (str(PasswordHasher.DEFAULT_ROUNDS),))
+        c.execute("INSERT OR IGNORE INTO app_config (key, value) VALUES ('PDF_CACHE_MAX_MB', '256')")
+        c.execute("INSERT OR IGNORE INTO app_config (key, value) VALUES ('BACKUP_INTERVAL_H', '24')")
+        c.execute("INSERT OR IGNORE INTO app_config (key, value) VALUES ('BACKUP_KEEP', '7')")
+        c.execute("INSERT OR IGNORE INTO app_config (key, value) VALUES ('ARCHIVE_HORIZON_DAYS', '730')")
+        c.execute("INSERT OR IGNORE INTO app_config (key, value) VALUES ('DRIFT_SIGMA_PCT', '5')")
+        c.execute("INSERT OR IGNORE INTO app_config (key, value) VALUES ('JOBS_WORKERS', '2')")
+        c.execute("INSERT OR IGNORE INTO app_config (key, value) VALUES ('METRICS_PORT', '0')")
+        c.execute("INSERT OR IGNORE INTO app_config (key, value) VALUES ('METRICS_FILE', '')")
+        try: PasswordHasher.get_instance().configure(rounds=c.execute("SELECT value FROM app_config WHERE key = 'BCRYPT_COST'").fetchone()[0])
+        except (TypeError, ValueError): pass
 
-        cols = [("users", "email", "TEXT"), ("users", "phone", "TEXT"), ("users", "company_name", "TEXT"), ("users", "referral_code", "TEXT"), ("users", "license_tier", "TEXT DEFAULT 'DISCOVERY'"), ("users", "subscription_end", "TIMESTAMP"), ("audits", "created_by", "TEXT"), ("transactions", "mobile_money_id", "TEXT")]
+        cols = [("users", "email", "TEXT"), ("users", "phone", "TEXT"), ("users", "company_name", "TEXT"), ("users", "referral_code", "TEXT"), ("users", "license_tier", "TEXT DEFAULT 'DISCOVERY'"), ("users", "subscription_end", "TIMESTAMP"), ("audits", "created_by", "TEXT"), ("transactions", "mobile_money_id", "TEXT"), ("equipment_load_overrides", "ratio_sum", "REAL"), ("equipment_load_overrides", "ratio_count", "INTEGER")]
         for t, col, typ in cols:
             try: c.execute(f"ALTER TABLE {t} ADD COLUMN {col} {typ}")
             except: pass
+        # Profils appris avant les cumuls incrémentaux : cumuls recalculés depuis l'historique NORMAL
+        # (sans historique, ils restent NULL et l'UPSERT incrémental les amorce depuis le profil)
+        c.execute("""UPDATE equipment_load_overrides SET (ratio_sum, ratio_count) = (
+            SELECT SUM(CASE WHEN estimated_typ > 0 THEN fuel_declared_l / estimated_typ END), NULLIF(COUNT(CASE WHEN estimated_typ > 0 THEN 1 END), 0)
+            FROM audits a WHERE a.verdict = 'NORMAL' AND a.equipment_id = equipment_load_overrides.equipment_id AND a.scenario_code = equipment_load_overrides.scenario_code
+        ) WHERE ratio_count IS NULL""")
+
+        self._ensure_indexes(c)
+        self._ensure_aggregates(c)
         
         c.execute("SELECT count(*) FROM users")
         if c.fetchone()[0] == 0:
-            pw_hash = bcrypt.hashpw("admin".encode('utf-8'), bcrypt.gensalt())
+            pw_hash = PasswordHasher.get_instance().hash_password("admin")
             c.execute("INSERT INTO users (username, password_hash, role, license_tier, signup_ip) VALUES (?, ?, ?, ?, ?)", ("admin", pw_hash, "admin", "CORPORATE", "127.0.0.1"))
-            conn.commit()
+        conn.commit()
         conn.close()
 
+    def _ensure_indexes(self, c):
+        """Crée le jeu d'index courant ; ANALYZE uniquement lors d'un changement de version"""
+        for name in OBSOLETE_INDEXES:
+            c.execute(f"DROP INDEX IF EXISTS {name}")
+        for name, target in INDEXES.items():
+            c.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+        row = c.execute("SELECT value FROM app_config WHERE key = 'INDEX_VERSION'").fetchone()
+        if row is None or int(row[0]) < INDEX_VERSION:
+            c.execute("ANALYZE")
+            c.execute("INSERT OR REPLACE INTO app_config (key, value) VALUES ('INDEX_VERSION', ?)", (str(INDEX_VERSION),))
+
+    def _ensure_aggregates(self, c):
+        """Triggers d'agrégats ; au changement de version, recalcul complet (base chaude + archives sur disque)"""
+        row = c.execute("SELECT value FROM app_config WHERE key = 'AGGREGATE_VERSION'").fetchone()
+        if row is not None and int(row[0]) >= AGGREGATE_VERSION: return
+        for name, ddl in aggregate_trigger_ddl().items():
+            c.execute(f"DROP TRIGGER IF EXISTS {name}")
+            c.execute(ddl)
+        present = {r[1] for r in c.execute("PRAGMA database_list")}
+        for alias, path in self._scan_archives().items():
+            if alias not in present: c.execute(f"ATTACH DATABASE ? AS {alias}", (path,))
+        self.rebuild_aggregates(c)
+        c.execute("INSERT OR REPLACE INTO app_config (key, value) VALUES ('AGGREGATE_VERSION', ?)", (str(AGGREGATE_VERSION),))
+
+    @staticmethod
+    def rebuild_aggregates(c):
+        """Recalcule les agrégats depuis audits de main et de chaque archive attachée à c (dans la transaction de c)"""
+        sources = [r[1] for r in c.execute("PRAGMA database_list") if r[1] == 'main' or r[1].startswith('arch_')]
+        for table in AGGREGATE_TABLES:
+            c.execute(f"DELETE FROM {table}")
+            for source in sources: c.execute(aggregate_upsert_sql(table, 'a', source=source))
+
+    def explain_query_plan(self, query, params=()):
+        """Lignes 'detail' de EXPLAIN QUERY PLAN"""
+        return [r['detail'] for r in self.execute_read(f"EXPLAIN QUERY PLAN {query}", params)]
+
+    def find_full_scans(self, queries=None):
+        """Renvoie {nom: plan} pour chaque requête qui parcourt une table sans index (sous-requêtes exclues)"""
+        offenders = {}
+        for name, (query, params, allow_scan) in (queries if queries is not None else registered_hot_queries()).items():
+            if allow_scan is True: continue
+            plan = self.explain_query_plan(query, params)
+            scanned = [d.split()[1].split(".")[-1] for d in plan if d.startswith("SCAN") and "USING" not in d and not d.startswith("SCAN (")]
+            if any(table not in (allow_scan or ()) for table in scanned):
+                offenders[name] = plan
+        return offenders
+
     # --- LA FONCTION QUI MANQUAIT ---
     def get_config_value(self, key, default="1.05"):
-        try:
-            res = self.execute_read("SELECT value FROM app_config WHERE key = ?", (key,))
-            return res[0]['value'] if res else default
+        def _load():
+            res = self.execute_read(CONFIG_VALUE, (key,))
+            return res[0]['value'] if res else None
+        try: value = self.cache.get_or_load('config', key, _load)
         except: return default
+        return default if value is None else value
 
     def set_config_value(self, key, value):
         self.execute_write("INSERT OR REPLACE INTO app_config (key, value) VALUES (?, ?)", (key, str(value)))
+        self.cache.bump('config')
+
+    # --- PARC D'ÉQUIPEMENTS (lu à chaque rerun : servi par le cache partagé) ---
+    def list_equipment(self):
+        return self.cache.get_or_load('equipment', 'all', lambda: self.execute_read(EQUIPMENT_LIST))
+
+    def add_equipment(self, equipment_id, name, profile_base, power_kw):
+        self.execute_write(
+            "INSERT INTO equipment (equipment_id, equipment_name, profile_base, power_kw) VALUES (?, ?, ?, ?)",
+            (equipment_id, name, profile_base, power_kw)
+        )
+        self.cache.bump('equipment')
 
     def create_user_extended(self, username, password, email, phone, company, referral, role='user', tier='DISCOVERY', ip='127.0.0.1'):
         try:
-            salt = bcrypt.gensalt(); hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
+            hashed = PasswordHasher.get_instance().hash_password(password)
             self.execute_write("INSERT INTO users (username, password_hash, email, phone, company_name, referral_code, role, license_tier, signup_ip) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (username, hashed, email, phone, company, referral, role, tier, ip))
             return True, ""
         except Exception as e: return False, str(e)
@@ -80,7 +635,7 @@ class ThreadSafeDatabase:
         self.execute_write("INSERT INTO transactions (tx_ref, username, amount, status, payment_method, mobile_money_id) VALUES (?, ?, ?, 'PENDING', 'MANUAL_OM_MOMO', ?)", (tx_ref, username, amount, mobile_id))
 
     def approve_transaction(self, tx_ref):
-        rows = self.execute_read("SELECT username FROM transactions WHERE tx_ref = ?", (tx_ref,))
+        rows = self.execute_read(TX_OWNER, (tx_ref,))
         if not rows: return False
         username = rows[0]['username']
         self.execute_write("UPDATE transactions SET status = 'APPROVED' WHERE tx_ref = ?", (tx_ref,))
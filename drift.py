@@ -0,0 +1,291 @@
+# ==============================================================================
+# DRIFT.PY - Détection de Dérive Lente par Engin (Cartes CUSUM & EWMA)
+# Le Z-score ne voit que les 20 derniers écarts : un siphonnage régulier de
+# quelques % par plein devient « l'habitude » de la machine. CUSUM et EWMA
+# cumulent tout l'historique avec un état de taille fixe par engin.
+# Usage : python drift.py backfill | status
+# ==============================================================================
+import argparse
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from archive import AuditArchive, HOT
+from database import hot_query, CONFIG_VALUE
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[int], None]
+
+DRIFT_UP, DRIFT_DOWN = 'DRIFT_UP', 'DRIFT_DOWN'
+_ALARM_CODES = {1: DRIFT_UP, -1: DRIFT_DOWN, 0: None}
+
+DRIFT_STATE = hot_query("drift_state", "SELECT n, ewma, cusum_pos, cusum_neg, alarm, alarm_since, last_updated FROM equipment_drift_state WHERE equipment_id = ?", ("EQ",))
+DRIFT_CHANGED = hot_query("drift_changed", "SELECT equipment_id, last_updated FROM equipment_drift_state WHERE last_updated > ?", ("2025-01-01",))
+DRIFT_ALARMS = hot_query("drift_alarms", "SELECT equipment_id, alarm, alarm_since, n, ewma, cusum_pos, cusum_neg FROM equipment_drift_state WHERE alarm IS NOT NULL ORDER BY alarm_since", (), True)
+BACKFILL_COLUMNS, BACKFILL_FILTER = "equipment_id, timestamp, deviation_pct", "equipment_id IS NOT NULL AND deviation_pct IS NOT NULL"
+hot_query("drift_backfill", AuditArchive.stream_sql(HOT, BACKFILL_COLUMNS, BACKFILL_FILTER)[0])
+
+
+@dataclass
+class DriftState:
+    """État O(1) d'un engin ; cusum_pos / cusum_neg en unités de sigma"""
+    equipment_id: str
+    n: int = 0
+    ewma: float = 0.0
+    cusum_pos: float = 0.0
+    cusum_neg: float = 0.0
+    alarm: Optional[str] = None        # DRIFT_UP (surconsommation lente) / DRIFT_DOWN (sous-consommation)
+    alarm_since: Optional[str] = None  # Horodatage du premier audit de l'alarme en cours
+
+
+class DriftDetector:
+    """
+    CUSUM de Page bilatéral (référence k, seuil h en sigma) et EWMA à limites exactes
+    (la variance de l'EWMA croît avec n : une dérive est visible dès les premiers audits).
+    Écarts centrés sur TARGET_PCT, dispersion de référence sigma_pct (config DRIFT_SIGMA_PCT).
+    Pas de remise à zéro après alarme : elle dure tant que la dérive persiste.
+    """
+    TARGET_PCT = 0.0
+    SIGMA_PCT = 5.0
+    CUSUM_K = 0.5        # Demi-décalage à détecter (1 sigma)
+    CUSUM_H = 5.0
+    EWMA_LAMBDA = 0.2
+    EWMA_L = 3.0
+    MIN_SAMPLES = 5      # Démarrage à froid : pas d'alarme avant
+
+    def __init__(self, sigma_pct=SIGMA_PCT, target_pct=TARGET_PCT):
+        self.sigma = float(sigma_pct) if sigma_pct and float(sigma_pct) > 0 else self.SIGMA_PCT
+        self.target = float(target_pct)
+
+    def ewma_limit(self, n):
+        lam = self.EWMA_LAMBDA
+        return self.EWMA_L * self.sigma * np.sqrt(lam / (2 - lam) * (1 - (1 - lam) ** (2 * np.asarray(n, dtype=float))))
+
+    def _step(self, bank, g, x):
+        """Une observation par engin (indices g distincts) ; renvoie le code d'alarme après l'observation"""
+        z = (x - self.target) / self.sigma
+        bank['n'][g] += 1
+        bank['ewma'][g] = self.EWMA_LAMBDA * x + (1 - self.EWMA_LAMBDA) * bank['ewma'][g]
+        bank['cp'][g] = np.maximum(0.0, bank['cp'][g] + z - self.CUSUM_K)
+        bank['cn'][g] = np.maximum(0.0, bank['cn'][g] - z - self.CUSUM_K)
+        n, ewma = bank['n'][g], bank['ewma'][g] - self.target
+        limit = self.ewma_limit(n)
+        warm = n >= self.MIN_SAMPLES
+        up = warm & ((bank['cp'][g] > self.CUSUM_H) | (ewma > limit))
+        down = warm & ~up & ((bank['cn'][g] > self.CUSUM_H) | (ewma < -limit))
+        return up.astype(np.int8) - down.astype(np.int8)
+
+    def run(self, bank, codes, x, timestamps) -> np.ndarray:
+        """
+        Passe vectorisée : codes[i] = indice d'engin dans bank, observations dans l'ordre chronologique.
+        Les lignes sont regroupées par rang dans l'historique de leur engin : une itération NumPy
+        par rang (et non par ligne), chaque itération traite tous les engins à la fois.
+        Met bank à jour et renvoie le code d'alarme (1 / -1 / 0) après chaque ligne.
+        """
+        codes, x = np.asarray(codes, dtype=np.int64), np.asarray(x, dtype=float)
+        out = np.zeros(len(x), dtype=np.int8)
+        if not len(x): return out
+        order = np.argsort(codes, kind='stable')
+        sorted_codes = codes[order]
+        starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+        rank = np.arange(len(x)) - np.repeat(starts, np.diff(np.r_[starts, len(x)]))
+        by_rank = np.argsort(rank, kind='stable')
+        rows_by_rank, ranks = order[by_rank], rank[by_rank]
+        bounds = np.searchsorted(ranks, np.arange(ranks[-1] + 2))
+        for r in range(len(bounds) - 1):
+            rows = rows_by_rank[bounds[r]:bounds[r + 1]]
+            g = codes[rows]
+            alarm = self._step(bank, g, x[rows])
+            previous = bank['alarm'][g]
+            started = (alarm != 0) & (alarm != previous)
+            for j in np.flatnonzero(started): bank['since'][g[j]] = timestamps[rows[j]]
+            for j in np.flatnonzero(alarm == 0): bank['since'][g[j]] = None
+            bank['alarm'][g] = alarm
+            out[rows] = alarm
+        return out
+
+    @staticmethod
+    def new_bank(states: Sequence[DriftState]) -> Dict[str, np.ndarray]:
+        inverse = {DRIFT_UP: 1, DRIFT_DOWN: -1}
+        return {
+            'n': np.array([s.n for s in states], dtype=np.int64),
+            'ewma': np.array([s.ewma for s in states], dtype=float),
+            'cp': np.array([s.cusum_pos for s in states], dtype=float),
+            'cn': np.array([s.cusum_neg for s in states], dtype=float),
+            'alarm': np.array([inverse.get(s.alarm, 0) for s in states], dtype=np.int8),
+            'since': np.array([s.alarm_since for s in states], dtype=object),
+        }
+
+    @staticmethod
+    def states_from_bank(equipment_ids, bank) -> List[DriftState]:
+        return [
+            DriftState(eq, int(bank['n'][i]), float(bank['ewma'][i]), float(bank['cp'][i]), float(bank['cn'][i]),
+                       _ALARM_CODES[int(bank['alarm'][i])], bank['since'][i])
+            for i, eq in enumerate(equipment_ids)
+        ]
+
+
+class DriftStore:
+    """
+    Cache process des états de dérive, persistés dans equipment_drift_state.
+    Même chemin de calcul (DriftDetector.run) pour un audit isolé, un lot importé et le recalcul complet.
+    Comme RollingStatsStore, les états réécrits par un autre processus (import CLI, recalcul, travaux)
+    sont écartés du cache : au plus tard après REFRESH_INTERVAL_S en lecture, toujours avant un calcul.
+    """
+    REFRESH_INTERVAL_S = 5.0
+    COMMIT_MARGIN_S = 60.0
+    EPOCH_KEY = "DRIFT_STATE_EPOCH"   # Changé par backfill() : tous les états en mémoire sont périmés
+
+    def __init__(self, db, detector: Optional[DriftDetector] = None):
+        self.db = db
+        if detector is None:
+            try: detector = DriftDetector(sigma_pct=float(db.get_config_value("DRIFT_SIGMA_PCT", DriftDetector.SIGMA_PCT)))
+            except (TypeError, ValueError): detector = DriftDetector()
+        self.detector = detector
+        self._states: Dict[str, DriftState] = {}
+        self._stamps: Dict[str, str] = {}   # last_updated de la ligne dont provient chaque état en mémoire
+        self._lock = threading.RLock()  # push = evaluate + commit sous le même verrou
+        self._epoch = self._read_epoch()
+        self._synced_at = time.monotonic()
+        self._synced_since = self._since()
+
+    def get(self, equipment_id) -> DriftState:
+        with self._lock:
+            self._refresh()
+            return self._get_locked(equipment_id)
+
+    def _get_locked(self, equipment_id) -> DriftState:
+        state = self._states.get(equipment_id)
+        if state is None:
+            rows = self.db.execute_read(DRIFT_STATE, (equipment_id,))
+            if rows:
+                state = DriftState(equipment_id, *tuple(rows[0])[:-1])
+                self._stamps[equipment_id] = rows[0]['last_updated']
+            else: state = DriftState(equipment_id)
+            self._states[equipment_id] = state
+        return state
+
+    def _read_epoch(self):
+        rows = self.db.execute_read(CONFIG_VALUE, (self.EPOCH_KEY,))
+        return rows[0]['value'] if rows else None
+
+    def _since(self):
+        return datetime.fromtimestamp(time.time() - self.COMMIT_MARGIN_S).isoformat()
+
+    def _refresh(self, force=False):
+        """Écarte les états réécrits par un autre processus : relus à la prochaine utilisation"""
+        now = time.monotonic()
+        if not force and now - self._synced_at < self.REFRESH_INTERVAL_S: return
+        self._synced_at = now
+        since, self._synced_since = self._synced_since, self._since()
+        epoch = self._read_epoch()
+        if epoch != self._epoch:
+            self._epoch = epoch
+            self._states.clear(); self._stamps.clear()
+            return
+        for r in self.db.execute_read(DRIFT_CHANGED, (since,)):
+            if self._stamps.get(r['equipment_id']) != r['last_updated']:
+                self._states.pop(r['equipment_id'], None)
+
+    def evaluate(self, equipment_ids, deviations, timestamps) -> Tuple[np.ndarray, List[DriftState]]:
+        """Alarme après chaque observation + nouveaux états, sans rien enregistrer (voir commit)"""
+        with self._lock:
+            # Un état périmé réécrit par commit annulerait un recalcul ou un import d'un autre processus
+            self._refresh(force=True)
+            codes: Dict[str, int] = {}
+            idx = [codes.setdefault(e, len(codes)) for e in equipment_ids]
+            bank = self.detector.new_bank([self._get_locked(e) for e in codes])
+        alarms = self.detector.run(bank, idx, deviations, list(timestamps))
+        return alarms, self.detector.states_from_bank(list(codes), bank)
+
+    def preview(self, equipment_id, deviation_pct, timestamp=None) -> DriftState:
+        """État qu'aurait l'engin si cet audit était enregistré (verdict avant confirmation)"""
+        return self.evaluate([equipment_id], [deviation_pct], [timestamp or datetime.now().isoformat()])[1][0]
+
+    def commit(self, states: List[DriftState]):
+        if not states: return
+        now = datetime.now().isoformat()
+        with self._lock:
+            self.db.execute_many(
+                "INSERT OR REPLACE INTO equipment_drift_state (equipment_id, n, ewma, cusum_pos, cusum_neg, alarm, alarm_since, last_updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(s.equipment_id, s.n, s.ewma, s.cusum_pos, s.cusum_neg, s.alarm, s.alarm_since, now) for s in states]
+            )
+            for s in states: self._states[s.equipment_id] = s; self._stamps[s.equipment_id] = now
+
+    def push(self, equipment_id, deviation_pct, timestamp=None) -> DriftState:
+        """Intègre un audit enregistré"""
+        with self._lock:
+            state = self.preview(equipment_id, deviation_pct, timestamp)
+            self.commit([state])
+        return state
+
+    def alarms(self) -> List[Dict]:
+        return [dict(r) for r in self.db.execute_read(DRIFT_ALARMS)]
+
+    def backfill(self, chunk_size=100_000, progress_callback: Optional[ProgressCallback] = None) -> Dict:
+        """
+        Recalcul complet sur tout l'historique (archives comprises), en flux chronologique par lots :
+        mémoire bornée à un lot + l'état de chaque engin. À lancer après un ré-audit.
+        """
+        # Verrou tenu pendant tout le recalcul : un commit du même processus pendant le parcours
+        # serait écrasé par le remplacement final de la table
+        with self._lock:
+            detector, codes = self.detector, {}
+            bank = detector.new_bank([])
+            rows = AuditArchive(self.db).iter_select(BACKFILL_COLUMNS, BACKFILL_FILTER, chunk_size=chunk_size)
+            done = 0
+            while True:
+                chunk = [r for _, r in zip(range(chunk_size), rows)]
+                if not chunk: break
+                idx = [codes.setdefault(r['equipment_id'], len(codes)) for r in chunk]
+                grow = len(codes) - len(bank['n'])
+                if grow > 0:  # Nouveaux engins : états vierges
+                    fresh = detector.new_bank([DriftState("")] * grow)
+                    bank = {k: np.concatenate([bank[k], fresh[k]]) for k in bank}
+                detector.run(bank, idx, [r['deviation_pct'] for r in chunk], [r['timestamp'] for r in chunk])
+                done += len(chunk)
+                if progress_callback: progress_callback(done)
+
+            states = detector.states_from_bank(list(codes), bank)
+            now = datetime.now().isoformat()
+            with self.db.write_transaction("drift_backfill") as conn:
+                conn.execute("DELETE FROM equipment_drift_state")
+                conn.executemany(
+                    "INSERT INTO equipment_drift_state (equipment_id, n, ewma, cusum_pos, cusum_neg, alarm, alarm_since, last_updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(s.equipment_id, s.n, s.ewma, s.cusum_pos, s.cusum_neg, s.alarm, s.alarm_since, now) for s in states]
+                )
+                conn.execute("INSERT OR REPLACE INTO app_config (key, value) VALUES (?, ?)", (self.EPOCH_KEY, now))
+            self.db.cache.bump('config')
+            self._states = {s.equipment_id: s for s in states}
+            self._stamps = dict.fromkeys(self._states, now)
+            self._epoch = now
+        stats = {'audits': done, 'equipment': len(states), 'alarms': sum(1 for s in states if s.alarm)}
+        logger.info(f"Dérive recalculée : {stats}")
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Détection de dérive GEN-CONTROL")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("backfill", help="Recalcule l'état de dérive de chaque engin sur tout l'historique")
+    sub.add_parser("status", help="Engins en alarme")
+    args = parser.parse_args()
+
+    from database import ThreadSafeDatabase
+    store = DriftStore(ThreadSafeDatabase.get_instance())
+    if args.cmd == "backfill":
+        stats = store.backfill(progress_callback=lambda n: print(f"\r{n} audits", end="", flush=True))
+        print(f"\n{stats['audits']} audits, {stats['equipment']} engins, {stats['alarms']} en alarme")
+    else:
+        for a in store.alarms():
+            print(f"{a['equipment_id']:<16} {a['alarm']:<10} depuis {a['alarm_since'] or '?'}  EWMA {a['ewma']:+.1f} %  CUSUM+ {a['cusum_pos']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
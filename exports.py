@@ -0,0 +1,133 @@
+# ==============================================================================
+# EXPORTS.PY - Export en Flux de l'Historique des Audits (CSV / Parquet)
+# Les lignes sont lues par lots de taille fixe : mémoire bornée quel que soit
+# le volume. Parquet nécessite pyarrow (dépendance optionnelle).
+# Usage : python exports.py --out audits.csv [--equipment ID] [--user NOM]
+#                           [--since 2025-01-01] [--until 2025-02-01] [--verdict ANOMALIE]
+# ==============================================================================
+import argparse
+import csv
+import io
+from itertools import islice
+from typing import Iterator, List, Tuple
+
+from archive import AuditArchive, HOT
+from database import hot_query
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Export Parquet indisponible, CSV seulement
+    pa = pq = None
+
+# Colonnes exportées et type Parquet associé
+AUDIT_EXPORT_COLUMNS = [
+    ('audit_uuid', 'string'), ('timestamp', 'string'), ('created_by', 'string'),
+    ('equipment_id', 'string'), ('materiel_type', 'string'), ('materiel_name', 'string'),
+    ('scenario_code', 'string'), ('index_start', 'float64'), ('index_end', 'float64'),
+    ('power_kw', 'float64'), ('fuel_declared_l', 'float64'), ('estimated_min', 'float64'),
+    ('estimated_typ', 'float64'), ('estimated_max', 'float64'), ('uncertainty_pct', 'float64'),
+    ('deviation_pct', 'float64'), ('z_score', 'float64'), ('verdict', 'string'),
+    ('confidence_pct', 'int64'), ('validated_by_operator', 'int64'),
+]
+EXPORT_FORMATS = ('csv', 'parquet')
+DEFAULT_CHUNK_SIZE = 10_000
+
+
+def parquet_available() -> bool:
+    return pa is not None
+
+
+def build_audit_filter(equipment_id=None, created_by=None, verdict=None) -> Tuple[str, tuple]:
+    """Filtres optionnels hors période (la période choisit les partitions, voir AuditArchive)"""
+    clauses, params = [], []
+    for clause, value in (("equipment_id = ?", equipment_id), ("created_by = ?", created_by), ("verdict = ?", verdict)):
+        if value:
+            clauses.append(clause); params.append(value)
+    return " AND ".join(clauses), tuple(params)
+
+
+# Formes contrôlées par EXPLAIN (toute la flotte, un engin, un opérateur)
+for _name, _filters in (("all", {}), ("equipment", {'equipment_id': "EQ"}), ("user", {'created_by': "user"})):
+    _where, _params = build_audit_filter(**_filters)
+    _sql, _period = AuditArchive.stream_sql(HOT, ", ".join(name for name, _ in AUDIT_EXPORT_COLUMNS), _where, "2025-01-01", "2025-02-01")
+    hot_query(f"audit_export_{_name}", _sql, (*_params, *_period))
+
+
+def iter_audit_chunks(db, chunk_size=DEFAULT_CHUNK_SIZE, since=None, until=None, **filters) -> Iterator[List[tuple]]:
+    """Lots de tuples (ordre de AUDIT_EXPORT_COLUMNS), archives comprises ; since incluse, until exclue"""
+    where, params = build_audit_filter(**filters)
+    cols = ", ".join(name for name, _ in AUDIT_EXPORT_COLUMNS)
+    rows = AuditArchive(db).iter_select(cols, where, params, since, until, chunk_size)
+    try:
+        while True:
+            chunk = [tuple(r) for r in islice(rows, chunk_size)]
+            if not chunk: return
+            yield chunk
+    finally: rows.close()
+
+
+def write_csv(chunks: Iterator[List[tuple]], out) -> int:
+    """out : flux texte ouvert (newline='') ; renvoie le nombre de lignes"""
+    writer = csv.writer(out)
+    writer.writerow([name for name, _ in AUDIT_EXPORT_COLUMNS])
+    n = 0
+    for chunk in chunks:
+        writer.writerows(chunk); n += len(chunk)
+    return n
+
+
+def write_parquet(chunks: Iterator[List[tuple]], out) -> int:
+    """out : chemin ou flux binaire ; un row group par lot"""
+    if pa is None: raise RuntimeError("Export Parquet indisponible : installez pyarrow.")
+    schema = pa.schema([(name, getattr(pa, kind)()) for name, kind in AUDIT_EXPORT_COLUMNS])
+    n = 0
+    with pq.ParquetWriter(out, schema, compression='zstd') as writer:
+        for chunk in chunks:
+            columns = list(zip(*chunk))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema
+            ))
+            n += len(chunk)
+        if n == 0: writer.write_table(schema.empty_table())
+    return n
+
+
+def export_audits(db, out, fmt='csv', chunk_size=DEFAULT_CHUNK_SIZE, **filters) -> int:
+    """Exporte les audits filtrés vers out (chemin ou flux binaire) ; renvoie le nombre de lignes"""
+    if fmt not in EXPORT_FORMATS: raise ValueError(f"Format inconnu : {fmt}")
+    chunks = iter_audit_chunks(db, chunk_size, **filters)
+    try:
+        if fmt == 'parquet': return write_parquet(chunks, out)
+        if isinstance(out, str):
+            with open(out, "w", newline="", encoding="utf-8") as f: return write_csv(chunks, f)
+        text = io.TextIOWrapper(out, newline="", encoding="utf-8")
+        try: return write_csv(chunks, text)
+        finally: text.detach()  # Laisse le flux binaire ouvert pour l'appelant
+    finally:
+        chunks.close()  # Libère la connexion lectrice même en cas d'erreur
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export en flux des audits GEN-CONTROL")
+    parser.add_argument("--out", required=True, help="Fichier de sortie (.csv ou .parquet)")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default=None, help="Défaut : d'après l'extension")
+    parser.add_argument("--equipment", default=None)
+    parser.add_argument("--user", default=None)
+    parser.add_argument("--since", default=None, help="Date de début ISO (incluse)")
+    parser.add_argument("--until", default=None, help="Date de fin ISO (exclue)")
+    parser.add_argument("--verdict", default=None, choices=['NORMAL', 'SUSPECT', 'ANOMALIE'])
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    fmt = args.format or ('parquet' if args.out.endswith('.parquet') else 'csv')
+    from database import ThreadSafeDatabase
+    n = export_audits(
+        ThreadSafeDatabase.get_instance(), args.out, fmt, args.chunk_size,
+        equipment_id=args.equipment, created_by=args.user, since=args.since, until=args.until, verdict=args.verdict
+    )
+    print(f"{n} audits exportés dans {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+# ==============================================================================
+# INGEST.PY - Import en Masse d'Audits (Exports Cartes Carburant / Télématique)
+# Lecture en flux d'un CSV ou JSONL, contrôle de continuité des index horaires,
+# estimation et détection vectorisées, insertion par lots (executemany).
+# Une ligne invalide est rejetée avec son motif, sans interrompre l'import.
+# Usage : python ingest.py FICHIER --user NOM [--format csv|jsonl] [--errors erreurs.csv]
+# ==============================================================================
+import argparse
+import csv
+import io
+import json
+import logging
+import sqlite3
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from itertools import chain, islice
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from physics import IsoWillansModel, ReferenceEngineLibrary
+from analytics import AdaptiveLearningEngine, DetailedLoadFactorManager, IntelligentAnomalyDetector, RollingStatsStore
+from archive import AuditArchive, BY_EQUIPMENT
+from drift import DriftStore
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[int], None]
+
+INGEST_FORMATS = ('csv', 'jsonl')
+REQUIRED_FIELDS = ('equipment_id', 'scenario_code', 'index_start', 'index_end', 'fuel_declared_l')
+# Noms de colonnes acceptés en plus des noms canoniques (exports fournisseurs)
+FIELD_ALIASES = {
+    'engin': 'equipment_id', 'equipment': 'equipment_id', 'date': 'timestamp',
+    'scenario': 'scenario_code', 'conditions': 'scenario_code',
+    'index_debut': 'index_start', 'index_fin': 'index_end',
+    'fuel_l': 'fuel_declared_l', 'carburant_l': 'fuel_declared_l', 'litres': 'fuel_declared_l',
+    'charge_pct': 'load_pct',
+}
+DATE_FORMATS = ("%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d/%m/%Y")
+MAX_STORED_ERRORS = 10_000  # Au-delà, les erreurs sont comptées mais plus conservées
+
+
+class RowError(ValueError):
+    pass
+
+
+def _number(value, field) -> float:
+    if value is None or str(value).strip() == "": raise RowError(f"{field} manquant")
+    try: x = float(str(value).strip().replace(" ", "").replace(",", "."))  # 1 234,5 (export français)
+    except ValueError: raise RowError(f"{field} non numérique : {value!r}")
+    if not np.isfinite(x): raise RowError(f"{field} invalide : {value!r}")
+    return x
+
+
+def _timestamp(value, default) -> str:
+    if value is None or str(value).strip() == "": return default
+    text = str(value).strip()
+    try: return datetime.fromisoformat(text).isoformat()
+    except ValueError: pass
+    for fmt in DATE_FORMATS:
+        try: return datetime.strptime(text, fmt).isoformat()
+        except ValueError: continue
+    raise RowError(f"Date illisible : {text!r}")
+
+
+def iter_records(stream, fmt='csv') -> Iterator[Tuple[int, Optional[Dict], Optional[str]]]:
+    """(n° de ligne, champs normalisés, erreur de lecture) ; stream : flux texte"""
+    if fmt not in INGEST_FORMATS: raise ValueError(f"Format inconnu : {fmt}")
+    if fmt == 'jsonl':
+        for line_no, line in enumerate(stream, 1):
+            if not line.strip(): continue
+            try: record = json.loads(line)
+            except ValueError as e: yield line_no, None, f"JSON invalide : {e}"; continue
+            if not isinstance(record, dict): yield line_no, None, "Objet JSON attendu"; continue
+            yield line_no, _normalize(record), None
+        return
+    head = stream.read(4096)
+    head += stream.readline()  # L'échantillon s'arrête en fin de ligne
+    try: dialect = csv.Sniffer().sniff(head, delimiters=",;\t")
+    except csv.Error: dialect = csv.excel
+    reader = csv.DictReader(chain(io.StringIO(head), stream), dialect=dialect)
+    for record in reader:
+        yield reader.line_num, _normalize(record), None
+
+
+def _normalize(record) -> Dict:
+    out = {}
+    for key, value in record.items():
+        if key is None: continue
+        name = str(key).strip().lower().lstrip("\ufeff")
+        out[FIELD_ALIASES.get(name, name)] = value
+    return out
+
+
+class BulkAuditImporter:
+    """
+    Les lignes sont traitées par lots de chunk_size, dans l'ordre du fichier (chronologique par engin).
+    Par engin, l'état (dernier index de fin, fenêtre d'écarts Z-score) est amorcé une fois depuis la base
+    puis tenu en mémoire : coût O(1) par ligne. Chaque lot valide est inséré en une transaction
+    (audits + apprentissage incrémental), puis les statistiques glissantes sont mises à jour.
+
+    Comme dans l'écran d'audit : charge = colonne load_pct si fournie, sinon profil appris actif,
+    sinon charge typique du scénario ; conditions standard (0 m, 25 °C) et AGING_FACTOR courant.
+    Les profils appris sont lus au début de chaque lot.
+    """
+    INDEX_TOLERANCE_H = 0.05  # Arrondi des compteurs horaires
+    HISTORY_WINDOW = RollingStatsStore.WINDOW
+
+    def __init__(self, db, created_by, detector: Optional[IntelligentAnomalyDetector] = None,
+                 learning: Optional[AdaptiveLearningEngine] = None, rolling_stats: Optional[RollingStatsStore] = None,
+                 drift: Optional[DriftStore] = None, chunk_size: int = 2000):
+        self.db = db
+        self.created_by = created_by
+        self.detector = detector or IntelligentAnomalyDetector()
+        self.learning = learning or AdaptiveLearningEngine()
+        self.rolling_stats = rolling_stats or RollingStatsStore(db)
+        self.drift = drift or DriftStore(db)
+        self.chunk_size = chunk_size
+        try: self.aging = float(db.get_config_value("AGING_FACTOR", "1.05"))
+        except (TypeError, ValueError): self.aging = 1.05
+        self._equipment = {e['equipment_id']: e for e in db.list_equipment()}
+        self._last_end: Dict[str, Optional[float]] = {}
+        self._windows: Dict[str, deque] = {}
+
+    # --- ÉTAT PAR ENGIN ---
+    def _ensure_state(self, equipment_id):
+        if equipment_id in self._last_end: return
+        last = AuditArchive(self.db).latest(BY_EQUIPMENT, (equipment_id,), 1, "index_end")
+        self._last_end[equipment_id] = last[0]['index_end'] if last else None
+        self._windows[equipment_id] = deque(self.rolling_stats.get(equipment_id).window, maxlen=self.HISTORY_WINDOW)
+
+    # --- VALIDATION ---
+    def _parse(self, record, now) -> Dict:
+        missing = [f for f in REQUIRED_FIELDS if record.get(f) is None or str(record.get(f)).strip() == ""]
+        if missing: raise RowError(f"Champs manquants : {', '.join(missing)}")
+        eq_id = str(record['equipment_id']).strip()
+        eq = self._equipment.get(eq_id)
+        if eq is None: raise RowError(f"Engin inconnu : {eq_id}")
+        if not eq['power_kw']: raise RowError(f"Puissance non renseignée pour {eq_id}")
+        scenario_code = str(record['scenario_code']).strip()
+        category = ReferenceEngineLibrary.get_metadata(eq['profile_base']).get('type', 'TP')
+        allowed = DetailedLoadFactorManager.get_scenarios_by_category(category) or DetailedLoadFactorManager.get_scenarios_by_category('TP')
+        if scenario_code not in allowed: raise RowError(f"Scénario {scenario_code} invalide pour {eq_id} ({category})")
+        start, end = _number(record['index_start'], 'index_start'), _number(record['index_end'], 'index_end')
+        if start < 0 or end <= start: raise RowError(f"Index incohérents : {start} -> {end}")
+        fuel = _number(record['fuel_declared_l'], 'fuel_declared_l')
+        if fuel < 0: raise RowError(f"Carburant négatif : {fuel}")
+        load = None
+        if record.get('load_pct') not in (None, ""):
+            load = _number(record['load_pct'], 'load_pct') / 100.0
+            if not 0 < load <= 1.2: raise RowError(f"Charge hors bornes : {record['load_pct']} %")
+        return {'equipment_id': eq_id, 'timestamp': _timestamp(record.get('timestamp'), now), 'scenario_code': scenario_code,
+                'index_start': start, 'index_end': end, 'fuel': fuel, 'load': load, 'eq': eq}
+
+    def _check_continuity(self, row) -> bool:
+        """Erreur si l'index de début recule sous le dernier index de fin ; renvoie True s'il y a un trou"""
+        eq_id = row['equipment_id']
+        self._ensure_state(eq_id)
+        last_end = self._last_end[eq_id]
+        if last_end is not None and row['index_start'] < last_end - self.INDEX_TOLERANCE_H:
+            raise RowError(f"Index de début {row['index_start']} < dernier index de fin {last_end} (chevauchement ou doublon)")
+        self._last_end[eq_id] = row['index_end']
+        return last_end is not None and row['index_start'] > last_end + self.INDEX_TOLERANCE_H
+
+    # --- ESTIMATION / DÉTECTION VECTORISÉES ---
+    def _learned_loads(self, equipment_ids):
+        placeholders = ",".join("?" * len(equipment_ids))
+        rows = self.db.execute_read(
+            f"SELECT equipment_id, scenario_code, load_typ FROM equipment_load_overrides WHERE is_active = 1 AND equipment_id IN ({placeholders})",
+            tuple(equipment_ids)
+        )
+        return {(r['equipment_id'], r['scenario_code']): r['load_typ'] for r in rows}
+
+    def _score(self, rows):
+        overrides = self._learned_loads({r['equipment_id'] for r in rows})
+        loads = np.array([
+            r['load'] if r['load'] is not None else overrides.get(
+                (r['equipment_id'], r['scenario_code']), DetailedLoadFactorManager.get_scenario(r['scenario_code']).load_typ)
+            for r in rows
+        ], dtype=float)
+        k, b = IsoWillansModel.coefficients_for_engines([r['eq']['profile_base'] for r in rows])
+        p_nom = np.array([r['eq']['power_kw'] for r in rows], dtype=float)
+        hours = np.array([r['index_end'] - r['index_start'] for r in rows], dtype=float)
+        fuel = np.array([r['fuel'] for r in rows], dtype=float)
+        est = IsoWillansModel.predict_consumption_array(loads * 100, 0, 25, self.aging, p_nom, k, b) * hours
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dev = np.where(est > 0, (fuel - est) / est * 100, 0.0)
+
+        # Fenêtre de chaque ligne = écarts précédents de l'engin (base puis lignes déjà lues du fichier)
+        windows = []
+        for i, r in enumerate(rows):
+            history = self._windows[r['equipment_id']]
+            windows.append(list(reversed(history)))
+            history.append(float(dev[i]))
+        res = self.detector.score_from_baselines(dev, *self.detector.window_baselines(windows))
+        # Dérive lente (CUSUM / EWMA) : états calculés ici, enregistrés seulement si le lot est inséré
+        alarms, drift_states = self.drift.evaluate([r['equipment_id'] for r in rows], dev, [r['timestamp'] for r in rows])
+        return est, dev, self.detector.apply_drift(res, alarms), drift_states
+
+    # --- IMPORT ---
+    def _insert_chunk(self, rows, est, dev, res):
+        audit_rows, learn_params = [], []
+        for i, r in enumerate(rows):
+            e, verdict = float(est[i]), str(res.verdict[i])
+            audit_rows.append((
+                str(uuid.uuid4()), r['timestamp'], self.created_by, r['equipment_id'], r['eq']['profile_base'],
+                r['eq']['equipment_name'], r['scenario_code'], r['index_start'], r['index_end'], r['eq']['power_kw'],
+                r['fuel'], e * 0.9, e, e * 1.1, 10.0, float(dev[i]), float(res.z_score[i]), verdict,
+                int(res.confidence[i] * 100), 0  # Non certifié sur le terrain par un opérateur
+            ))
+            params = self.learning.learning_params(r['equipment_id'], r['scenario_code'], r['fuel'], e, verdict)
+            if params is not None: learn_params.append(params)
+        with self.db.write_transaction("ingest_chunk") as conn:
+            conn.executemany(
+                """INSERT INTO audits (audit_uuid, timestamp, created_by, equipment_id, materiel_type, materiel_name, scenario_code, index_start, index_end, power_kw, fuel_declared_l, estimated_min, estimated_typ, estimated_max, uncertainty_pct, deviation_pct, z_score, verdict, confidence_pct, validated_by_operator) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                audit_rows
+            )
+            if learn_params: conn.executemany(self.learning.INCREMENTAL_UPSERT, learn_params)
+        if learn_params: self.db.cache.bump('overrides')
+        by_equipment: Dict[str, List[float]] = {}
+        for i, r in enumerate(rows): by_equipment.setdefault(r['equipment_id'], []).append(float(dev[i]))
+        self.rolling_stats.push_many(by_equipment)
+
+    def _process_chunk(self, records, report):
+        now = datetime.now().isoformat()
+        valid, lines = [], []
+        for line_no, record, read_error in records:
+            report['read'] += 1
+            try:
+                if read_error: raise RowError(read_error)
+                row = self._parse(record, now)
+                if self._check_continuity(row): report['gaps'] += 1
+                valid.append(row); lines.append(line_no)
+            except RowError as e:
+                self._add_error(report, line_no, (record or {}).get('equipment_id'), str(e))
+        if not valid: return
+
+        est, dev, res, drift_states = self._score(valid)
+        try: self._insert_chunk(valid, est, dev, res)
+        except sqlite3.Error as e:
+            # Lot refusé par la base : lignes en erreur, état des engins rechargé depuis la base
+            for eq_id in {r['equipment_id'] for r in valid}: self._last_end.pop(eq_id, None); self._windows.pop(eq_id, None)
+            for line_no, r in zip(lines, valid): self._add_error(report, line_no, r['equipment_id'], f"Erreur base : {e}")
+            return
+        self.drift.commit(drift_states)
+        report['inserted'] += len(valid)
+        for verdict in res.verdict: report['verdicts'][str(verdict)] = report['verdicts'].get(str(verdict), 0) + 1
+
+    @staticmethod
+    def _add_error(report, line_no, equipment_id, message):
+        report['n_errors'] += 1
+        if len(report['errors']) < MAX_STORED_ERRORS:
+            report['errors'].append({'line': line_no, 'equipment_id': equipment_id, 'error': message})
+
+    def run(self, stream, fmt='csv', progress_callback: Optional[ProgressCallback] = None) -> Dict:
+        """stream : flux texte ; renvoie le bilan (lignes lues / insérées, erreurs par ligne, verdicts)"""
+        report = {'read': 0, 'inserted': 0, 'n_errors': 0, 'gaps': 0, 'verdicts': {}, 'errors': []}
+        records = iter_records(stream, fmt)
+        t0 = time.perf_counter()
+        while True:
+            chunk = list(islice(records, self.chunk_size))
+            if not chunk: break
+            self._process_chunk(chunk, report)
+            if progress_callback: progress_callback(report['read'])
+        report['duration_s'] = time.perf_counter() - t0
+        logger.info(f"Import {self.created_by} : {report['inserted']}/{report['read']} audits, {report['n_errors']} erreurs")
+        return report
+
+
+def write_errors(report, out):
+    """Rapport d'erreurs CSV (ligne, engin, motif) ; out : flux texte ouvert (newline='')"""
+    writer = csv.DictWriter(out, fieldnames=['line', 'equipment_id', 'error'])
+    writer.writeheader()
+    writer.writerows(report['errors'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import en masse d'audits GEN-CONTROL")
+    parser.add_argument("file")
+    parser.add_argument("--user", required=True, help="Compte auquel les audits sont rattachés")
+    parser.add_argument("--format", choices=INGEST_FORMATS, default=None, help="Défaut : d'après l'extension")
+    parser.add_argument("--errors", default=None, help="Fichier CSV des lignes rejetées")
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    args = parser.parse_args()
+
+    fmt = args.format or ('jsonl' if args.file.endswith(('.jsonl', '.ndjson')) else 'csv')
+    from database import ThreadSafeDatabase
+    importer = BulkAuditImporter(ThreadSafeDatabase.get_instance(), args.user, chunk_size=args.chunk_size)
+    with open(args.file, newline="", encoding="utf-8-sig") as f: report = importer.run(f, fmt)
+    print(f"{report['inserted']}/{report['read']} audits importés en {report['duration_s']:.1f} s "
+          f"| {report['n_errors']} rejetés | {report['gaps']} trous d'index | {report['verdicts']}")
+    if args.errors and report['errors']:
+        with open(args.errors, "w", newline="", encoding="utf-8") as f: write_errors(report, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,599 @@
+# ==============================================================================
+# JOBS.PY - Travaux de Fond Persistés (File, Workers & Planifications)
+# Apprentissage, ré-audit, sauvegardes, archivage et exports tournent sur un
+# pool de workers hors du thread Streamlit. Table `jobs` = file + historique
+# (progression, annulation, reprises) ; `job_schedules` = planifications cron.
+# Usage : python jobs.py list | submit TYPE [clé=valeur ...] | cancel JOB_ID
+#                        | schedules | worker
+# ==============================================================================
+import argparse
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, get_args, get_type_hints
+
+from database import hot_query
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ('QUEUED', 'RUNNING', 'DONE', 'FAILED', 'CANCELLED')
+FINISHED_STATUSES = ('DONE', 'FAILED', 'CANCELLED')
+
+JOBS_DUE = hot_query("jobs_due", "SELECT job_id, job_type FROM jobs WHERE status = 'QUEUED' AND scheduled_at <= ? ORDER BY scheduled_at LIMIT ?", ("2025-01-01", 8))
+JOBS_RUNNING_TYPES = hot_query("jobs_running_types", "SELECT DISTINCT job_type FROM jobs WHERE status = 'RUNNING'")
+JOBS_STALE = hot_query("jobs_stale", "SELECT job_id FROM jobs WHERE status = 'RUNNING' AND COALESCE(heartbeat_at, started_at) < ?", ("2025-01-01",))
+JOBS_LATEST = hot_query("jobs_latest_of_type", "SELECT * FROM jobs WHERE job_type = ? ORDER BY created_at DESC LIMIT 1", ("learn",))
+JOBS_LATEST_BY_USER = hot_query("jobs_latest_of_type_user", "SELECT * FROM jobs WHERE job_type = ? AND created_by = ? ORDER BY created_at DESC LIMIT 1", ("learn", "admin"))
+JOBS_PURGE = hot_query("jobs_purge", "SELECT job_id FROM jobs WHERE status IN ('DONE', 'FAILED', 'CANCELLED') AND finished_at < ?", ("2025-01-01",))
+SCHEDULES_DUE = hot_query("job_schedules_due", "SELECT * FROM job_schedules WHERE enabled = 1 AND next_run_at <= ?", ("2025-01-01",), True)
+
+
+class JobCancelled(Exception):
+    """Levée dans un travail dont l'annulation a été demandée"""
+
+
+# --- PLANIFICATION CRON ---
+class CronSchedule:
+    """
+    Expression cron à 5 champs : minute heure jour mois jour-de-semaine (0 ou 7 = dimanche).
+    Chaque champ accepte *, valeurs, listes (1,15), plages (1-5) et pas (*/15, 8-18/2).
+    Jour du mois et jour de semaine tous deux restreints : l'un OU l'autre suffit (comme cron).
+    """
+    FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+    MAX_SEARCH_DAYS = 366 * 5
+
+    def __init__(self, expr: str):
+        parts = expr.split()
+        if len(parts) != 5: raise ValueError(f"Expression cron invalide (5 champs attendus) : {expr!r}")
+        self.expr = " ".join(parts)
+        self.minute, self.hour, self.day, self.month, weekday = (self._parse(p, lo, hi) for p, (lo, hi) in zip(parts, self.FIELDS))
+        self.weekday = frozenset(d % 7 for d in weekday)
+        self._day_any, self._weekday_any = parts[2] == '*', parts[4] == '*'
+
+    @staticmethod
+    def _parse(field, lo, hi) -> frozenset:
+        values = set()
+        for item in field.split(','):
+            span, slash, step = item.partition('/')
+            try:
+                step = int(step) if step else 1
+                if span == '*': start, end = lo, hi
+                elif '-' in span: start, end = (int(v) for v in span.split('-', 1))
+                else: start = int(span); end = hi if slash else start
+            except ValueError: raise ValueError(f"Champ cron invalide : {field!r}")
+            if step < 1 or not lo <= start <= end <= hi: raise ValueError(f"Champ cron hors bornes [{lo}-{hi}] : {field!r}")
+            values.update(range(start, end + 1, step))
+        return frozenset(values)
+
+    def _day_matches(self, t: datetime) -> bool:
+        dom, dow = t.day in self.day, (t.weekday() + 1) % 7 in self.weekday
+        if self._day_any or self._weekday_any: return dom and dow
+        return dom or dow
+
+    def next_after(self, after: datetime) -> datetime:
+        """Première échéance strictement postérieure à after (à la minute)"""
+        t = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=self.MAX_SEARCH_DAYS)
+        while t < limit:
+            if t.month not in self.month: t = datetime(t.year + (t.month == 12), t.month % 12 + 1, 1)
+            elif not self._day_matches(t): t = datetime(t.year, t.month, t.day) + timedelta(days=1)
+            elif t.hour not in self.hour: t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minute: t += timedelta(minutes=1)
+            else: return t
+        raise ValueError(f"Planification jamais atteinte : {self.expr}")
+
+
+# --- TYPES DE TRAVAUX ---
+@dataclass
+class JobType:
+    name: str
+    label: str
+    handler: Callable
+    max_retries: int = 0
+    schedulable: bool = True  # Planifiable sans paramètres
+
+
+JOB_TYPES: Dict[str, JobType] = {}
+
+
+def job_type(name, label, max_retries=0, schedulable=True):
+    """Enregistre handler(ctx, **params) -> dict (résultat stocké en JSON)"""
+    def register(handler):
+        JOB_TYPES[name] = JobType(name, label, handler, max_retries, schedulable)
+        return handler
+    return register
+
+
+def parse_params(job_type_name, items: Iterable[str]) -> Dict:
+    """Paramètres « clé=valeur » (CLI) convertis selon les annotations du handler ; texte sinon"""
+    jt = JOB_TYPES[job_type_name]
+    signature = inspect.signature(jt.handler)
+    hints = get_type_hints(jt.handler)
+    accepts_any = any(p.kind is p.VAR_KEYWORD for p in signature.parameters.values())
+    params = {}
+    for item in items:
+        key, sep, value = item.partition("=")
+        if not sep: raise ValueError(f"Paramètre attendu sous la forme clé=valeur : {item}")
+        if key not in signature.parameters and not accepts_any: raise ValueError(f"Paramètre inconnu pour {job_type_name} : {key}")
+        target = hints.get(key, str)
+        types = [t for t in get_args(target) if t is not type(None)] or [target]
+        if type(None) in get_args(target) and value.lower() in ("", "none", "null"): params[key] = None
+        elif types[0] is bool: params[key] = value.lower() in ("1", "true", "oui", "yes")
+        elif types[0] in (int, float): params[key] = types[0](value)
+        else: params[key] = value
+    return params
+
+
+class JobContext:
+    """Ce que voit un travail : base, services partagés, paramètres, progression et annulation"""
+    PROGRESS_EVERY_S = 0.5  # Écritures de progression espacées (le writer sert aussi les audits)
+
+    def __init__(self, scheduler: "JobScheduler", job: Dict):
+        self.scheduler = scheduler
+        self.db = scheduler.db
+        self.services = scheduler.services
+        self.job_id = job['job_id']
+        self.attempt = job['attempts']
+        self._last_progress = 0.0
+
+    def cancelled(self) -> bool:
+        return self.job_id in self.scheduler._cancel_requested
+
+    def check_cancel(self):
+        if self.cancelled(): raise JobCancelled()
+
+    def progress(self, done, total=None, message=None):
+        now = time.monotonic()
+        if now - self._last_progress < self.PROGRESS_EVERY_S and (total is None or done < total): return
+        self._last_progress = now
+        self.db.execute_write(
+            "UPDATE jobs SET progress_done = ?, progress_total = COALESCE(?, progress_total), message = COALESCE(?, message), heartbeat_at = ? WHERE job_id = ?",
+            (done, total, message, datetime.now().isoformat(), self.job_id)
+        )
+
+    def progress_callback(self, message=None) -> Callable:
+        """Callback (done[, total]) des moteurs existants : progression + point d'annulation"""
+        def _callback(done, total=None):
+            self.progress(done, total, message)
+            self.check_cancel()
+        return _callback
+
+    def track(self, items: Iterable, total=None, message=None):
+        """Itère en signalant la progression (et en s'arrêtant sur annulation) tous les 100 éléments"""
+        for n, item in enumerate(items):
+            if n % 100 == 0: self.progress(n, total, message); self.check_cancel()
+            yield item
+
+    def remember(self, **params):
+        """Complète les paramètres persistés : une reprise après arrêt du processus repartira de là"""
+        job = self.scheduler.get(self.job_id)
+        self.db.execute_write("UPDATE jobs SET params = ? WHERE job_id = ?", (json.dumps({**job['params'], **params}), self.job_id))
+
+    def output_path(self, file_name) -> str:
+        """Fichier produit par le travail (téléchargeable depuis l'Admin, purgé avec le travail)"""
+        directory = os.path.abspath(os.path.join(self.scheduler.output_dir, self.job_id))  # Chemin absolu : valable dans les workers de rendu
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, file_name)
+
+
+# --- PLANIFICATEUR ---
+class JobScheduler:
+    """
+    Un thread répartiteur (réveillé à chaque soumission, sinon toutes les POLL_S) :
+    planifications échues -> travaux ; travaux échus -> pool de `workers` threads.
+    Un seul travail en cours par type (deux ré-audits ou archivages simultanés se gêneraient).
+    Un travail RUNNING sans battement de cœur depuis STALE_S (processus arrêté) est remis en file :
+    le ré-audit reprend à son curseur, les autres recommencent.
+    """
+    POLL_S = 2.0
+    STALE_S = 120.0
+    RETRY_DELAY_S = 30.0     # Doublé à chaque nouvelle tentative
+    RETENTION_DAYS = 30      # Travaux terminés (et leurs fichiers) conservés
+    DEFAULT_WORKERS = 2
+    OUTPUT_DIR = "job_outputs"
+
+    def __init__(self, db, workers: Optional[int] = None, services: Optional[Dict] = None, output_dir=OUTPUT_DIR):
+        self.db = db
+        if workers is None:
+            try: workers = int(db.get_config_value("JOBS_WORKERS", str(self.DEFAULT_WORKERS)))
+            except (TypeError, ValueError): workers = self.DEFAULT_WORKERS
+        self.workers = max(1, workers)
+        self.services = services or {}
+        self.output_dir = output_dir
+        self.last_error = None
+        self._running = set()
+        self._cancel_requested = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._last_purge = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        self._thread = threading.Thread(target=self._loop, name="job-dispatcher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self, wait=False):
+        self._stop.set(); self._wake.set()
+        self._executor.shutdown(wait=wait)
+
+    # --- SOUMISSION & SUIVI ---
+    def submit(self, job_type_name, params: Optional[Dict] = None, created_by=None, run_at: Optional[datetime] = None,
+               schedule_id=None) -> str:
+        jt = JOB_TYPES.get(job_type_name)
+        if jt is None: raise ValueError(f"Type de travail inconnu : {job_type_name}")
+        job_id = uuid.uuid4().hex[:12]
+        now = datetime.now().isoformat()
+        self.db.execute_write(
+            "INSERT INTO jobs (job_id, job_type, params, status, created_by, created_at, scheduled_at, max_retries, schedule_id) VALUES (?, ?, ?, 'QUEUED', ?, ?, ?, ?, ?)",
+            (job_id, jt.name, json.dumps(params or {}), created_by, now, (run_at.isoformat() if run_at else now), jt.max_retries, schedule_id)
+        )
+        self._wake.set()
+        return job_id
+
+    def get(self, job_id) -> Optional[Dict]:
+        rows = self.db.execute_read("SELECT * FROM jobs WHERE job_id = ?", (job_id,))
+        return self._decode(rows[0]) if rows else None
+
+    @staticmethod
+    def _decode(row) -> Dict:
+        job = dict(row)
+        for key in ('params', 'result'):
+            try: job[key] = json.loads(job[key]) if job[key] else {}
+            except ValueError: job[key] = {}
+        return job
+
+    def latest(self, job_type_name, created_by=None) -> Optional[Dict]:
+        if created_by is None: rows = self.db.execute_read(JOBS_LATEST, (job_type_name,))
+        else: rows = self.db.execute_read(JOBS_LATEST_BY_USER, (job_type_name, created_by))
+        return self._decode(rows[0]) if rows else None
+
+    def counts(self) -> Dict[str, int]:
+        counts = dict.fromkeys(JOB_STATUSES, 0)
+        for r in self.db.execute_read("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"): counts[r['status']] = r['n']
+        return counts
+
+    def cancel(self, job_id) -> bool:
+        """Un travail en file est annulé tout de suite ; un travail en cours s'arrête à son prochain point d'annulation"""
+        with self.db.write_transaction("job_cancel") as conn:
+            queued = conn.execute(
+                "UPDATE jobs SET status = 'CANCELLED', finished_at = ?, cancel_requested = 1 WHERE job_id = ? AND status = 'QUEUED'",
+                (datetime.now().isoformat(), job_id)
+            ).rowcount
+            running = conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE job_id = ? AND status = 'RUNNING'", (job_id,)).rowcount
+        if running:
+            with self._lock: self._cancel_requested.add(job_id)
+        return bool(queued or running)
+
+    def retry(self, job_id) -> Optional[str]:
+        """Relance manuelle d'un travail terminé (mêmes paramètres)"""
+        job = self.get(job_id)
+        if job is None or job['status'] not in FINISHED_STATUSES: return None
+        return self.submit(job['job_type'], job['params'], job['created_by'])
+
+    # --- PLANIFICATIONS ---
+    def add_schedule(self, job_type_name, cron, params: Optional[Dict] = None, created_by=None) -> str:
+        if job_type_name not in JOB_TYPES: raise ValueError(f"Type de travail inconnu : {job_type_name}")
+        if not JOB_TYPES[job_type_name].schedulable and not params: raise ValueError(f"{job_type_name} n'est pas planifiable sans paramètres")
+        schedule = CronSchedule(cron)
+        schedule_id = uuid.uuid4().hex[:12]
+        self.db.execute_write(
+            "INSERT INTO job_schedules (schedule_id, job_type, params, cron, enabled, next_run_at, created_by, created_at) VALUES (?, ?, ?, ?, 1, ?, ?, ?)",
+            (schedule_id, job_type_name, json.dumps(params or {}), schedule.expr, schedule.next_after(datetime.now()).isoformat(), created_by, datetime.now().isoformat())
+        )
+        self._wake.set()
+        return schedule_id
+
+    def list_schedules(self) -> List[Dict]:
+        return [self._decode_schedule(r) for r in self.db.execute_read("SELECT * FROM job_schedules ORDER BY created_at")]
+
+    @staticmethod
+    def _decode_schedule(row) -> Dict:
+        schedule = dict(row)
+        try: schedule['params'] = json.loads(schedule['params']) if schedule['params'] else {}
+        except ValueError: schedule['params'] = {}
+        return schedule
+
+    def set_schedule_enabled(self, schedule_id, enabled: bool):
+        rows = self.db.execute_read("SELECT cron FROM job_schedules WHERE schedule_id = ?", (schedule_id,))
+        if not rows: return
+        next_run = CronSchedule(rows[0]['cron']).next_after(datetime.now()).isoformat()  # Pas de rattrapage des échéances manquées
+        self.db.execute_write("UPDATE job_schedules SET enabled = ?, next_run_at = ? WHERE schedule_id = ?", (int(enabled), next_run, schedule_id))
+
+    def delete_schedule(self, schedule_id):
+        self.db.execute_write("DELETE FROM job_schedules WHERE schedule_id = ?", (schedule_id,))
+
+    # --- RÉPARTITION ---
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.tick()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Répartiteur de travaux : {e}")
+            self._wake.wait(self.POLL_S)
+            self._wake.clear()
+
+    def tick(self):
+        """Un passage du répartiteur (appelé en boucle par le thread, ou directement en test / CLI)"""
+        now = datetime.now()
+        self._heartbeat(now)
+        self._requeue_stale(now)
+        self._fire_schedules(now)
+        self._dispatch(now)
+        if time.monotonic() - self._last_purge > 3600:
+            self._last_purge = time.monotonic()
+            self.purge()
+            self._purge_sessions()
+
+    def _heartbeat(self, now):
+        with self._lock: running = list(self._running)
+        if not running: return
+        placeholders = ",".join("?" * len(running))
+        self.db.execute_write(f"UPDATE jobs SET heartbeat_at = ? WHERE job_id IN ({placeholders})", (now.isoformat(), *running))
+        # Annulations demandées depuis une autre session ou un autre processus (CLI)
+        cancelled = self.db.execute_read(f"SELECT job_id FROM jobs WHERE cancel_requested = 1 AND job_id IN ({placeholders})", tuple(running))
+        with self._lock: self._cancel_requested.update(r['job_id'] for r in cancelled)
+
+    def _requeue_stale(self, now):
+        stale_before = (now - timedelta(seconds=self.STALE_S)).isoformat()
+        with self._lock: mine = set(self._running)
+        stale = [r['job_id'] for r in self.db.execute_read(JOBS_STALE, (stale_before,)) if r['job_id'] not in mine]
+        for job_id in stale:
+            self.db.execute_write(
+                "UPDATE jobs SET status = CASE WHEN cancel_requested = 1 THEN 'CANCELLED' ELSE 'QUEUED' END, finished_at = CASE WHEN cancel_requested = 1 THEN ? END, message = 'Repris après arrêt du processus', scheduled_at = ? WHERE job_id = ? AND status = 'RUNNING'",
+                (now.isoformat(), now.isoformat(), job_id)
+            )
+            logger.warning(f"Travail {job_id} abandonné par son processus : remis en file")
+
+    def _fire_schedules(self, now):
+        due = self.db.execute_read(SCHEDULES_DUE, (now.isoformat(),))
+        for schedule in due:
+            try: next_run = CronSchedule(schedule['cron']).next_after(now).isoformat()
+            except ValueError as e:
+                logger.error(f"Planification {schedule['schedule_id']} désactivée : {e}")
+                self.db.execute_write("UPDATE job_schedules SET enabled = 0 WHERE schedule_id = ?", (schedule['schedule_id'],))
+                continue
+            pending = self.db.execute_read(
+                "SELECT 1 FROM jobs WHERE job_id = ? AND status IN ('QUEUED', 'RUNNING')", (schedule['last_job_id'],)
+            ) if schedule['last_job_id'] else []
+            job_id = None
+            if not pending and schedule['job_type'] in JOB_TYPES:  # Pas d'empilement si la précédente exécution n'est pas finie
+                job_id = self.submit(schedule['job_type'], json.loads(schedule['params'] or "{}"), schedule['created_by'], schedule_id=schedule['schedule_id'])
+            self.db.execute_write(
+                "UPDATE job_schedules SET next_run_at = ?, last_run_at = ?, last_job_id = COALESCE(?, last_job_id) WHERE schedule_id = ?",
+                (next_run, now.isoformat(), job_id, schedule['schedule_id'])
+            )
+
+    def _dispatch(self, now):
+        with self._lock: free = self.workers - len(self._running)
+        if free <= 0: return
+        busy = {r['job_type'] for r in self.db.execute_read(JOBS_RUNNING_TYPES)}
+        candidates = self.db.execute_read(JOBS_DUE, (now.isoformat(), free * 4))
+        for cand in candidates:
+            if free <= 0: break
+            if cand['job_type'] in busy: continue
+            with self.db.write_transaction("job_claim") as conn:
+                claimed = conn.execute(
+                    "UPDATE jobs SET status = 'RUNNING', started_at = ?, heartbeat_at = ?, attempts = attempts + 1, message = NULL WHERE job_id = ? AND status = 'QUEUED'",
+                    (now.isoformat(), now.isoformat(), cand['job_id'])
+                ).rowcount
+            if not claimed: continue  # Pris par un autre processus
+            busy.add(cand['job_type']); free -= 1
+            with self._lock: self._running.add(cand['job_id'])
+            self._executor.submit(self._execute, cand['job_id'])
+
+    def _execute(self, job_id):
+        job = None
+        try:
+            job = self.get(job_id)
+            if job is None:  # Purgé (autre processus) entre la réservation et le démarrage
+                logger.warning(f"Travail {job_id} introuvable au démarrage, ignoré")
+                return
+            jt = JOB_TYPES.get(job['job_type'])
+            if jt is None: raise ValueError(f"Type de travail inconnu : {job['job_type']}")
+            t0 = time.perf_counter()
+            result = jt.handler(JobContext(self, job), **job['params']) or {}
+            result.setdefault('duration_s', round(time.perf_counter() - t0, 3))
+            self._finish(job_id, 'DONE', result=result)
+            logger.info(f"Travail {job_id} ({jt.name}) terminé en {result['duration_s']} s")
+        except JobCancelled:
+            self._finish(job_id, 'CANCELLED', message="Annulé")
+        except Exception as e:
+            logger.exception(f"Travail {job_id} en échec")
+            if job is not None and job['attempts'] <= job['max_retries']:
+                retry_at = datetime.now() + timedelta(seconds=self.RETRY_DELAY_S * 2 ** (job['attempts'] - 1))
+                self.db.execute_write(
+                    "UPDATE jobs SET status = 'QUEUED', scheduled_at = ?, error = ?, message = ? WHERE job_id = ?",
+                    (retry_at.isoformat(), str(e), f"Nouvelle tentative à {retry_at:%H:%M:%S}", job_id)
+                )
+            else: self._finish(job_id, 'FAILED', error=str(e))
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+                self._cancel_requested.discard(job_id)
+            self._wake.set()  # Un slot s'est libéré
+
+    def _finish(self, job_id, status, result=None, error=None, message=None):
+        self.db.execute_write(
+            "UPDATE jobs SET status = ?, finished_at = ?, result = COALESCE(?, result), error = COALESCE(?, error), message = COALESCE(?, message) WHERE job_id = ?",
+            (status, datetime.now().isoformat(), json.dumps(result) if result is not None else None, error, message, job_id)
+        )
+
+    def purge(self, older_than_days=None) -> int:
+        """Supprime les travaux terminés depuis plus de RETENTION_DAYS jours et leurs fichiers"""
+        cutoff = (datetime.now() - timedelta(days=self.RETENTION_DAYS if older_than_days is None else older_than_days)).isoformat()
+        old = [r['job_id'] for r in self.db.execute_read(JOBS_PURGE, (cutoff,))]
+        for job_id in old:
+            directory = os.path.join(self.output_dir, job_id)
+            if os.path.isdir(directory):
+                for fname in os.listdir(directory):
+                    try: os.remove(os.path.join(directory, fname))
+                    except OSError: pass
+                try: os.rmdir(directory)
+                except OSError: pass
+        if old: self.db.execute_many("DELETE FROM jobs WHERE job_id = ?", [(j,) for j in old])
+        return len(old)
+
+    def _purge_sessions(self):
+        """Jetons révoqués expirés (même singleton que l'application : son filtre de Bloom est reconstruit)"""
+        from security import SessionStore
+        try: SessionStore.get_instance(self.db).purge_expired()
+        except Exception as e: logger.error(f"Purge des jetons révoqués : {e}")
+
+
+# ==============================================================================
+# TRAVAUX DISPONIBLES
+# Services partagés optionnels (ctx.services) : instances du processus Streamlit
+# (caches en mémoire à garder cohérents) ; à défaut, instances créées sur place.
+# ==============================================================================
+@job_type('learn', "Apprentissage des profils", max_retries=1)
+def _job_learn(ctx: JobContext):
+    from analytics import AdaptiveLearningEngine
+    engine = ctx.services.get('learning') or AdaptiveLearningEngine()
+    stats = engine.batch_learn_from_all_equipment(ctx.db)
+    if stats['failed']: raise RuntimeError("Échec de l'apprentissage (voir logs)")
+    return stats
+
+
+@job_type('reaudit', "Ré-audit de la flotte")
+def _job_reaudit(ctx: JobContext, run_id=None):
+    """Sans run_id : nouveau ré-audit. Annulation = pause, reprenable en resoumettant le run_id"""
+    from analytics import RollingStatsStore
+    from drift import DriftStore
+    from reaudit import BulkReauditEngine
+    engine = BulkReauditEngine(ctx.db, drift=ctx.services.get('drift'))
+    if run_id is None:
+        run_id = engine.start_run()
+        ctx.remember(run_id=run_id)
+    run = engine.run(run_id, progress_callback=lambda done, total: ctx.progress(done, total, "Recalcul des audits"), should_stop=ctx.cancelled)
+    if run['status'] != 'DONE': raise JobCancelled()
+    # Écarts recalculés : fenêtres Z-score, états de dérive et rapports en cache sont périmés
+    (ctx.services.get('rolling_stats') or RollingStatsStore(ctx.db)).reset()
+    # Plus de point d'annulation : les audits sont déjà recalculés
+    drift = (ctx.services.get('drift') or DriftStore(ctx.db)).backfill(progress_callback=lambda done: ctx.progress(done, message="Recalcul des dérives"))
+    if ctx.services.get('pdf_cache') is not None: ctx.services['pdf_cache'].clear()
+    return {'run_id': run['run_id'], 'processed_rows': run['processed_rows'], 'changed_verdicts': run['changed_verdicts'], 'drift_alarms': drift['alarms']}
+
+
+@job_type('backup', "Sauvegarde", max_retries=2)
+def _job_backup(ctx: JobContext, label="manual"):
+    from backups import BackupManager
+    manager = ctx.services.get('backups') or BackupManager(ctx.db)
+    m = manager.create_snapshot(label=label, progress_callback=ctx.progress_callback("Copie en ligne (pages)"))
+    return {k: m[k] for k in ('file', 'size_bytes', 'compressed_bytes', 'total_s')}
+
+
+@job_type('archive', "Archivage des audits", max_retries=1)
+def _job_archive(ctx: JobContext, horizon_days: Optional[int] = None):
+    from archive import AuditArchive
+    archive = ctx.services.get('archive') or AuditArchive(ctx.db)
+    return archive.run(horizon_days, progress_callback=ctx.progress_callback("Audits déplacés"))
+
+
+@job_type('drift_backfill', "Recalcul des dérives")
+def _job_drift_backfill(ctx: JobContext):
+    from drift import DriftStore
+    return (ctx.services.get('drift') or DriftStore(ctx.db)).backfill(progress_callback=ctx.progress_callback("Audits relus"))
+
+
+@job_type('aggregates_rebuild', "Recalcul des agrégats de flotte")
+def _job_aggregates_rebuild(ctx: JobContext):
+    from aggregates import FleetAggregates
+    FleetAggregates(ctx.db).rebuild()
+    return {}
+
+
+@job_type('audit_export', "Export des audits (CSV / Parquet)", max_retries=1)
+def _job_audit_export(ctx: JobContext, fmt='csv', **filters):
+    from exports import export_audits
+    file_name = f"AUDITS_{datetime.now():%Y%m%d_%H%M}.{fmt}"
+    path = ctx.output_path(file_name)
+    rows = export_audits(ctx.db, path, fmt, **filters)
+    return {'rows': rows, 'path': path, 'file_name': file_name}
+
+
+@job_type('fleet_report', "Rapport de flotte PDF", max_retries=1, schedulable=False)
+def _job_fleet_report(ctx: JobContext, since, until, created_by=None, license_tier='DISCOVERY', file_name=None):
+    from archive import AuditArchive, BY_USER
+    from reports import PDFReportGenerator
+    archive = AuditArchive(ctx.db)
+    if created_by is None: rows = archive.iter_select(since=since, until=until)
+    else: rows = archive.iter_select(where=BY_USER, params=(created_by,), since=since, until=until)
+    gen = PDFReportGenerator()
+    file_name = file_name or f"FLOTTE_{since[:10]}_{until[:10]}.pdf"
+    stem = os.path.splitext(file_name)[0]
+    part_path = lambda k: ctx.output_path(f"{stem}_partie{k:03d}.pdf")
+    try: parts = gen.generate_fleet_report_parts((gen.audit_row_to_report_data(r) for r in ctx.track(rows, message="Audits mis en page")), part_path, license_tier=license_tier)
+    finally: rows.close()
+    if len(parts) == 1:
+        path = ctx.output_path(file_name)
+        os.replace(part_path(1), path)
+    else:
+        # Au-delà de PAGES_PER_PART audits : une archive ZIP des parties (PDF déjà compressés, copie en flux)
+        file_name = f"{stem}.zip"
+        path = ctx.output_path(file_name)
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as z:
+            for k in range(1, len(parts) + 1):
+                z.write(part_path(k), os.path.basename(part_path(k)))
+                os.remove(part_path(k))
+    return {'pages': sum(parts), 'parts': len(parts), 'path': path, 'file_name': file_name}
+
+
+@job_type('report_export', "Export PDF unitaire en masse", max_retries=1, schedulable=False)  # Sans période : tous les audits
+def _job_report_export(ctx: JobContext, since=None, until=None):
+    """Un PDF par audit (pool de processus de report_service), dans le répertoire du travail"""
+    from report_service import ReportService, iter_export_jobs
+    directory = os.path.dirname(ctx.output_path("_"))
+    stats = ReportService.get_instance().export_to_directory(
+        iter_export_jobs(ctx.db, since, until), directory, progress_callback=ctx.progress_callback("Rapports rendus")
+    )
+    return {**stats, 'directory': directory}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Travaux de fond GEN-CONTROL")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("list", help="Derniers travaux")
+    p_submit = sub.add_parser("submit", help="Met un travail en file (exécuté par l'application ou un worker)")
+    p_submit.add_argument("job_type", choices=sorted(JOB_TYPES))
+    p_submit.add_argument("params", nargs="*", help="clé=valeur")
+    p_cancel = sub.add_parser("cancel"); p_cancel.add_argument("job_id")
+    sub.add_parser("schedules")
+    sub.add_parser("worker", help="Worker autonome (déploiement sans interface)")
+    args = parser.parse_args()
+
+    from database import ThreadSafeDatabase
+    db = ThreadSafeDatabase.get_instance()
+    scheduler = JobScheduler(db)
+    if args.cmd == "list":
+        for r in db.execute_read("SELECT * FROM jobs ORDER BY created_at DESC LIMIT 30"):
+            progress = f"{r['progress_done'] or 0}/{r['progress_total'] or '?'}"
+            print(f"{r['job_id']}  {r['created_at'][:19]}  {r['job_type']:<18} {r['status']:<10} {progress:>14}  {r['error'] or r['message'] or ''}")
+    elif args.cmd == "submit":
+        print(scheduler.submit(args.job_type, parse_params(args.job_type, args.params), created_by="cli"))
+    elif args.cmd == "cancel":
+        print("Annulation demandée." if scheduler.cancel(args.job_id) else "Travail introuvable ou déjà terminé.")
+    elif args.cmd == "schedules":
+        for s in scheduler.list_schedules():
+            print(f"{s['schedule_id']}  {s['cron']:<16} {s['job_type']:<18} {'actif' if s['enabled'] else 'inactif':<8} prochain : {s['next_run_at'][:16]}")
+    elif args.cmd == "worker":
+        logging.basicConfig(level=logging.INFO)
+        scheduler.start()
+        try:
+            while True: time.sleep(3600)
+        except KeyboardInterrupt: scheduler.stop(wait=True)
+
+
+if __name__ == "__main__":
+    main()
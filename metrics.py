@@ -0,0 +1,311 @@
+# ==============================================================================
+# METRICS.PY - Instrumentation des Chemins Chauds (Histogrammes Prometheus)
+# Requêtes SQL par empreinte (nombre, latence, attente de verrou), bcrypt,
+# prédiction, détection et rendu PDF. Coût par mesure : deux lectures
+# d'horloge et une recherche dichotomique sous verrou. Exposition au format
+# texte Prometheus : HTTP local (METRICS_PORT) et/ou fichier (METRICS_FILE).
+# ==============================================================================
+import functools
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bornes des histogrammes (s) : de la prédiction scalaire (~µs) au rapport de flotte
+BUCKETS_S = (0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+QUERY_SECONDS = "gencontrol_db_query_seconds"
+LOCK_WAIT_SECONDS = "gencontrol_db_lock_wait_seconds"
+METRIC_HELP = {
+    QUERY_SECONDS: "Durée d'exécution SQL par empreinte de requête (kind=stream : lecture en flux, consommateur compris)",
+    LOCK_WAIT_SECONDS: "Attente du verrou écrivain ou d'une connexion lectrice du pool, par empreinte",
+    "gencontrol_bcrypt_seconds": "Opération bcrypt, attente dans le pool comprise",
+    "gencontrol_bcrypt_queue_wait_seconds": "Attente d'un worker bcrypt",
+    "gencontrol_predict_seconds": "Prédiction de consommation (IsoWillansModel)",
+    "gencontrol_detect_seconds": "Détection d'anomalie (IntelligentAnomalyDetector)",
+    "gencontrol_pdf_seconds": "Génération PDF (report=pool : de la soumission au résultat)",
+}
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_sql(query: str) -> str:
+    """Empreinte lisible : littéraux -> ?, listes IN (?, ?, ...) -> (?+), espaces compactés"""
+    sql = _LITERALS.sub("?", query)
+    sql = _IN_LISTS.sub("(?+)", sql)
+    return _SPACES.sub(" ", sql).strip()
+
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'sum', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_S) + 1)  # Dernier seau : +Inf
+        self.count, self.sum, self.max = 0, 0.0, 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS_S, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max: self.max = seconds
+
+    def copy(self) -> "Histogram":
+        h = Histogram()
+        h.counts, h.count, h.sum, h.max = list(self.counts), self.count, self.sum, self.max
+        return h
+
+    def quantile(self, q) -> float:
+        """Estimation par interpolation linéaire dans le seau (comme histogram_quantile)"""
+        if not self.count: return 0.0
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                lower = BUCKETS_S[i - 1] if i else 0.0
+                upper = BUCKETS_S[i] if i < len(BUCKETS_S) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / n)
+            seen += n
+        return self.max
+
+
+class MetricsRegistry:
+    """
+    Histogrammes du processus, indexés par (nom, étiquettes triées).
+    Les empreintes SQL sont calculées une fois par texte de requête (cache borné) ;
+    l'étiquette `fingerprint` est un condensé court, le texte normalisé est exposé à part.
+    Chemin chaud : les histogrammes d'une requête (ou d'un @timed) sont résolus une fois,
+    une mesure ne coûte ensuite qu'une recherche de dictionnaire et deux observe() sous verrou.
+    """
+    _instance = None
+    _lock = threading.Lock()
+    MAX_FINGERPRINT_CACHE = 5000
+
+    def __init__(self):
+        self.enabled = True
+        self.started_at = time.time()
+        self._hist: Dict[Tuple[str, Tuple], Histogram] = {}
+        self._sql: Dict[str, str] = {}            # Condensé -> texte normalisé
+        self._queries: Dict[Tuple[str, str, str], Tuple[Histogram, Histogram]] = {}  # (texte brut, kind, verrou) -> histogrammes
+        self._data_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None: cls._instance = cls()
+        return cls._instance
+
+    # --- MESURE ---
+    @staticmethod
+    def key(name, **labels) -> Tuple[str, Tuple]:
+        return name, tuple(sorted(labels.items()))
+
+    def _histogram(self, key) -> Histogram:
+        """Appelée sous _data_lock"""
+        hist = self._hist.get(key)
+        if hist is None: hist = self._hist[key] = Histogram()
+        return hist
+
+    def observe_key(self, key, seconds):
+        if not self.enabled: return
+        with self._data_lock: self._histogram(key).observe(seconds)
+
+    def observe(self, name, seconds, **labels):
+        self.observe_key(self.key(name, **labels), seconds)
+
+    @staticmethod
+    def fingerprint(query: str) -> Tuple[str, str]:
+        """(condensé, texte normalisé)"""
+        sql = normalize_sql(query)
+        return hashlib.sha1(sql.encode("utf-8")).hexdigest()[:10], sql
+
+    def observe_query(self, query, kind, seconds, wait_s, lock):
+        if not self.enabled: return
+        hists = self._queries.get((query, kind, lock))
+        with self._data_lock:
+            if hists is None:
+                fp, sql = self.fingerprint(query)
+                if len(self._queries) >= self.MAX_FINGERPRINT_CACHE: self._queries.clear()  # Requêtes générées (listes IN...)
+                self._sql[fp] = sql
+                hists = self._queries[(query, kind, lock)] = (
+                    self._histogram(self.key(QUERY_SECONDS, fingerprint=fp, kind=kind)),
+                    self._histogram(self.key(LOCK_WAIT_SECONDS, fingerprint=fp, lock=lock)),
+                )
+            hists[0].observe(seconds)
+            hists[1].observe(wait_s)
+
+    def reset(self):
+        with self._data_lock:
+            self._hist.clear()
+            self._queries.clear()
+            self.started_at = time.time()
+
+    # --- LECTURE ---
+    def _items(self) -> List[Tuple[str, Dict, Histogram]]:
+        """Instantané cohérent (copies) : la lecture ne bloque pas les mesures plus que nécessaire"""
+        with self._data_lock:
+            return [(name, dict(labels), h.copy()) for (name, labels), h in self._hist.items()]
+
+    def query_stats(self) -> List[Dict]:
+        """Une ligne par empreinte SQL (tous kinds confondus pour l'attente de verrou)"""
+        stats: Dict[Tuple[str, str], Dict] = {}
+        waits: Dict[str, float] = {}
+        for name, labels, h in self._items():
+            if name == LOCK_WAIT_SECONDS: waits[labels['fingerprint']] = waits.get(labels['fingerprint'], 0.0) + h.sum
+            elif name == QUERY_SECONDS:
+                fp = labels['fingerprint']
+                stats[(fp, labels['kind'])] = {
+                    'fingerprint': fp, 'kind': labels['kind'], 'sql': self._sql.get(fp, ''), 'count': h.count,
+                    'total_s': h.sum, 'mean_ms': h.sum / h.count * 1000 if h.count else 0.0,
+                    'p50_ms': h.quantile(0.50) * 1000, 'p95_ms': h.quantile(0.95) * 1000, 'p99_ms': h.quantile(0.99) * 1000,
+                    'max_ms': h.max * 1000,
+                }
+        for row in stats.values(): row['lock_wait_s'] = waits.get(row['fingerprint'], 0.0)
+        return list(stats.values())
+
+    def slowest_queries(self, n=20, key='total_s') -> List[Dict]:
+        return sorted(self.query_stats(), key=lambda r: r[key], reverse=True)[:n]
+
+    def timers(self) -> List[Dict]:
+        """Chemins chauds hors SQL (bcrypt, prédiction, détection, PDF)"""
+        rows = []
+        for name, labels, h in self._items():
+            if name in (QUERY_SECONDS, LOCK_WAIT_SECONDS): continue
+            rows.append({
+                'metric': name, 'labels': ", ".join(f"{k}={v}" for k, v in sorted(labels.items())), 'count': h.count,
+                'total_s': h.sum, 'mean_ms': h.sum / h.count * 1000 if h.count else 0.0,
+                'p95_ms': h.quantile(0.95) * 1000, 'p99_ms': h.quantile(0.99) * 1000, 'max_ms': h.max * 1000,
+            })
+        return sorted(rows, key=lambda r: (r['metric'], r['labels']))
+
+    def lock_waits(self) -> Dict[str, Dict]:
+        """Attente cumulée par verrou (writer / reader_pool)"""
+        res: Dict[str, Dict] = {}
+        for name, labels, h in self._items():
+            if name != LOCK_WAIT_SECONDS: continue
+            agg = res.setdefault(labels['lock'], {'count': 0, 'total_s': 0.0, 'max_ms': 0.0})
+            agg['count'] += h.count; agg['total_s'] += h.sum; agg['max_ms'] = max(agg['max_ms'], h.max * 1000)
+        return res
+
+    # --- EXPOSITION ---
+    @staticmethod
+    def _escape(value) -> str:
+        return str(value).replace("\\", "\\\\").replace("\n", " ").replace('"', '\\"')
+
+    def _labels(self, labels: Dict, **extra) -> str:
+        items = {**labels, **extra}
+        return "{" + ",".join(f'{k}="{self._escape(v)}"' for k, v in items.items()) + "}" if items else ""
+
+    def render_prometheus(self) -> str:
+        """Format texte d'exposition Prometheus 0.0.4"""
+        by_name: Dict[str, List] = {}
+        for item in self._items(): by_name.setdefault(item[0], []).append(item)
+        lines = []
+        for name in sorted(by_name):
+            lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for _, labels, h in by_name[name]:
+                cumulative = 0
+                for bound, n in zip((*BUCKETS_S, "+Inf"), h.counts):
+                    cumulative += n
+                    lines.append(f"{name}_bucket{self._labels(labels, le=bound)} {cumulative}")
+                lines.append(f"{name}_sum{self._labels(labels)} {h.sum:.6f}")
+                lines.append(f"{name}_count{self._labels(labels)} {h.count}")
+        with self._data_lock: sql = dict(self._sql)
+        if sql:
+            lines.append("# HELP gencontrol_db_query_info Texte normalisé de chaque empreinte de requête")
+            lines.append("# TYPE gencontrol_db_query_info gauge")
+            for fp, text in sorted(sql.items()):
+                lines.append(f"gencontrol_db_query_info{self._labels({'fingerprint': fp, 'sql': text[:300]})} 1")
+        lines.append("# HELP gencontrol_metrics_start_time_seconds Début de la fenêtre de mesure (remise à zéro)")
+        lines.append("# TYPE gencontrol_metrics_start_time_seconds gauge")
+        lines.append(f"gencontrol_metrics_start_time_seconds {self.started_at:.3f}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """Écriture atomique (collecteur textfile de node_exporter, scraper local)"""
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f: f.write(self.render_prometheus())
+        os.replace(tmp, path)
+
+
+METRICS = MetricsRegistry.get_instance()
+
+
+def timed(name, **labels):
+    """Décorateur : durée de chaque appel dans l'histogramme `name`"""
+    key = MetricsRegistry.key(name, **labels)
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try: return fn(*args, **kwargs)
+            finally: METRICS.observe_key(key, time.perf_counter() - t0)
+        return wrapper
+    return decorate
+
+
+class MetricsExporter:
+    """
+    Serveur HTTP local (GET /metrics) et/ou fichier réécrit toutes les interval_s secondes.
+    Écoute sur 127.0.0.1 par défaut : les métriques exposent le texte des requêtes SQL.
+    """
+    INTERVAL_S = 15.0
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None, port: int = 0, path: Optional[str] = None,
+                 host="127.0.0.1", interval_s=INTERVAL_S):
+        self.registry = registry or METRICS
+        self.port, self.path, self.host, self.interval_s = port, path, host, interval_s
+        self.last_error = None
+        self._server = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="metrics-file", daemon=True)
+
+    def start(self):
+        if self.port:
+            registry = self.registry
+
+            class _Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split("?")[0] not in ("/metrics", "/"):
+                        self.send_error(404); return
+                    body = registry.render_prometheus().encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args): pass  # Pas de journal par scrape
+
+            try:
+                self._server = ThreadingHTTPServer((self.host, self.port), _Handler)
+                threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+            except OSError as e:
+                self.last_error = f"Port {self.port} : {e}"
+                logger.error(f"Exposition des métriques impossible : {self.last_error}")
+        if self.path: self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._server is not None: self._server.shutdown(); self._server.server_close()
+
+    def _loop(self):
+        while True:
+            try:
+                self.registry.write_textfile(self.path)
+                self.last_error = None
+            except OSError as e:
+                self.last_error = str(e)
+                logger.error(f"Écriture des métriques échouée : {e}")
+            if self._stop.wait(self.interval_s): break
@@ -0,0 +1,150 @@
+# ==============================================================================
+# PASSWORDS.PY - Hachage Bcrypt Hors du Thread Streamlit
+# Pool de threads borné (contre-pression), coût configurable, métriques
+# ==============================================================================
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+import bcrypt
+
+from metrics import METRICS
+
+
+class HasherBusyError(RuntimeError):
+    """File d'attente bcrypt pleine : la requête est refusée plutôt que de geler la session"""
+
+
+class PasswordHasher:
+    """
+    Toutes les opérations bcrypt passent par un pool de threads dédié de taille fixe.
+    Une opération n'est admise que si son attente estimée (file devant elle x durée mesurée d'un calcul)
+    tient dans max_wait_s, et dans la limite de max_workers + max_queue places ; sinon l'appelant
+    reçoit aussitôt HasherBusyError (contre-pression) au lieu de bloquer sa session.
+    bcrypt libère le GIL : les autres sessions continuent pendant le calcul.
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    DEFAULT_ROUNDS = 12
+    MIN_ROUNDS, MAX_ROUNDS = 4, 31
+    LATENCY_SAMPLES = 1000
+    MAX_WAIT_S = 1.0       # Latence visée pour une connexion admise (attente + calcul)
+    COST_SMOOTHING = 0.2   # Lissage exponentiel de la durée d'un calcul
+
+    def __init__(self, max_workers=None, max_queue=64, rounds=DEFAULT_ROUNDS, acquire_timeout_s=0.5, max_wait_s=MAX_WAIT_S):
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_queue = max_queue
+        self.acquire_timeout_s = acquire_timeout_s
+        self.max_wait_s = max_wait_s
+        self.rounds = rounds
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self._stats_lock = threading.Lock()
+        self._pending = 0      # Admises, pas encore démarrées
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._latencies = deque(maxlen=self.LATENCY_SAMPLES)  # Attente + calcul (s)
+        self._cost_s = None    # Durée mesurée d'un calcul au coût courant (None : pas encore étalonné)
+        rounds = self.rounds   # Étalonnage dans le pool, avant les premières connexions
+        self._executor.submit(self._timed, lambda: bcrypt.hashpw(b"calibration", bcrypt.gensalt(rounds)), rounds)
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None: cls._instance = cls()
+        return cls._instance
+
+    def configure(self, rounds=None):
+        if rounds is not None:
+            rounds = max(self.MIN_ROUNDS, min(self.MAX_ROUNDS, int(rounds)))
+            with self._stats_lock:
+                # Chaque round double le calcul : la durée mesurée suit le nouveau coût sans nouvel étalonnage
+                if self._cost_s is not None: self._cost_s *= 2.0 ** (rounds - self.rounds)
+                self.rounds = rounds
+
+    # --- API PUBLIQUE (bloquante pour l'appelant, calcul dans le pool) ---
+    def hash_password(self, password: str) -> bytes:
+        rounds = self.rounds
+        return self._run(lambda: bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)), 'hash', rounds)
+
+    def check_password(self, password: str, stored_hash) -> bool:
+        # Gestion stricte des types bytes/str pour Bcrypt
+        if isinstance(stored_hash, str): stored_hash = stored_hash.encode('utf-8')
+        return self._run(lambda: bcrypt.checkpw(password.encode('utf-8'), stored_hash), 'check', self._rounds_of(stored_hash))
+
+    def needs_rehash(self, stored_hash) -> bool:
+        """Vrai si le hash a été calculé avec un autre coût que celui configuré"""
+        if isinstance(stored_hash, str): stored_hash = stored_hash.encode('utf-8')
+        return self._rounds_of(stored_hash) != self.rounds
+
+    @staticmethod
+    def _rounds_of(stored_hash: bytes):
+        try: return int(stored_hash.split(b'$')[2])
+        except (IndexError, ValueError): return None
+
+    # --- EXÉCUTION BORNÉE ---
+    def _admit(self) -> bool:
+        """Réserve une place si l'attente estimée tient dans max_wait_s (sans étalonnage : pas de file)"""
+        if not self._slots.acquire(timeout=self.acquire_timeout_s): return False
+        with self._stats_lock:
+            ahead = self._pending + self._running
+            if self._cost_s is None: admitted = ahead < self.max_workers
+            else: admitted = (ahead // self.max_workers + 1) * self._cost_s <= self.max_wait_s
+            if admitted: self._pending += 1; return True
+        self._slots.release()
+        return False
+
+    def _run(self, fn, op, rounds=None):
+        submitted = time.perf_counter()
+        if not self._admit():
+            with self._stats_lock: self._rejected += 1
+            raise HasherBusyError("Serveur d'authentification saturé, réessayez dans un instant.")
+        try:
+            try: future = self._executor.submit(self._execute, fn, submitted, rounds)
+            except Exception:
+                # Jamais démarrée (exécuteur arrêté) : ne doit pas rester comptée dans la file
+                with self._stats_lock: self._pending -= 1
+                raise
+            return future.result()
+        finally:
+            self._slots.release()
+            latency = time.perf_counter() - submitted
+            with self._stats_lock: self._latencies.append(latency)
+            METRICS.observe("gencontrol_bcrypt_seconds", latency, op=op, rounds=self.rounds)
+
+    def _execute(self, fn, submitted, rounds):
+        METRICS.observe("gencontrol_bcrypt_queue_wait_seconds", time.perf_counter() - submitted)
+        with self._stats_lock: self._pending -= 1; self._running += 1
+        try: return self._timed(fn, rounds)
+        finally:
+            with self._stats_lock: self._running -= 1; self._completed += 1
+
+    def _timed(self, fn, rounds=None):
+        """Exécute fn et met à jour la durée d'un calcul, ramenée au coût configuré"""
+        t0 = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - t0
+        with self._stats_lock:
+            if rounds is not None: elapsed *= 2.0 ** (self.rounds - rounds)
+            a = self.COST_SMOOTHING
+            self._cost_s = elapsed if self._cost_s is None else (1 - a) * self._cost_s + a * elapsed
+        return result
+
+    def metrics(self) -> Dict[str, float]:
+        with self._stats_lock:
+            lat = sorted(self._latencies)
+            res = {
+                'rounds': self.rounds, 'workers': self.max_workers, 'max_queue': self.max_queue,
+                'queue_depth': self._pending, 'running': self._running,
+                'completed': self._completed, 'rejected': self._rejected,
+                'cost_ms': self._cost_s * 1000 if self._cost_s is not None else 0.0, 'max_wait_ms': self.max_wait_s * 1000,
+            }
+        for name, q in (('p50_ms', 0.50), ('p99_ms', 0.99)):
+            res[name] = lat[min(len(lat) - 1, int(q * len(lat)))] * 1000 if lat else 0.0
+        return res
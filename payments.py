@@ -4,6 +4,9 @@
 import uuid
 import streamlit as st
 import time
+from database import hot_query
+
+PENDING_PAYMENT = hot_query("tx_pending_user", "SELECT * FROM transactions WHERE username = ? AND status = 'PENDING'", ("admin",))
 
 def render_payment_page():
     st.markdown("## 💎 Abonnement GEN-CONTROL PRO")
@@ -11,7 +14,7 @@ def render_payment_page():
     
     user = st.session_state['user']
     db = st.session_state.db
-    pending = db.execute_read("SELECT * FROM transactions WHERE username = ? AND status = 'PENDING'", (user,))
+    pending = db.execute_read(PENDING_PAYMENT, (user,))
     
     if pending:
         st.warning(f"⏳ **Paiement en cours de validation** (Réf: `{pending[0]['tx_ref']}`)")
@@ -0,0 +1,124 @@
+# ==============================================================================
+# PDF_CACHE.PY - Cache Disque des Rapports d'Audit (Adressé par Contenu)
+# Clé = SHA-256(audit_uuid, licence, version du gabarit) ; éviction LRU par taille
+# ==============================================================================
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from reports import PDFReportGenerator
+
+
+class PDFCache:
+    """
+    Un fichier <clé>.pdf par rapport. La date de modification sert d'horodatage LRU :
+    l'ordre survit au redémarrage. Changer TEMPLATE_VERSION invalide toutes les entrées
+    (nouvelles clés, les anciennes sortent par éviction).
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    DEFAULT_DIR = "pdf_cache"
+    DEFAULT_MAX_MB = 256
+
+    def __init__(self, directory=DEFAULT_DIR, max_bytes=DEFAULT_MAX_MB * 1024 * 1024,
+                 template_version=PDFReportGenerator.TEMPLATE_VERSION):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.template_version = template_version
+        self._index_lock = threading.Lock()
+        self._entries = OrderedDict()  # clé -> taille, du moins au plus récemment utilisé
+        self._total = 0
+        self.hits = self.misses = self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    @classmethod
+    def get_instance(cls, directory=DEFAULT_DIR, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None: cls._instance = cls(directory, max_bytes)
+        return cls._instance
+
+    def _load_index(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".pdf"): continue
+            try: st = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError: continue
+            files.append((st.st_mtime, name[:-4], st.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._total += size
+
+    # --- CLÉS ---
+    def key(self, audit_uuid, license_tier) -> str:
+        raw = f"{audit_uuid}\x1f{license_tier}\x1f{self.template_version}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pdf")
+
+    # --- LECTURE / ÉCRITURE ---
+    def get(self, audit_uuid, license_tier) -> Optional[bytes]:
+        key = self.key(audit_uuid, license_tier)
+        try:
+            with open(self._path(key), "rb") as f: pdf = f.read()
+        except FileNotFoundError:
+            with self._index_lock:
+                self.misses += 1
+                size = self._entries.pop(key, None)
+                if size is not None: self._total -= size
+            return None
+        with self._index_lock:
+            self.hits += 1
+            if key in self._entries: self._entries.move_to_end(key)
+        try: os.utime(self._path(key))
+        except FileNotFoundError: pass
+        return pdf
+
+    def put(self, audit_uuid, license_tier, pdf: bytes):
+        if len(pdf) > self.max_bytes: return
+        key = self.key(audit_uuid, license_tier)
+        # Nom temporaire unique entre threads et process partageant le répertoire (workers de rendu)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=f"{key}.", suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f: f.write(pdf)
+            os.replace(tmp_path, self._path(key))  # Lecteurs concurrents : ancien ou nouveau fichier, jamais partiel
+        except BaseException:
+            try: os.remove(tmp_path)
+            except FileNotFoundError: pass
+            raise
+        with self._index_lock:
+            self._total -= self._entries.pop(key, 0)
+            self._entries[key] = len(pdf)
+            self._total += len(pdf)
+            victims = []
+            while self._total > self.max_bytes and self._entries:
+                victim, size = self._entries.popitem(last=False)
+                self._total -= size
+                self.evictions += 1
+                victims.append(victim)
+        for victim in victims:
+            try: os.remove(self._path(victim))
+            except FileNotFoundError: pass
+
+    def clear(self):
+        """À appeler quand le contenu des audits change (ré-audit de flotte)"""
+        with self._index_lock:
+            keys, self._entries, self._total = list(self._entries), OrderedDict(), 0
+        for key in keys:
+            try: os.remove(self._path(key))
+            except FileNotFoundError: pass
+
+    def stats(self):
+        with self._index_lock:
+            return {
+                'entries': len(self._entries), 'size_mb': self._total / (1024 * 1024),
+                'max_mb': self.max_bytes / (1024 * 1024), 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions,
+            }
@@ -2,6 +2,10 @@
 # PHYSICS.PY - VERSION ORIGINALE (AVEC CORRECTIF MINIMAL k_factor)
 # ==============================================================================
 import math
+import numpy as np
+
+from shared_cache import SharedCache
+from metrics import timed
 
 class AtmosphericParams:
     def __init__(self, altitude_m, temperature_c):
@@ -24,13 +28,21 @@ class ReferenceEngineLibrary:
 
     @staticmethod
     def list_engines_by_type(type_filter):
-        return {k: v['name'] for k, v in ReferenceEngineLibrary.ENGINE_DB.items() if v['type'] == type_filter}
+        # Catalogue constant : filtré une fois par processus (résultat partagé, ne pas modifier)
+        return SharedCache.get_instance().get_or_load(
+            'catalog', ('engines', type_filter),
+            lambda: {k: v['name'] for k, v in ReferenceEngineLibrary.ENGINE_DB.items() if v['type'] == type_filter}
+        )
 
     @staticmethod
     def get_metadata(code):
         return ReferenceEngineLibrary.ENGINE_DB.get(code, {})
 
 class IsoWillansModel:
+    # Coefficients Willans (k, b) par type de moteur
+    TYPE_COEFFICIENTS = {'GE': (0.24, 0.07), 'TRUCK': (0.22, 0.09)}
+    DEFAULT_COEFFICIENTS = (0.26, 0.10)
+
     def __init__(self, k_factor=0.25, b_factor=0.08, p_nom_kw=100):
         self.k = k_factor; self.b = b_factor; self.p_nom = p_nom_kw
 
@@ -41,14 +53,40 @@ class IsoWillansModel:
         eng_type = meta.get('type', 'GE')
         
         # --- CORRECTION IDRISS : k remplacé par k_factor pour correspondre à __init__ ---
-        if eng_type == 'GE': 
-            return cls(k_factor=0.24, b_factor=0.07, p_nom_kw=base_power)
-        elif eng_type == 'TRUCK': 
-            return cls(k_factor=0.22, b_factor=0.09, p_nom_kw=base_power)
-        else: 
-            return cls(k_factor=0.26, b_factor=0.10, p_nom_kw=base_power)
+        k, b = cls.TYPE_COEFFICIENTS.get(eng_type, cls.DEFAULT_COEFFICIENTS)
+        return cls(k_factor=k, b_factor=b, p_nom_kw=base_power)
         # --------------------------------------------------------------------------------
 
+    @classmethod
+    def coefficients_for_engines(cls, engine_codes):
+        """Tableaux (k, b) alignés sur une liste de codes moteur (flotte hétérogène)"""
+        coeffs = [cls.TYPE_COEFFICIENTS.get(ReferenceEngineLibrary.get_metadata(code).get('type', 'GE'), cls.DEFAULT_COEFFICIENTS) for code in engine_codes]
+        if not coeffs: return np.empty(0), np.empty(0)
+        k, b = np.array(coeffs, dtype=float).T
+        return k, b
+
+    @staticmethod
+    @timed("gencontrol_predict_seconds", mode="array")
+    def predict_consumption_array(load_pct, altitude_m, temperature_c, aging_factor, p_nom_kw, k_factor, b_factor):
+        """
+        Version vectorisée (broadcasting NumPy) de predict_consumption.
+        Chaque argument est un scalaire ou un tableau ; renvoie les l/h corrigés.
+        Même ordre d'opérations que la version scalaire -> résultats identiques.
+        """
+        load_decimal = np.asarray(load_pct, dtype=float) / 100.0
+        alt_factor = 1 + (np.maximum(0, np.asarray(altitude_m, dtype=float) - 1000) / 10000)
+        temp_factor = 1 + (np.maximum(0, np.asarray(temperature_c, dtype=float) - 25) / 500)
+        fuel_kwh = (np.asarray(k_factor, dtype=float) * load_decimal) + b_factor
+        return np.asarray(p_nom_kw, dtype=float) * fuel_kwh * alt_factor * temp_factor * np.asarray(aging_factor, dtype=float)
+
+    def predict_consumption_batch(self, load_pct, altitude_m=0, temperature_c=25, aging_factor=1.05, p_nom_kw=None):
+        """Prédiction en lot avec les coefficients de ce modèle (p_nom_kw par défaut : celui du modèle)"""
+        return self.predict_consumption_array(
+            load_pct, altitude_m, temperature_c, aging_factor,
+            self.p_nom if p_nom_kw is None else p_nom_kw, self.k, self.b
+        )
+
+    @timed("gencontrol_predict_seconds", mode="scalar")
     def predict_consumption(self, load_pct, atmospheric_params, aging_factor=1.05):
         load_decimal = load_pct / 100.0
         alt_factor = 1 + (max(0, atmospheric_params.altitude_m - 1000) / 10000)
@@ -0,0 +1,233 @@
+# ==============================================================================
+# REAUDIT.PY - Moteur de Ré-Audit de Flotte (Recalcul en masse)
+# Recalcule estimations, écarts, Z-scores et verdicts après un changement
+# d'AGING_FACTOR ou d'un profil appris. Flux par lots, reprise après coupure.
+# ==============================================================================
+import uuid
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+from physics import IsoWillansModel
+from analytics import DetailedLoadFactorManager, IntelligentAnomalyDetector
+from archive import AuditArchive, BY_EQUIPMENT, HOT
+from database import hot_query
+from drift import DriftState, DriftStore
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[int, int], None]
+
+# Écarts connus d'un engin (un audit non recalculable garde un écart NULL : hors fenêtre et hors dérive)
+KNOWN_DEVIATIONS = f"{BY_EQUIPMENT} AND deviation_pct IS NOT NULL"
+
+
+class BulkReauditEngine:
+    """
+    Parcourt `audits` par ordre (equipment_id, timestamp, rowid) en pagination par clé :
+    la mémoire reste bornée à un lot + la fenêtre Z-score de l'engin courant.
+    Chaque lot est écrit avec le curseur de reprise dans la même transaction.
+
+    Hypothèses de recalcul (la charge réellement saisie n'est pas stockée dans `audits`) :
+    charge = profil appris actif s'il existe, sinon charge typique du scénario ;
+    conditions atmosphériques standard (0 m, 25 °C) comme dans l'écran d'audit.
+    Seule la base chaude est recalculée : les audits archivés (archive.py) sont figés.
+    Verdicts soumis à la même règle de dérive que detect_anomaly : l'état CUSUM/EWMA de chaque
+    engin est rejoué le long du parcours (audits archivés, puis écarts recalculés).
+    La fenêtre Z-score de chaque engin est amorcée de la même façon, par ses derniers écarts archivés.
+    """
+
+    HISTORY_WINDOW = 20  # Identique à la fenêtre de render_audit_page
+
+    _COLUMNS = "rowid, equipment_id, timestamp, materiel_type, scenario_code, index_start, index_end, power_kw, fuel_declared_l, deviation_pct, verdict"
+    FIRST_CHUNK = hot_query("reaudit_first_chunk", f"SELECT {_COLUMNS} FROM audits WHERE equipment_id IS NOT NULL AND timestamp IS NOT NULL ORDER BY equipment_id, timestamp, rowid LIMIT ?", (5000,))
+    NEXT_CHUNK = hot_query("reaudit_chunk", f"SELECT {_COLUMNS} FROM audits WHERE (equipment_id, timestamp, rowid) > (?, ?, ?) ORDER BY equipment_id, timestamp, rowid LIMIT ?", ("EQ", "2025-01-01", 0, 5000))
+    HISTORY = hot_query("reaudit_history", "SELECT deviation_pct FROM audits WHERE equipment_id = ? AND (timestamp, rowid) <= (?, ?) AND deviation_pct IS NOT NULL ORDER BY timestamp DESC, rowid DESC LIMIT ?", ("EQ", "2025-01-01", 0, 20))
+    COLD_HISTORY = hot_query("reaudit_cold_history", AuditArchive.latest_sql(HOT, "deviation_pct", KNOWN_DEVIATIONS), ("EQ", 20))
+    DRIFT_HISTORY = hot_query("reaudit_drift_history", "SELECT timestamp, deviation_pct FROM audits WHERE equipment_id = ? AND (timestamp, rowid) <= (?, ?) AND deviation_pct IS NOT NULL ORDER BY timestamp, rowid", ("EQ", "2025-01-01", 0))
+    # Mêmes lignes que le parcours par clé (les NULL n'en font pas partie)
+    COUNT_ROWS = hot_query("reaudit_count", "SELECT COUNT(*) AS n FROM audits WHERE equipment_id IS NOT NULL AND timestamp IS NOT NULL")
+
+    def __init__(self, db, detector: Optional[IntelligentAnomalyDetector] = None, chunk_size: int = 5000,
+                 drift: Optional[DriftStore] = None):
+        self.db = db
+        self.detector = detector or IntelligentAnomalyDetector()
+        self.chunk_size = chunk_size
+        self.drift_detector = (drift or DriftStore(db)).detector
+
+    # --- SUIVI DES EXÉCUTIONS ---
+    def start_run(self) -> str:
+        try: aging = float(self.db.get_config_value("AGING_FACTOR", "1.05"))
+        except (TypeError, ValueError): aging = 1.05
+        total = self.db.execute_read(self.COUNT_ROWS)[0]['n']
+        run_id = uuid.uuid4().hex[:12]
+        self.db.execute_write(
+            "INSERT INTO reaudit_runs (run_id, started_at, status, aging_factor, total_rows) VALUES (?, ?, 'RUNNING', ?, ?)",
+            (run_id, datetime.now().isoformat(), aging, total)
+        )
+        return run_id
+
+    def get_run(self, run_id) -> Optional[Dict]:
+        rows = self.db.execute_read("SELECT * FROM reaudit_runs WHERE run_id = ?", (run_id,))
+        return dict(rows[0]) if rows else None
+
+    def list_unfinished_runs(self):
+        return [dict(r) for r in self.db.execute_read(
+            "SELECT * FROM reaudit_runs WHERE status != 'DONE' ORDER BY started_at DESC"
+        )]
+
+    # --- LECTURE EN FLUX ---
+    def _fetch_chunk(self, cursor):
+        if cursor is None: return self.db.execute_read(self.FIRST_CHUNK, (self.chunk_size,))
+        return self.db.execute_read(self.NEXT_CHUNK, (*cursor, self.chunk_size))
+
+    def _history_start(self, equipment_id, cold_aliases, cursor=None) -> deque:
+        """
+        Fenêtre Z-score avant le premier audit à recalculer : écarts déjà recalculés (reprise),
+        complétés par les plus récents des archives, comme la fenêtre amorcée par RollingStatsStore.
+        """
+        rows = list(self.db.execute_read(self.HISTORY, (*cursor, self.HISTORY_WINDOW))) if cursor is not None else []
+        for alias in reversed(cold_aliases):
+            if len(rows) >= self.HISTORY_WINDOW: break
+            query = AuditArchive.latest_sql(alias, "deviation_pct", KNOWN_DEVIATIONS)
+            rows += self.db.execute_read(query, (equipment_id, self.HISTORY_WINDOW - len(rows)))
+        return deque(reversed([r['deviation_pct'] for r in rows]), maxlen=self.HISTORY_WINDOW)
+
+    def _drift_start(self, equipment_id, cold_aliases, cursor=None) -> DriftState:
+        """État de dérive avant le premier audit à recalculer : audits archivés (figés), puis déjà recalculés (reprise)"""
+        stamps, values = [], []
+        for alias in cold_aliases:
+            query, _ = AuditArchive.stream_sql(alias, "timestamp, deviation_pct", KNOWN_DEVIATIONS)
+            for r in self.db.iter_read(query, (equipment_id,)): stamps.append(r['timestamp']); values.append(r['deviation_pct'])
+        if cursor is not None:
+            for r in self.db.iter_read(self.DRIFT_HISTORY, cursor): stamps.append(r['timestamp']); values.append(r['deviation_pct'])
+        bank = self.drift_detector.new_bank([DriftState(equipment_id)])
+        self.drift_detector.run(bank, [0] * len(values), values, stamps)
+        return self.drift_detector.states_from_bank([equipment_id], bank)[0]
+
+    def _drift_alarms(self, rows, dev, valid, carry, cold_aliases):
+        """
+        Alarme de dérive après chaque ligne du lot (0 si l'écart est inconnu) et état du dernier engin.
+        carry = (engin, état) en fin de lot précédent : un engin à cheval sur deux lots continue son état.
+        """
+        codes, states, obs, idx, values, stamps = {}, [], [], [], [], []
+        for i, r in enumerate(rows):
+            eq = r['equipment_id']
+            if eq not in codes:
+                codes[eq] = len(codes)
+                states.append(carry[1] if carry and carry[0] == eq else self._drift_start(eq, cold_aliases))
+            value = float(dev[i]) if valid[i] else r['deviation_pct']
+            if value is None: continue
+            obs.append(i); idx.append(codes[eq]); values.append(value); stamps.append(r['timestamp'])
+        bank = self.drift_detector.new_bank(states)
+        alarms = np.zeros(len(rows), dtype=np.int8)
+        alarms[obs] = self.drift_detector.run(bank, idx, values, stamps)
+        last = rows[-1]['equipment_id']
+        return alarms, (last, self.drift_detector.states_from_bank(list(codes), bank)[codes[last]])
+
+    def _learned_loads(self, equipment_ids):
+        placeholders = ",".join("?" * len(equipment_ids))
+        rows = self.db.execute_read(
+            f"SELECT equipment_id, scenario_code, load_typ FROM equipment_load_overrides WHERE is_active = 1 AND equipment_id IN ({placeholders})",
+            tuple(equipment_ids)
+        )
+        return {(r['equipment_id'], r['scenario_code']): r['load_typ'] for r in rows}
+
+    # --- RECALCUL ---
+    def _estimate_chunk(self, rows, aging):
+        """Estimation théorique vectorisée pour tout le lot"""
+        overrides = self._learned_loads({r['equipment_id'] for r in rows})
+        loads = np.empty(len(rows))
+        for i, r in enumerate(rows):
+            learned = overrides.get((r['equipment_id'], r['scenario_code']))
+            if learned is not None: loads[i] = learned
+            else:
+                scenario = DetailedLoadFactorManager.get_scenario(r['scenario_code'])
+                loads[i] = scenario.load_typ if scenario else np.nan
+        k, b = IsoWillansModel.coefficients_for_engines([r['materiel_type'] for r in rows])
+        p_nom = np.array([r['power_kw'] if r['power_kw'] is not None else np.nan for r in rows], dtype=float)
+        hours = np.array([(r['index_end'] or 0.0) - (r['index_start'] or 0.0) for r in rows], dtype=float)
+        fuel = np.array([r['fuel_declared_l'] if r['fuel_declared_l'] is not None else np.nan for r in rows], dtype=float)
+
+        l_h = IsoWillansModel.predict_consumption_array(loads * 100, 0, 25, aging, p_nom, k, b)
+        est = l_h * hours
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dev = np.where(est > 0, (fuel - est) / est * 100, 0.0)
+        # Lignes non recalculables (scénario inconnu, puissance ou carburant manquant) : laissées telles quelles
+        valid = np.isfinite(est) & np.isfinite(dev)
+        return est, dev, valid
+
+    def run(self, run_id: Optional[str] = None, progress_callback: Optional[ProgressCallback] = None,
+            should_stop: Optional[Callable[[], bool]] = None) -> Dict:
+        """Lance (ou reprend si run_id est fourni) un ré-audit complet"""
+        run_id = run_id or self.start_run()
+        run = self.get_run(run_id)
+        if run is None: raise ValueError(f"Ré-audit inconnu : {run_id}")
+        if run['status'] == 'DONE': return run
+
+        aging = run['aging_factor']
+        processed, changed = run['processed_rows'] or 0, run['changed_verdicts'] or 0
+        cursor, carry = None, None
+        history, history_eq = None, None
+        cold_aliases = [alias for alias in AuditArchive(self.db).partitions() if alias != HOT]
+        if run['cursor_equipment_id'] is not None:
+            cursor = (run['cursor_equipment_id'], run['cursor_timestamp'], run['cursor_rowid'])
+            history, history_eq = self._history_start(cursor[0], cold_aliases, cursor), cursor[0]
+            carry = (cursor[0], self._drift_start(cursor[0], cold_aliases, cursor))
+        self.db.execute_write("UPDATE reaudit_runs SET status = 'RUNNING' WHERE run_id = ?", (run_id,))
+
+        while True:
+            if should_stop and should_stop():
+                self.db.execute_write("UPDATE reaudit_runs SET status = 'PAUSED' WHERE run_id = ?", (run_id,))
+                return self.get_run(run_id)
+
+            rows = self._fetch_chunk(cursor)
+            if not rows: break
+            est, dev, valid = self._estimate_chunk(rows, aging)
+            drift_alarms, carry = self._drift_alarms(rows, dev, valid, carry, cold_aliases)
+
+            # Fenêtre glissante de chaque ligne (plus récent en premier, comme render_audit_page)
+            windows, scored = [], []
+            for i, r in enumerate(rows):
+                if r['equipment_id'] != history_eq:
+                    history, history_eq = self._history_start(r['equipment_id'], cold_aliases), r['equipment_id']
+                if not valid[i]:
+                    if r['deviation_pct'] is not None: history.append(r['deviation_pct'])
+                    continue
+                windows.append(list(reversed(history)))
+                scored.append(i)
+                history.append(float(dev[i]))
+
+            updates = []
+            if scored:
+                idx = np.array(scored)
+                res = self.detector.score_from_baselines(dev[idx], *self.detector.window_baselines(windows))
+                res = self.detector.apply_drift(res, drift_alarms[idx])
+                for j, i in enumerate(scored):
+                    e, verdict = float(est[i]), res.verdict[j]
+                    if verdict != rows[i]['verdict']: changed += 1
+                    updates.append((e * 0.9, e, e * 1.1, float(dev[i]), float(res.z_score[j]), verdict, int(res.confidence[j] * 100), rows[i]['rowid']))
+
+            last = rows[-1]
+            cursor = (last['equipment_id'], last['timestamp'], last['rowid'])
+            processed += len(rows)
+            with self.db.write_transaction("reaudit_chunk") as conn:
+                conn.executemany(
+                    "UPDATE audits SET estimated_min = ?, estimated_typ = ?, estimated_max = ?, deviation_pct = ?, z_score = ?, verdict = ?, confidence_pct = ? WHERE rowid = ?",
+                    updates
+                )
+                conn.execute(
+                    "UPDATE reaudit_runs SET processed_rows = ?, changed_verdicts = ?, cursor_equipment_id = ?, cursor_timestamp = ?, cursor_rowid = ? WHERE run_id = ?",
+                    (processed, changed, *cursor, run_id)
+                )
+            if progress_callback: progress_callback(processed, run['total_rows'])
+
+        self.db.execute_write(
+            "UPDATE reaudit_runs SET status = 'DONE', finished_at = ? WHERE run_id = ?",
+            (datetime.now().isoformat(), run_id)
+        )
+        logger.info(f"Ré-audit {run_id} terminé : {processed} audits, {changed} verdicts modifiés")
+        return self.get_run(run_id)
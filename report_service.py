@@ -0,0 +1,144 @@
+# ==============================================================================
+# REPORT_SERVICE.PY - Rendu PDF Parallèle (Pool de Processus)
+# ReportLab est CPU-bound : les rapports sont rendus hors du thread Streamlit,
+# sur plusieurs cœurs. Sert aussi d'outil CLI pour les exports nocturnes.
+# Usage : python report_service.py --out exports/ [--since 2025-01-01] [--until 2025-02-01]
+# ==============================================================================
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable, Optional, Tuple
+
+from reports import PDFReportGenerator
+from archive import AuditArchive
+from database import hot_query
+from metrics import METRICS
+
+_generator = None  # Un générateur par processus worker
+
+
+def _render_report(data: Dict, license_tier: str) -> bytes:
+    global _generator
+    if _generator is None: _generator = PDFReportGenerator()
+    return _generator.generate_audit_report(data, license_tier=license_tier).getvalue()
+
+
+def _render_report_to_file(data: Dict, license_tier: str, path: str) -> str:
+    pdf = _render_report(data, license_tier)
+    tmp_path = f"{path}.part"
+    with open(tmp_path, "wb") as f: f.write(pdf)
+    os.replace(tmp_path, path)  # Jamais de fichier PDF à moitié écrit
+    return path
+
+
+def report_filename(data: Dict) -> str:
+    return f"AUDIT_{str(data['audit_uuid'])[:8]}.pdf"
+
+
+class ReportService:
+    """
+    File de travaux de rendu PDF (dict d'audit + licence) exécutés dans un pool de processus.
+    submit() renvoie un Future[bytes] ; submit_to_file() un Future[chemin].
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) - 1)
+        # 'spawn' : pas de fork d'un process Streamlit multi-thread
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None: cls._instance = cls()
+        return cls._instance
+
+    def submit(self, data: Dict, license_tier: str = 'DISCOVERY', cache=None) -> "Future[bytes]":
+        """Avec un PDFCache : réponse immédiate depuis le disque, sinon rendu puis mise en cache"""
+        t0 = time.perf_counter()
+        if cache is not None:
+            pdf = cache.get(data['audit_uuid'], license_tier)
+            if pdf is not None:
+                fut = Future(); fut.set_result(pdf)
+                METRICS.observe("gencontrol_pdf_seconds", time.perf_counter() - t0, report="cache")
+                return fut
+        fut = self._executor.submit(_render_report, data, license_tier)
+        # Rendu dans un processus worker (ses propres métriques y restent) : durée vue d'ici, file comprise
+        fut.add_done_callback(lambda done: METRICS.observe("gencontrol_pdf_seconds", time.perf_counter() - t0, report="pool"))
+        if cache is not None:
+            def _store(done):
+                if done.exception() is None: cache.put(data['audit_uuid'], license_tier, done.result())
+            fut.add_done_callback(_store)
+        return fut
+
+    def submit_to_file(self, data: Dict, license_tier: str, path: str) -> "Future[str]":
+        return self._executor.submit(_render_report_to_file, data, license_tier, path)
+
+    def export_to_directory(self, jobs: Iterable[Tuple[Dict, str]], output_dir: str, progress_callback=None) -> Dict[str, int]:
+        """
+        Rend tous les travaux (data, licence) dans output_dir. Au plus 4 travaux par worker
+        sont en vol : la file reste bornée même pour un très grand nombre d'audits.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        stats = {'written': 0, 'failed': 0}
+        in_flight, max_in_flight = set(), self.max_workers * 4
+
+        def _collect(done):
+            for fut in done:
+                in_flight.discard(fut)
+                if fut.exception() is None: stats['written'] += 1
+                else: stats['failed'] += 1
+                if progress_callback: progress_callback(stats['written'] + stats['failed'])
+
+        for data, tier in jobs:
+            if len(in_flight) >= max_in_flight:
+                _collect([next(as_completed(in_flight))])
+            in_flight.add(self.submit_to_file(data, tier, os.path.join(output_dir, report_filename(data))))
+        _collect(list(as_completed(in_flight)))
+        return stats
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+
+USER_TIER = hot_query("report_export_tier", "SELECT license_tier FROM users WHERE username = ?", ("user",))
+
+
+def iter_export_jobs(db, since=None, until=None):
+    """Audits de la période (archives comprises) avec la licence de leur auteur, en flux"""
+    tiers = {}
+    for row in AuditArchive(db).iter_select(since=since, until=until):
+        user = row['created_by']
+        if user not in tiers:
+            found = db.execute_read(USER_TIER, (user,))
+            tiers[user] = (found[0]['license_tier'] if found else None) or 'DISCOVERY'
+        yield PDFReportGenerator.audit_row_to_report_data(row), tiers[user]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export PDF en masse des audits GEN-CONTROL")
+    parser.add_argument("--out", required=True, help="Répertoire de sortie")
+    parser.add_argument("--since", default=None, help="Date de début ISO (incluse)")
+    parser.add_argument("--until", default=None, help="Date de fin ISO (exclue)")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    from database import ThreadSafeDatabase
+    db = ThreadSafeDatabase.get_instance()
+    service = ReportService(args.workers)
+    try:
+        stats = service.export_to_directory(
+            iter_export_jobs(db, args.since, args.until), args.out,
+            progress_callback=lambda n: print(f"\r{n} rapports", end="", flush=True) if n % 100 == 0 else None
+        )
+    finally: service.shutdown()
+    print(f"\n{stats['written']} rapports écrits dans {args.out}, {stats['failed']} échecs.")
+
+
+if __name__ == "__main__":
+    main()
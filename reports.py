@@ -2,13 +2,21 @@
 # REPORTS.PY - Générateur PDF (Watermark & Branding)
 # ==============================================================================
 from io import BytesIO
+from itertools import chain, islice
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 from reportlab.lib.colors import grey, black, red, green, orange
 from datetime import datetime
 
+from metrics import timed
+
 class PDFReportGenerator:
-    
+    # À incrémenter à chaque modification de la mise en page (invalide le cache PDF)
+    TEMPLATE_VERSION = "1.1.2"
+    # ReportLab garde chaque page en mémoire jusqu'à c.save() : un document de flotte est borné à ce nombre de pages
+    PAGES_PER_PART = 500
+
+    @timed("gencontrol_pdf_seconds", report="audit")
     def generate_audit_report(self, data, license_tier='DISCOVERY'):
         """
         Génère un rapport PDF avec marquage commercial.
@@ -16,16 +24,94 @@ class PDFReportGenerator:
         """
         buffer = BytesIO()
         c = canvas.Canvas(buffer, pagesize=A4)
+
+        self._draw_header(c, license_tier)
+        self._draw_watermark(c, license_tier)
+        self._draw_audit_body(c, data, license_tier, datetime.now())
+        self._draw_footer(c, license_tier)
+
+        c.showPage()
+        c.save()
+        buffer.seek(0)
+        return buffer
+
+    @timed("gencontrol_pdf_seconds", report="fleet")
+    def generate_fleet_report(self, audits, output, license_tier='DISCOVERY', max_pages=PAGES_PER_PART, first_page=1):
+        """
+        Rapport de flotte : une page par audit dans un seul document.
+        audits : itérateur (générateur conseillé) de dicts au format generate_audit_report.
+        output : chemin de fichier ou flux binaire ouvert en écriture.
+        En-tête, filigrane et pied de page sont dessinés une seule fois (Form XObject)
+        et référencés par chaque page : seul le contenu propre à l'audit est ajouté.
+        Au plus max_pages audits sont consommés (mémoire bornée) : les suivants restent dans
+        l'itérateur, voir generate_fleet_report_parts. Renvoie le nombre de pages.
+        """
+        audits = islice(audits, max_pages)
+        c = canvas.Canvas(output, pagesize=A4, pageCompression=1)
+        width, _ = A4
+
+        c.beginForm("static_page")
+        self._draw_header(c, license_tier)
+        self._draw_watermark(c, license_tier)
+        self._draw_footer(c, license_tier)
+        c.endForm()
+
+        pages = 0
+        for data in audits:
+            pages += 1
+            c.doForm("static_page")
+            self._draw_audit_body(c, data, license_tier, data.get('timestamp') or datetime.now())
+            c.setFont("Helvetica", 8)
+            c.setFillColor(grey)
+            c.drawRightString(width - 50, 30, f"Page {first_page + pages - 1}")
+            c.showPage()
+
+        if pages == 0:
+            c.doForm("static_page")
+            c.setFont("Helvetica", 12)
+            c.drawCentredString(width / 2, A4[1] / 2, "Aucun audit sur la période sélectionnée.")
+            c.showPage()
+        c.save()
+        return pages
+
+    def generate_fleet_report_parts(self, audits, part_output, license_tier='DISCOVERY', max_pages=PAGES_PER_PART):
+        """
+        Rapport de flotte en plusieurs documents d'au plus max_pages pages (numérotation continue).
+        part_output(k) : destination de la partie k (à partir de 1). Renvoie le nombre de pages de chaque partie.
+        """
+        audits, parts = iter(audits), []
+        while True:
+            head = next(audits, None)
+            if head is None and parts: return parts
+            rest = chain([] if head is None else [head], audits)  # Aucun audit : une seule partie, page « vide »
+            parts.append(self.generate_fleet_report(rest, part_output(len(parts) + 1), license_tier, max_pages, sum(parts) + 1))
+
+    @staticmethod
+    def audit_row_to_report_data(row):
+        """Ligne de la table audits -> dict attendu par les générateurs"""
+        ts = row['timestamp']
+        try: ts = datetime.fromisoformat(ts) if isinstance(ts, str) else ts
+        except ValueError: ts = None
+        return {
+            'audit_uuid': row['audit_uuid'], 'equipment_name': row['materiel_name'] or row['equipment_id'],
+            'user': row['created_by'], 'fuel_declared': row['fuel_declared_l'] or 0.0,
+            'fuel_estimated': row['estimated_typ'] or 0.0, 'deviation': row['deviation_pct'] or 0.0,
+            'verdict': row['verdict'], 'scenario': row['scenario_code'],
+            'hours': (row['index_end'] or 0.0) - (row['index_start'] or 0.0), 'timestamp': ts,
+        }
+
+    # --- ÉLÉMENTS DE PAGE ---
+    def _draw_header(self, c, license_tier):
         width, height = A4
-        
+
         # --- 1. EN-TÊTE & LOGO ---
         c.setFont("Helvetica-Bold", 20)
         c.setFillColor(black)
         c.drawString(50, height - 50, "DI-SOLUTIONS | GEN-CONTROL")
-        
+
         c.setFont("Helvetica", 10)
         c.drawString(50, height - 65, "Expertise Audit & Efficacité Énergétique")
-        
+
         # Sous-titre dynamique
         if license_tier == 'CORPORATE':
             subtitle = "RAPPORT CERTIFIÉ - LICENCE ENTREPRISE"
@@ -36,24 +122,29 @@ class PDFReportGenerator:
         else: # Discovery
             subtitle = "RAPPORT D'ÉVALUATION (GRATUIT)"
             c.setFillColor(grey)
-            
+
         c.setFont("Helvetica-Bold", 14)
         c.drawRightString(width - 50, height - 50, subtitle)
-        
+
         c.setStrokeColor(grey)
         c.line(50, height - 80, width - 50, height - 80)
-        
+
+    def _draw_watermark(self, c, license_tier):
         # --- 2. WATERMARK ANTI-COMMERCIAL (DISCOVERY) ---
-        if license_tier == 'DISCOVERY':
-            c.saveState()
-            c.translate(width / 2, height / 2)
-            c.rotate(45)
-            c.setFont("Helvetica-Bold", 60)
-            c.setFillColor(grey, alpha=0.15) # Gris transparent léger
-            c.drawCentredString(0, 0, "DÉMONSTRATION")
-            c.setFont("Helvetica-Bold", 40)
-            c.drawCentredString(0, -50, "NON VALIDE COMMERCIALEMENT")
-            c.restoreState()
+        if license_tier != 'DISCOVERY': return
+        width, height = A4
+        c.saveState()
+        c.translate(width / 2, height / 2)
+        c.rotate(45)
+        c.setFont("Helvetica-Bold", 60)
+        c.setFillColor(grey, alpha=0.15) # Gris transparent léger
+        c.drawCentredString(0, 0, "DÉMONSTRATION")
+        c.setFont("Helvetica-Bold", 40)
+        c.drawCentredString(0, -50, "NON VALIDE COMMERCIALEMENT")
+        c.restoreState()
+
+    def _draw_audit_body(self, c, data, license_tier, report_date):
+        width, height = A4
 
         # --- 3. CONTENU ---
         y = height - 120
@@ -61,16 +152,16 @@ class PDFReportGenerator:
         c.setFont("Helvetica-Bold", 12)
         c.drawString(50, y, "1. INFORMATIONS GÉNÉRALES")
         y -= 20
-        
+
         info_data = [
             ("ID Audit:", data['audit_uuid']),
-            ("Date:", datetime.now().strftime("%d/%m/%Y %H:%M")),
+            ("Date:", report_date.strftime("%d/%m/%Y %H:%M")),
             ("Opérateur:", data['user']),
             ("Licence:", license_tier),
             ("Équipement:", data['equipment_name']),
             ("Scénario:", data['scenario'])
         ]
-        
+
         c.setFont("Helvetica", 10)
         for label, val in info_data:
             c.drawString(70, y, label)
@@ -81,39 +172,36 @@ class PDFReportGenerator:
         c.setFont("Helvetica-Bold", 12)
         c.drawString(50, y, "2. RÉSULTATS ANALYSE")
         y -= 30
-        
+
         verdict = data['verdict']
         box_color = green if verdict == 'NORMAL' else (orange if verdict == 'SUSPECT' else red)
-        
+
         c.setFillColor(box_color)
         c.rect(50, y - 10, width - 100, 30, fill=1, stroke=0)
         c.setFillColor(black if verdict == 'SUSPECT' else (1,1,1))
         c.setFont("Helvetica-Bold", 12)
         c.drawCentredString(width / 2, y, f"VERDICT : {verdict}")
-        
+
         y -= 40
         c.setFillColor(black)
         c.setFont("Helvetica", 10)
-        
+
         metrics = [
             ("Carburant Déclaré:", f"{data['fuel_declared']:.1f} L"),
             ("Estimation Théorique:", f"{data['fuel_estimated']:.1f} L"),
             ("Écart:", f"{data['deviation']:+.1f} %"),
             ("Heures moteur:", f"{data['hours']:.1f} h")
         ]
-        
+
         for label, val in metrics:
             c.drawString(70, y, label)
             c.drawRightString(width - 70, y, str(val))
             y -= 20
 
+    def _draw_footer(self, c, license_tier):
+        width, _ = A4
         # --- 4. FOOTER ---
         c.setFont("Helvetica-Oblique", 8)
         c.setFillColor(grey)
         footer_text = f"Généré par GEN-CONTROL V1.1 ({license_tier}) - DI-SOLUTIONS"
         c.drawCentredString(width / 2, 30, footer_text)
-        
-        c.showPage()
-        c.save()
-        buffer.seek(0)
-        return buffer
\ No newline at end of file
@@ -2,19 +2,170 @@
 # GEN-CONTROL V1.1 - Module Sécurité (Compatible Streamlit Récent)
 # Gestion Auth, IP (Nouvelle API) & Tokens
 # ==============================================================================
-import bcrypt
 import pyotp
 import jwt
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
 import streamlit as st # Nécessaire pour la nouvelle méthode IP
-from datetime import datetime, timedelta
-from typing import Tuple, Optional
+from datetime import timedelta
+from typing import Dict, Tuple, Optional
+from passwords import PasswordHasher, HasherBusyError
+from database import hot_query
+
+logger = logging.getLogger(__name__)
 
 # Clé secrète pour signer les tokens
 SECRET_KEY = "DI-SOLUTIONS-SUPER-SECRET-KEY-2025"
 
+SESSION_DURATION = timedelta(hours=8)
+
+REVOCATIONS_SINCE = hot_query("revocations_since", "SELECT rowid, jti FROM revoked_tokens WHERE rowid > ? ORDER BY rowid", (0,))
+SESSION_CUTOFFS = hot_query("session_cutoffs", "SELECT username, revoked_before FROM session_cutoffs", (), True)
+REVOKED_TOKEN_LOOKUP = hot_query("revoked_token_lookup", "SELECT 1 FROM revoked_tokens WHERE jti = ?", ("JTI",))
+SIGNUP_ABUSE = hot_query("signup_abuse", "SELECT COUNT(*) as cnt FROM users WHERE signup_ip = ? AND created_at > datetime('now', '-1 day')", ("127.0.0.1",))
+USER_PASSWORD = hot_query("user_password", "SELECT password_hash FROM users WHERE username = ?", ("admin",))
+USER_2FA = hot_query("user_2fa", "SELECT two_factor_secret FROM users WHERE username = ?", ("admin",))
+
+# --- RÉVOCATION COMPACTE (Filtre de Bloom) ---
+class BloomFilter:
+    """Test d'appartenance sans faux négatifs : un 'peut-être' est confirmé en base"""
+    def __init__(self, capacity=100_000, n_hashes=7):
+        self.n_bits = max(1024, capacity * 10)  # ~1% de faux positifs
+        self.n_hashes = n_hashes
+        self.bits = bytearray(self.n_bits // 8 + 1)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little')
+        return ((h1 + i * h2) % self.n_bits for i in range(self.n_hashes))
+
+    def add(self, key: str):
+        for pos in self._positions(key): self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class SessionStore:
+    """
+    Validation des sessions commune à toutes les sessions Streamlit du process :
+    - cache LRU/TTL des jetons déjà validés (pas de décodage JWT à chaque rerun) ;
+    - jetons révoqués (logout) dans un filtre de Bloom adossé à la table revoked_tokens ;
+    - révocations forcées par utilisateur (session_cutoffs) : tout jeton émis avant est refusé
+      (iat et seuil à la microseconde : un jeton émis plus tôt dans la même seconde ne survit pas).
+    Les révocations faites par un autre process sont relues toutes les REFRESH_INTERVAL_S.
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    CACHE_SIZE = 10_000
+    CACHE_TTL_S = 300
+    REFRESH_INTERVAL_S = 5.0
+
+    def __init__(self, db):
+        self.db = db
+        self._cache: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+        self._state_lock = threading.Lock()
+        self._bloom = BloomFilter()
+        self._cutoffs: Dict[str, float] = {}
+        self._last_revocation_rowid = 0
+        self._last_refresh = 0.0
+        self._refresh(force=True)
+
+    @classmethod
+    def get_instance(cls, db):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None: cls._instance = cls(db)
+        return cls._instance
+
+    # --- SYNCHRONISATION AVEC LA BASE ---
+    def _refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_refresh < self.REFRESH_INTERVAL_S: return
+        self._last_refresh = now
+        rows = self.db.execute_read(REVOCATIONS_SINCE, (self._last_revocation_rowid,))
+        cutoffs = self.db.execute_read(SESSION_CUTOFFS)
+        with self._state_lock:
+            for r in rows: self._bloom.add(r['jti'])
+            if rows: self._last_revocation_rowid = rows[-1]['rowid']
+            self._cutoffs = {r['username']: float(r['revoked_before']) for r in cutoffs}
+
+    def _is_revoked(self, claims) -> bool:
+        # <= : un jeton à iat entier (seconde tronquée) émis dans la seconde de la révocation est aussi refusé
+        if claims.get('iat', 0) <= self._cutoffs.get(claims.get('sub'), 0): return True
+        jti = claims.get('jti')
+        if jti is None or jti not in self._bloom: return False
+        # Positif du filtre (révoqué ou faux positif) : confirmation exacte
+        return bool(self.db.execute_read(REVOKED_TOKEN_LOOKUP, (jti,)))
+
+    # --- API ---
+    def validate(self, token, ip_address=None) -> Optional[dict]:
+        """Renvoie les claims si le jeton est valide (signature, expiration, IP, révocation)"""
+        if not token: return None
+        self._refresh()
+        now = time.time()
+        with self._state_lock:
+            entry = self._cache.get(token)
+            if entry is not None:
+                if entry[1] > now: self._cache.move_to_end(token)
+                else: del self._cache[token]; entry = None
+        if entry is not None: claims = entry[0]
+        else:
+            try: claims = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+            except jwt.PyJWTError: return None
+            with self._state_lock:
+                self._cache[token] = (claims, min(claims['exp'], now + self.CACHE_TTL_S))
+                while len(self._cache) > self.CACHE_SIZE: self._cache.popitem(last=False)
+        if ip_address is not None and claims.get('ip') != ip_address: return None
+        if self._is_revoked(claims): return None
+        return claims
+
+    def revoke_token(self, token):
+        """Logout : révoque ce jeton pour toutes les sessions"""
+        try: claims = jwt.decode(token, SECRET_KEY, algorithms=['HS256'], options={'verify_exp': False})
+        except jwt.PyJWTError: return
+        if 'jti' not in claims: return
+        self.db.execute_write(
+            "INSERT OR IGNORE INTO revoked_tokens (jti, username, revoked_at, expires_at) VALUES (?, ?, ?, ?)",
+            (claims['jti'], claims.get('sub'), time.time(), claims.get('exp'))
+        )
+        with self._state_lock:
+            self._bloom.add(claims['jti'])
+            self._cache.pop(token, None)
+
+    def revoke_user(self, username):
+        """Déconnexion forcée : tout jeton de cet utilisateur émis avant maintenant est refusé"""
+        cutoff = time.time()  # Même précision que l'iat de create_session_token : la reconnexion qui suit reste valide
+        self.db.execute_write("INSERT OR REPLACE INTO session_cutoffs (username, revoked_before) VALUES (?, ?)", (username, cutoff))
+        with self._state_lock: self._cutoffs[username] = cutoff
+
+    def purge_expired(self):
+        """Les jetons expirés n'ont plus besoin d'être listés ; filtre reconstruit depuis la table restante"""
+        # La ligne de rowid maximal est conservée : sans elle, SQLite réutiliserait des rowid déjà lus
+        # par les autres process (REVOCATIONS_SINCE) et leurs prochaines révocations y seraient invisibles.
+        self.db.execute_write(
+            "DELETE FROM revoked_tokens WHERE expires_at < ? AND rowid < (SELECT MAX(rowid) FROM revoked_tokens)", (time.time(),)
+        )
+        bloom = BloomFilter()
+        rows = self.db.execute_read(REVOCATIONS_SINCE, (0,))
+        for r in rows: bloom.add(r['jti'])
+        with self._state_lock:
+            self._bloom = bloom
+            self._last_revocation_rowid = rows[-1]['rowid'] if rows else 0
+        # Révocations enregistrées pendant la reconstruction
+        self._refresh(force=True)
+
+
 class EnhancedSecurityManager:
-    def __init__(self, db_connection):
+    def __init__(self, db_connection, hasher: Optional[PasswordHasher] = None, sessions: Optional[SessionStore] = None):
         self.db = db_connection
+        self.hasher = hasher or PasswordHasher.get_instance()
+        self.sessions = sessions or SessionStore.get_instance(db_connection)
 
     # --- GESTION IP (MÉTHODE OFFICIELLE STREAMLIT) ---
     @staticmethod
@@ -33,40 +184,36 @@ class EnhancedSecurityManager:
     def check_signup_abuse(self, ip_address) -> bool:
         """Vérifie si cette IP a créé trop de comptes (>2 / 24h)"""
         try:
-            query = """
-                SELECT COUNT(*) as cnt FROM users 
-                WHERE signup_ip = ? 
-                AND created_at > datetime('now', '-1 day')
-            """
-            res = self.db.execute_read(query, (ip_address,))
+            res = self.db.execute_read(SIGNUP_ABUSE, (ip_address,))
             count = res[0]['cnt'] if res else 0
             return count >= 2
         except Exception as e:
-            print(f"Erreur check abuse: {e}")
+            logger.error(f"Erreur check abuse: {e}")
             return False
 
     # --- AUTHENTIFICATION ---
     def verify_password(self, username, password, ip_address) -> Tuple[bool, str]:
-        """Vérifie le mot de passe hashé (Bcrypt)"""
+        """Vérifie le mot de passe hashé (Bcrypt, hors thread Streamlit)"""
         try:
-            user_data = self.db.execute_read("SELECT password_hash FROM users WHERE username = ?", (username,))
+            user_data = self.db.execute_read(USER_PASSWORD, (username,))
             if not user_data: return False, "Utilisateur inconnu"
             
             stored_hash = user_data[0]['password_hash']
+            if not self.hasher.check_password(password, stored_hash): return False, "Mot de passe incorrect"
             
-            # Gestion stricte des types bytes/str pour Bcrypt
-            if isinstance(stored_hash, str): stored_hash = stored_hash.encode('utf-8')
-            password_bytes = password.encode('utf-8')
-            
-            if bcrypt.checkpw(password_bytes, stored_hash): return True, "Connexion réussie"
-            else: return False, "Mot de passe incorrect"
+            # Re-hachage transparent si le coût configuré a changé
+            if self.hasher.needs_rehash(stored_hash):
+                try:
+                    self.db.execute_write("UPDATE users SET password_hash = ? WHERE username = ?", (self.hasher.hash_password(password), username))
+                except Exception as e: logger.error(f"Erreur rehash: {e}")
+            return True, "Connexion réussie"
+        except HasherBusyError as e: return False, str(e)
         except Exception as e: return False, f"Erreur technique: {str(e)}"
 
     def create_user(self, username, password, role='user', tier='DISCOVERY', ip='127.0.0.1'):
         """Crée un utilisateur avec hachage sécurisé"""
         try:
-            salt = bcrypt.gensalt()
-            hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
+            hashed = self.hasher.hash_password(password)
             self.db.execute_write(
                 "INSERT INTO users (username, password_hash, role, license_tier, signup_ip) VALUES (?, ?, ?, ?, ?)",
                 (username, hashed, role, tier, ip)
@@ -78,26 +225,28 @@ class EnhancedSecurityManager:
     # --- SESSION & 2FA ---
     def is_2fa_enabled(self, username) -> bool:
         try:
-            rows = self.db.execute_read("SELECT two_factor_secret FROM users WHERE username = ?", (username,))
+            rows = self.db.execute_read(USER_2FA, (username,))
             return bool(rows and rows[0]['two_factor_secret'])
         except: return False
 
     def verify_totp(self, username, token) -> bool:
         try:
-            rows = self.db.execute_read("SELECT two_factor_secret FROM users WHERE username = ?", (username,))
+            rows = self.db.execute_read(USER_2FA, (username,))
             if rows and rows[0]['two_factor_secret']:
                 return pyotp.TOTP(rows[0]['two_factor_secret']).verify(token)
             return False
         except: return False
 
     def create_session_token(self, username, ip_address) -> str:
-        payload = {'sub': username, 'ip': ip_address, 'iat': datetime.utcnow(), 'exp': datetime.utcnow() + timedelta(hours=8)}
+        now = time.time()  # iat fractionnaire (NumericDate, RFC 7519) : comparé au seuil de revoke_user
+        payload = {'sub': username, 'ip': ip_address, 'jti': uuid.uuid4().hex, 'iat': now, 'exp': int(now + SESSION_DURATION.total_seconds())}
         return jwt.encode(payload, SECRET_KEY, algorithm='HS256')
 
-    def validate_session(self, token) -> bool:
-        try:
-            jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-            return True
-        except: return False
+    def validate_session(self, token, ip_address=None) -> bool:
+        return self.sessions.validate(token, ip_address) is not None
+
+    def logout(self, token):
+        self.sessions.revoke_token(token)
 
-    def logout(self, token): pass
\ No newline at end of file
+    def revoke_user_sessions(self, username):
+        self.sessions.revoke_user(username)
\ No newline at end of file
@@ -0,0 +1,75 @@
+# ==============================================================================
+# SHARED_CACHE.PY - Cache Partagé Inter-Sessions (Tampons de Version)
+# Configuration, parc d'équipements, profils appris et catalogues constants :
+# lus une fois par processus, invalidés par espace de noms à chaque écriture.
+# ==============================================================================
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Hashable
+
+
+class SharedCache:
+    """
+    Chaque espace de noms ('config', 'equipment', ...) a un numéro de version.
+    Une entrée n'est valide que si elle porte la version courante de son espace :
+    bump() invalide donc d'un coup toutes les entrées, pour toutes les sessions du processus.
+    max_age_s borne la durée de vie des entrées (écritures faites hors de ce processus, ex. CLI).
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    DEFAULT_MAX_AGE_S = 60.0
+
+    def __init__(self, max_age_s=DEFAULT_MAX_AGE_S):
+        self.max_age_s = max_age_s
+        self._data_lock = threading.Lock()
+        self._versions = defaultdict(int)
+        self._entries = {}  # (espace, clé) -> (version, expiration, valeur)
+        self._hits = defaultdict(int)
+        self._misses = defaultdict(int)
+
+    @classmethod
+    def get_instance(cls):
+        """Instance du processus pour les données constantes (catalogues)"""
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None: cls._instance = cls(max_age_s=None)
+        return cls._instance
+
+    def get_or_load(self, namespace: str, key: Hashable, loader: Callable):
+        now = time.monotonic()
+        with self._data_lock:
+            version = self._versions[namespace]
+            entry = self._entries.get((namespace, key))
+            if entry is not None and entry[0] == version and (entry[1] is None or entry[1] > now):
+                self._hits[namespace] += 1
+                return entry[2]
+            self._misses[namespace] += 1
+        # Chargement hors verrou : deux sessions peuvent charger en parallèle, sans incohérence
+        value = loader()
+        with self._data_lock:
+            # Une écriture pendant le chargement a changé la version : on ne stocke pas une valeur périmée
+            if self._versions[namespace] == version:
+                expires = now + self.max_age_s if self.max_age_s else None
+                self._entries[(namespace, key)] = (version, expires, value)
+        return value
+
+    def bump(self, namespace: str):
+        with self._data_lock:
+            self._versions[namespace] += 1
+            for k in [k for k in self._entries if k[0] == namespace]: del self._entries[k]
+
+    def clear(self):
+        with self._data_lock:
+            for namespace in list(self._versions): self._versions[namespace] += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._data_lock:
+            namespaces = set(self._hits) | set(self._misses) | set(self._versions)
+            return {
+                ns: {'version': self._versions.get(ns, 0), 'hits': self._hits.get(ns, 0), 'misses': self._misses.get(ns, 0),
+                     'entries': sum(1 for k in self._entries if k[0] == ns)}
+                for ns in sorted(namespaces)
+            }
@@ -0,0 +1,22 @@
+# ==============================================================================
+# CONFTEST.PY - Base SQLite isolée par test (hors singleton de l'application)
+# ==============================================================================
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import ThreadSafeDatabase
+from passwords import PasswordHasher
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Instance ThreadSafeDatabase sur un fichier temporaire ; bcrypt au coût minimal ensuite"""
+    test_cls = type("TestDatabase", (ThreadSafeDatabase,), {"_instance": None, "DB_PATH": str(tmp_path / "test.db")})
+    instance = test_cls.get_instance()
+    PasswordHasher.get_instance().configure(rounds=PasswordHasher.MIN_ROUNDS)
+    yield instance
+    instance.reset_pool()
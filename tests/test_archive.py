@@ -0,0 +1,50 @@
+# ==============================================================================
+# TEST_ARCHIVE.PY - Déplacement des audits vers les archives annuelles
+# ==============================================================================
+import uuid
+
+import pytest
+
+from archive import AuditArchive
+
+
+def _seed(db, n=30, user="alice"):
+    db.execute_many(
+        "INSERT INTO audits (audit_uuid, timestamp, created_by, equipment_id, scenario_code, fuel_declared_l, estimated_typ, verdict) VALUES (?, ?, ?, 'EQ-1', 'GE_OFFICE_AC', 110, 100, 'NORMAL')",
+        [(uuid.uuid4().hex, f"2020-03-{1 + i % 28:02d}T10:00:00", user) for i in range(n)]
+    )
+
+
+def _counts(db):
+    hot = db.execute_read("SELECT COUNT(*) AS n FROM main.audits")[0]['n']
+    cold = db.execute_read("SELECT COUNT(*) AS n FROM arch_2020.audits")[0]['n']
+    quota = db.execute_read("SELECT n FROM audit_archive_counts WHERE created_by = 'alice'")
+    learned = db.execute_read("SELECT n_samples FROM audit_archive_learning WHERE equipment_id = 'EQ-1'")
+    return hot, cold, quota[0]['n'] if quota else 0, learned[0]['n_samples'] if learned else 0
+
+
+def test_run_moves_rows_and_counts_them(db):
+    _seed(db)
+    stats = AuditArchive(db, chunk_size=7).run(horizon_days=365)
+    assert stats['moved'] == 30 and stats['partitions'] == ["arch_2020"]
+    assert _counts(db) == (0, 30, 30, 30)
+    assert AuditArchive(db).count_by_user("alice") == 30
+
+
+def test_crash_between_copy_and_delete_loses_nothing(db, monkeypatch):
+    _seed(db)
+    real = db.write_transaction
+
+    def crash_on_move(name="write_transaction"):
+        if name == "archive_move": raise RuntimeError("coupure")
+        return real(name)
+
+    monkeypatch.setattr(db, "write_transaction", crash_on_move)
+    with pytest.raises(RuntimeError):
+        AuditArchive(db, chunk_size=7).run(horizon_days=365)
+    hot, cold, quota, _ = _counts(db)
+    assert hot == 30 and cold == 7 and quota == 0  # Copie validée, rien retiré ni compté
+
+    monkeypatch.setattr(db, "write_transaction", real)
+    AuditArchive(db, chunk_size=7).run(horizon_days=365)
+    assert _counts(db) == (0, 30, 30, 30)
@@ -0,0 +1,64 @@
+# ==============================================================================
+# TEST_BACKUPS.PY - Instantanés de la base et des archives annuelles
+# ==============================================================================
+import uuid
+
+import pytest
+
+from archive import AuditArchive
+from backups import BackupManager
+
+
+@pytest.fixture
+def manager(db, tmp_path):
+    return BackupManager(db, directory=str(tmp_path / "backups"))
+
+
+def _seed(db, n=30):
+    db.execute_many(
+        "INSERT INTO audits (audit_uuid, timestamp, created_by, equipment_id, scenario_code, fuel_declared_l, estimated_typ, verdict) VALUES (?, ?, 'alice', 'EQ-1', 'GE_OFFICE_AC', 110, 100, 'NORMAL')",
+        [(uuid.uuid4().hex, f"2020-03-{1 + i % 28:02d}T10:00:00") for i in range(n)]
+    )
+
+
+def _state(db):
+    archive = AuditArchive(db)
+    rows = archive.select("audit_uuid")
+    hot = db.execute_read("SELECT COUNT(*) AS n FROM main.audits")[0]['n']
+    return hot, len(rows), len({r['audit_uuid'] for r in rows}), archive.count_by_user("alice")
+
+
+def test_snapshot_restores_archives(db, manager):
+    _seed(db)
+    AuditArchive(db).run(horizon_days=365)
+    manifest = manager.create_snapshot(label="manual")
+    assert "arch_2020" in {a['alias'] for a in manifest['archives']} and manager.verify(manifest)
+    db.execute_write("DELETE FROM arch_2020.audits")
+    manager.restore(manifest, safety_snapshot=False)
+    assert _state(db) == (0, 30, 30, 30)
+
+
+def test_restore_before_archiving_counts_once(db, manager):
+    _seed(db)
+    manifest = manager.create_snapshot(label="manual")
+    AuditArchive(db).run(horizon_days=365)
+    manager.restore(manifest, safety_snapshot=False)
+    # Audits revenus dans la base chaude puis réarchivés après la restauration, comptés une fois
+    assert _state(db) == (0, 30, 30, 30)
+
+
+def test_archiving_during_snapshot_neither_lost_nor_duplicated(db, manager, monkeypatch):
+    _seed(db)
+    AuditArchive(db, chunk_size=10).run(horizon_days=365)
+    _seed(db, 12)  # Nouveaux audits de 2020 restés chauds
+    refresh = db.refresh_archives
+
+    def archive_between_copies():
+        monkeypatch.setattr(db, "refresh_archives", refresh)
+        AuditArchive(db).run(horizon_days=365)
+        refresh()
+
+    monkeypatch.setattr(db, "refresh_archives", archive_between_copies)
+    manifest = manager.create_snapshot(label="manual")
+    manager.restore(manifest, safety_snapshot=False)
+    assert _state(db) == (0, 42, 42, 42)
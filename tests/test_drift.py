@@ -0,0 +1,112 @@
+# ==============================================================================
+# TEST_DRIFT.PY - Dérive lente par engin (CUSUM / EWMA)
+# ==============================================================================
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from drift import DRIFT_UP, DriftDetector, DriftState, DriftStore
+
+
+def _run(detector, codes, x, n_equipment=1):
+    bank = detector.new_bank([DriftState(f"EQ-{i}") for i in range(n_equipment)])
+    stamps = [(datetime(2024, 1, 1) + timedelta(hours=i)).isoformat() for i in range(len(x))]
+    return detector.run(bank, codes, x, stamps), bank
+
+
+def test_stationary_series_never_alarms():
+    # Dispersion réelle sous la référence sigma : pas de fausse alarme sur un long historique
+    x = np.random.default_rng(0).normal(0, DriftDetector.SIGMA_PCT / 2, 500)
+    alarms, _ = _run(DriftDetector(), [0] * len(x), x)
+    assert not alarms.any()
+
+
+def test_slow_overconsumption_raises_cusum_alarm():
+    # +3 % par plein : 0,6 sigma, sous le seuil Z-score comme sous la limite EWMA stationnaire (3 sigma√(λ/(2-λ)) = 5 %)
+    alarms, bank = _run(DriftDetector(), [0] * 80, [3.0] * 80)
+    assert not alarms[:45].any()
+    assert (alarms[55:] == 1).all()
+    assert bank['ewma'][0] < DriftDetector().ewma_limit(80)
+
+
+@pytest.mark.parametrize("step, expected", [(12.0, 1), (-12.0, -1)])
+def test_level_shift_alarm_direction(step, expected):
+    x = [0.0] * 10 + [step] * 10
+    alarms, _ = _run(DriftDetector(), [0] * len(x), x)
+    assert not alarms[:10].any()
+    assert alarms[-1] == expected
+
+
+def test_cold_start_no_alarm():
+    alarms, _ = _run(DriftDetector(), [0] * 4, [40.0] * 4)
+    assert not alarms.any()
+
+
+def test_interleaved_equipment_match_separate_runs():
+    rng = np.random.default_rng(1)
+    a, b = list(rng.normal(4, 5, 60)), list(rng.normal(-1, 5, 40))
+    # Entrelacement aléatoire, ordre chronologique conservé par engin
+    codes_mixed = list(rng.permutation([0] * 60 + [1] * 40))
+    it = {0: iter(a), 1: iter(b)}
+    x_mixed = [next(it[c]) for c in codes_mixed]
+    mixed, bank = _run(DriftDetector(), codes_mixed, x_mixed, n_equipment=2)
+    alone_a, bank_a = _run(DriftDetector(), [0] * 60, a)
+    alone_b, bank_b = _run(DriftDetector(), [0] * 40, b)
+    codes_mixed = np.array(codes_mixed)
+    assert (mixed[codes_mixed == 0] == alone_a).all() and (mixed[codes_mixed == 1] == alone_b).all()
+    assert bank['cp'][0] == pytest.approx(bank_a['cp'][0]) and bank['ewma'][1] == pytest.approx(bank_b['ewma'][0])
+
+
+def test_streaming_matches_backfill(db):
+    rng = np.random.default_rng(2)
+    t0 = datetime(2024, 1, 1)
+    streaming = DriftStore(db)
+    audits = []
+    for i in range(120):
+        eq = "EQ-A" if i % 3 else "EQ-B"
+        dev = float(rng.normal(6 if eq == "EQ-A" else 0, 2))
+        audits.append((uuid.uuid4().hex, (t0 + timedelta(hours=i)).isoformat(), eq, dev))
+    db.execute_many("INSERT INTO audits (audit_uuid, timestamp, equipment_id, deviation_pct) VALUES (?, ?, ?, ?)", audits)
+    for _, ts, eq, dev in audits: streaming.push(eq, dev, ts)
+
+    recomputed = DriftStore(db)
+    recomputed.backfill(chunk_size=7)
+    for eq in ("EQ-A", "EQ-B"):
+        live, batch = streaming.get(eq), recomputed.get(eq)
+        assert (live.n, live.alarm, live.alarm_since) == (batch.n, batch.alarm, batch.alarm_since)
+        assert (live.ewma, live.cusum_pos, live.cusum_neg) == pytest.approx((batch.ewma, batch.cusum_pos, batch.cusum_neg))
+    assert [a['equipment_id'] for a in recomputed.alarms()] == ["EQ-A"]
+    assert recomputed.get("EQ-A").alarm == DRIFT_UP
+
+
+def _insert(db, eq, deviations, t0=datetime(2024, 1, 1)):
+    db.execute_many(
+        "INSERT INTO audits (audit_uuid, timestamp, equipment_id, deviation_pct) VALUES (?, ?, ?, ?)",
+        [(uuid.uuid4().hex, (t0 + timedelta(hours=i)).isoformat(), eq, d) for i, d in enumerate(deviations)]
+    )
+
+
+def test_backfill_from_other_process_not_undone(db):
+    app, cli = DriftStore(db), DriftStore(db)
+    app.push("EQ-A", 50.0)                      # État de l'application, périmé après le recalcul
+    _insert(db, "EQ-A", [1.0] * 10)
+    cli.backfill()
+    app.push("EQ-A", 1.0)  # Calcul toujours précédé d'une relecture des états modifiés
+    assert DriftStore(db).get("EQ-A").n == 11
+
+
+def test_push_during_backfill_is_kept(db):
+    store = DriftStore(db)
+    _insert(db, "EQ-A", [1.0] * 10)
+    pushes = []
+
+    def push_from_another_session(done):
+        t = threading.Thread(target=store.push, args=("EQ-A", 2.0, "2024-02-01T00:00:00"))
+        t.start(); pushes.append(t)
+
+    store.backfill(chunk_size=4, progress_callback=push_from_another_session)
+    for t in pushes: t.join()
+    assert DriftStore(db).get("EQ-A").n == 10 + len(pushes)
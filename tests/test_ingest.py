@@ -0,0 +1,66 @@
+# ==============================================================================
+# TEST_INGEST.PY - Import en masse : lignes invalides rejetées avec leur motif
+# ==============================================================================
+import io
+
+import pytest
+
+from ingest import BulkAuditImporter
+
+CSV_HEADER = "engin;conditions;index_debut;index_fin;litres;charge_pct;date\n"
+
+
+@pytest.fixture
+def importer(db):
+    db.add_equipment("GE-1", "Groupe 1", "GENERIC_GE", 100)
+    return BulkAuditImporter(db, "tester", chunk_size=4)
+
+
+def _errors(report):
+    return {e['line']: e['error'] for e in report['errors']}
+
+
+def test_malformed_csv_rows_rejected(db, importer):
+    rows = [
+        "GE-1;GE_OFFICE_AC;0;10;150,5;;01/03/2024",   # 2 : valide (décimale française)
+        "GE-9;GE_OFFICE_AC;0;10;150;;",               # 3 : engin inconnu
+        "GE-1;GE_OFFICE_AC;10;20;;;",                 # 4 : carburant manquant
+        "GE-1;GE_OFFICE_AC;abc;20;150;;",             # 5 : index non numérique
+        "GE-1;GE_OFFICE_AC;20;15;150;;",              # 6 : index de fin avant le début
+        "GE-1;GE_OFFICE_AC;5;15;150;;",               # 7 : chevauchement avec la ligne 2
+        "GE-1;GE_OFFICE_AC;10;20;-3;;",               # 8 : carburant négatif
+        "GE-1;GE_OFFICE_AC;10;20;150;150;",           # 9 : charge hors bornes
+        "GE-1;GE_OFFICE_AC;10;20;150;;31/02/2024",    # 10 : date impossible
+        "GE-1;GE_OFFICE_AC;10;20;nan;;",              # 11 : valeur non finie
+        "GE-1;GE_OFFICE_AC;10;20;148;;02/03/2024",    # 12 : valide
+    ]
+    report = importer.run(io.StringIO(CSV_HEADER + "\n".join(rows) + "\n"))
+    assert report['read'] == 11 and report['inserted'] == 2 and report['n_errors'] == 9
+    errors = _errors(report)
+    assert sorted(errors) == [3, 4, 5, 6, 7, 8, 9, 10, 11]
+    assert "Engin inconnu" in errors[3]
+    assert "fuel_declared_l" in errors[4]
+    assert "non numérique" in errors[5]
+    assert "Index incohérents" in errors[6]
+    assert "chevauchement" in errors[7]
+    assert "négatif" in errors[8]
+    assert "Charge hors bornes" in errors[9]
+    assert "Date illisible" in errors[10]
+    assert "invalide" in errors[11]
+    audits = db.execute_read("SELECT index_start, fuel_declared_l FROM audits ORDER BY index_start")
+    assert [(a['index_start'], a['fuel_declared_l']) for a in audits] == [(0, 150.5), (10, 148)]
+
+
+def test_malformed_jsonl_lines_rejected(db, importer):
+    lines = [
+        '{"equipment_id": "GE-1", "scenario_code": "GE_OFFICE_AC", "index_start": 0, "index_end": 10, "fuel_declared_l": 150}',
+        '{"equipment_id": "GE-1", ',
+        '[1, 2, 3]',
+        '{"equipment_id": "GE-1", "scenario_code": "GE_OFFICE_AC", "index_start": 10}',
+    ]
+    report = importer.run(io.StringIO("\n".join(lines) + "\n"), fmt='jsonl')
+    assert report['inserted'] == 1 and report['n_errors'] == 3
+    errors = _errors(report)
+    assert "JSON invalide" in errors[2]
+    assert "Objet JSON attendu" in errors[3]
+    assert "Champs manquants" in errors[4]
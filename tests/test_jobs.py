@@ -0,0 +1,57 @@
+# ==============================================================================
+# TEST_JOBS.PY - Planifications cron et file de travaux
+# ==============================================================================
+from datetime import datetime
+
+import pytest
+
+from jobs import CronSchedule, JobScheduler, parse_params
+
+
+@pytest.mark.parametrize("expr, after, expected", [
+    ("*/15 * * * *", datetime(2024, 1, 1, 10, 7, 30), datetime(2024, 1, 1, 10, 15)),
+    # Strictement après : l'échéance courante n'est pas renvoyée
+    ("0 2 * * *", datetime(2024, 1, 1, 2, 0), datetime(2024, 1, 2, 2, 0)),
+    # Vendredi 5 janvier après l'heure : lundi suivant
+    ("30 8 * * 1-5", datetime(2024, 1, 5, 9, 0), datetime(2024, 1, 8, 8, 30)),
+    ("0 8-18/2 * * *", datetime(2024, 1, 1, 18, 30), datetime(2024, 1, 2, 8, 0)),
+    # 7 = dimanche
+    ("0 0 * * 7", datetime(2024, 1, 1, 12, 0), datetime(2024, 1, 7, 0, 0)),
+    # Jour du mois OU jour de semaine : le vendredi 5 passe avant le 13
+    ("0 0 13 * 5", datetime(2024, 1, 1, 0, 0), datetime(2024, 1, 5, 0, 0)),
+    ("0 0 1 1 *", datetime(2024, 6, 1, 0, 0), datetime(2025, 1, 1, 0, 0)),
+    ("0 0 29 2 *", datetime(2024, 3, 1, 0, 0), datetime(2028, 2, 29, 0, 0)),
+])
+def test_next_after(expr, after, expected):
+    assert CronSchedule(expr).next_after(after) == expected
+
+
+@pytest.mark.parametrize("expr", ["* * * *", "61 * * * *", "0 0 0 * *", "*/0 * * * *", "a * * * *"])
+def test_invalid_expression(expr):
+    with pytest.raises(ValueError):
+        CronSchedule(expr)
+
+
+def test_never_reached():
+    with pytest.raises(ValueError):
+        CronSchedule("0 0 31 2 *").next_after(datetime(2024, 1, 1))
+
+
+def test_parse_params_uses_handler_annotations():
+    assert parse_params('archive', ["horizon_days=90"]) == {'horizon_days': 90}
+    assert parse_params('archive', ["horizon_days=none"]) == {'horizon_days': None}
+    assert parse_params('report_export', ["since=2024-01-01"]) == {'since': "2024-01-01"}
+    with pytest.raises(ValueError):
+        parse_params('archive', ["horizon=90"])
+
+
+def test_unschedulable_without_params(db):
+    with pytest.raises(ValueError):
+        JobScheduler(db).add_schedule('report_export', "0 3 * * *")
+
+
+def test_purged_job_is_skipped(db):
+    scheduler = JobScheduler(db)
+    with scheduler._lock: scheduler._running.add("ghost")
+    scheduler._execute("ghost")
+    assert "ghost" not in scheduler._running
@@ -0,0 +1,85 @@
+# ==============================================================================
+# TEST_LEARNING.PY - Apprentissage incrémental des profils de charge
+# ==============================================================================
+import uuid
+
+import pytest
+
+from analytics import AdaptiveLearningEngine, DetailedLoadFactorManager
+
+SCENARIO = "GE_OFFICE_AC"
+BASE_LOAD = DetailedLoadFactorManager.get_scenario(SCENARIO).load_typ
+
+
+def _override(db, equipment_id="EQ-1"):
+    return dict(db.execute_read("SELECT * FROM equipment_load_overrides WHERE equipment_id = ?", (equipment_id,))[0])
+
+
+def _insert_legacy_profile(db, ratio, n, equipment_id="EQ-1"):
+    """Profil appris avant l'ajout des cumuls (ratio_sum / ratio_count NULL)"""
+    load = BASE_LOAD * ratio
+    db.execute_write(
+        "INSERT INTO equipment_load_overrides (equipment_id, scenario_code, load_min, load_typ, load_max, learned_from_n_samples, confidence_score, last_updated, is_active) VALUES (?, ?, ?, ?, ?, ?, 0.9, '2024-01-01', 1)",
+        (equipment_id, SCENARIO, load * 0.8, load, load * 1.2, n)
+    )
+
+
+def _insert_normal_audit(db, ratio, equipment_id="EQ-1", estimated=100.0):
+    db.execute_write(
+        "INSERT INTO audits (audit_uuid, timestamp, equipment_id, scenario_code, fuel_declared_l, estimated_typ, verdict) VALUES (?, '2024-01-01', ?, ?, ?, ?, 'NORMAL')",
+        (uuid.uuid4().hex, equipment_id, SCENARIO, estimated * ratio, estimated)
+    )
+
+
+def test_first_audit_creates_profile(db):
+    engine = AdaptiveLearningEngine()
+    assert engine.learn_from_audit(db, "EQ-1", SCENARIO, 110.0, 100.0, "NORMAL")
+    row = _override(db)
+    assert row['learned_from_n_samples'] == 1 and row['ratio_count'] == 1
+    assert row['load_typ'] == pytest.approx(BASE_LOAD * 1.1)
+
+
+def test_running_mean_over_audits(db):
+    engine = AdaptiveLearningEngine()
+    for declared in (110.0, 90.0, 120.0):
+        engine.learn_from_audit(db, "EQ-1", SCENARIO, declared, 100.0, "NORMAL")
+    row = _override(db)
+    assert row['ratio_sum'] == pytest.approx(3.2) and row['ratio_count'] == 3
+    assert row['load_typ'] == pytest.approx(BASE_LOAD * 3.2 / 3)
+
+
+def test_non_normal_audits_are_not_learned(db):
+    assert not AdaptiveLearningEngine().learn_from_audit(db, "EQ-1", SCENARIO, 150.0, 100.0, "ANOMALIE")
+    assert not db.execute_read("SELECT 1 FROM equipment_load_overrides")
+
+
+def test_legacy_profile_without_history_is_seeded(db):
+    """10 échantillons à 1.2 + 1 à 0.9 : la moyenne reste proche de 1.2, pas 0.9"""
+    _insert_legacy_profile(db, 1.2, 10)
+    AdaptiveLearningEngine().learn_from_audit(db, "EQ-1", SCENARIO, 90.0, 100.0, "NORMAL")
+    row = _override(db)
+    assert row['learned_from_n_samples'] == 11 and row['ratio_count'] == 11
+    assert row['load_typ'] == pytest.approx(BASE_LOAD * (10 * 1.2 + 0.9) / 11)
+
+
+def test_legacy_profile_is_backfilled_from_history_at_startup(db):
+    for ratio in (1.0, 1.1, 1.2, 1.3):
+        _insert_normal_audit(db, ratio)
+    _insert_legacy_profile(db, 1.15, 4)
+    db._init_database()  # Migration au démarrage
+    row = _override(db)
+    assert row['ratio_count'] == 4 and row['ratio_sum'] == pytest.approx(4.6)
+    AdaptiveLearningEngine().learn_from_audit(db, "EQ-1", SCENARIO, 100.0, 100.0, "NORMAL")
+    assert _override(db)['load_typ'] == pytest.approx(BASE_LOAD * 5.6 / 5)
+
+
+def test_batch_learning_matches_incremental(db):
+    engine = AdaptiveLearningEngine()
+    for ratio in (0.95, 1.05, 1.25):
+        _insert_normal_audit(db, ratio)
+        engine.learn_from_audit(db, "EQ-1", SCENARIO, 100.0 * ratio, 100.0, "NORMAL")
+    incremental = _override(db)
+    engine.batch_learn_from_all_equipment(db)
+    batch = _override(db)
+    assert batch['load_typ'] == pytest.approx(incremental['load_typ'])
+    assert (batch['ratio_count'], batch['learned_from_n_samples']) == (3, 3)
@@ -0,0 +1,37 @@
+# ==============================================================================
+# TEST_PASSWORDS.PY - Pool bcrypt : admission bornée par l'attente estimée
+# ==============================================================================
+import threading
+import time
+
+from passwords import HasherBusyError, PasswordHasher
+
+
+def test_overload_fails_fast_instead_of_queueing():
+    hasher = PasswordHasher(max_workers=1, rounds=PasswordHasher.MIN_ROUNDS, max_wait_s=0.5)
+    hasher._run(lambda: time.sleep(0.2), 'check')  # Passe après l'étalonnage (même worker)
+    hasher._cost_s = 0.2                           # Deux calculs de 0,2 s tiennent dans 0,5 s
+    start, outcomes = threading.Barrier(10), []
+
+    def login():
+        start.wait()
+        t0 = time.perf_counter()
+        try: hasher._run(lambda: time.sleep(0.2), 'check'); outcomes.append(('ok', time.perf_counter() - t0))
+        except HasherBusyError: outcomes.append(('busy', time.perf_counter() - t0))
+
+    threads = [threading.Thread(target=login) for _ in range(10)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    accepted = [s for status, s in outcomes if status == 'ok']
+    refused = [s for status, s in outcomes if status == 'busy']
+    assert 1 <= len(accepted) <= 2 and max(accepted) < 0.5 + 0.2
+    assert len(refused) == 10 - len(accepted) and max(refused) < 0.1
+    assert hasher.metrics()['rejected'] == len(refused)
+
+
+def test_changing_cost_rescales_measured_cost():
+    hasher = PasswordHasher(max_workers=1, rounds=PasswordHasher.MIN_ROUNDS)
+    assert hasher.check_password("secret", hasher.hash_password("secret"))
+    hasher._cost_s = 0.1
+    hasher.configure(rounds=PasswordHasher.MIN_ROUNDS + 3)
+    assert hasher.metrics()['cost_ms'] == 800
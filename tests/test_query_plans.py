@@ -0,0 +1,32 @@
+# ==============================================================================
+# TEST_QUERY_PLANS.PY - Requêtes applicatives servies par un index
+# Les requêtes viennent des constantes hot_query() exécutées par les modules :
+# modifier une requête à son point d'appel modifie ce qui est contrôlé ici.
+# ==============================================================================
+import pytest
+
+from database import hot_query, registered_hot_queries
+
+
+def test_registry_covers_application_modules():
+    names = set(registered_hot_queries())
+    # Un représentant par module déclarant : un module oublié dans QUERY_MODULES ferait taire son contrôle
+    assert {"config_value", "learning_ratios", "audit_latest_equipment", "drift_state", "audit_export_all",
+            "jobs_due", "tx_pending_user", "reaudit_chunk", "report_export_tier", "revoked_token_lookup"} <= names
+    assert any(name.startswith("page_") for name in names)
+
+
+def test_hot_queries_use_indexes(db):
+    # EXPLAIN de chaque requête : un SQL invalide (colonne renommée...) lève ici aussi
+    assert db.find_full_scans() == {}
+
+
+def test_full_scan_is_reported(db):
+    queries = {"by_name": ("SELECT * FROM audits WHERE materiel_name = ?", ("X",), False)}
+    assert "by_name" in db.find_full_scans(queries)
+    assert db.find_full_scans({"by_name": (*queries["by_name"][:2], ("audits",))}) == {}
+
+
+def test_redeclaring_a_name_with_other_sql_fails():
+    with pytest.raises(ValueError):
+        hot_query("config_value", "SELECT * FROM app_config")
@@ -0,0 +1,124 @@
+# ==============================================================================
+# TEST_REAUDIT.PY - Ré-audit par pagination par clé : total, reprise, dérive
+# ==============================================================================
+import random
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from analytics import DetailedLoadFactorManager, IntelligentAnomalyDetector
+from archive import AuditArchive
+from drift import DriftState, DriftStore
+from physics import IsoWillansModel
+from reaudit import BulkReauditEngine
+
+SCENARIO = "GE_OFFICE_AC"
+HOURS = 10.0
+
+
+def _expected_litres():
+    k, b = IsoWillansModel.coefficients_for_engines(["GENERIC_GE"])
+    load_pct = DetailedLoadFactorManager.get_scenario(SCENARIO).load_typ * 100
+    return float(IsoWillansModel.predict_consumption_array(load_pct, 0, 25, 1.05, 80.0, k, b)[0]) * HOURS
+
+
+def _seed(db, equipment_id, deviations, start=datetime(2024, 1, 1)):
+    est = _expected_litres()
+    db.execute_many(
+        "INSERT INTO audits (audit_uuid, timestamp, created_by, equipment_id, materiel_type, materiel_name, scenario_code, index_start, index_end, power_kw, fuel_declared_l, verdict) VALUES (?, ?, 'user', ?, 'GENERIC_GE', 'GE', ?, 0, ?, 80.0, ?, 'NORMAL')",
+        [(uuid.uuid4().hex, (start + timedelta(days=i)).isoformat(), equipment_id, SCENARIO, HOURS, est * (1 + d / 100)) for i, d in enumerate(deviations)]
+    )
+
+
+def _snapshot(db):
+    return [tuple(r) for r in db.execute_read("SELECT audit_uuid, deviation_pct, z_score, verdict FROM audits ORDER BY audit_uuid")]
+
+
+def test_total_counts_only_rows_the_scan_visits(db):
+    _seed(db, "EQ-1", [0.0] * 10)
+    db.execute_write("INSERT INTO audits (audit_uuid, timestamp, equipment_id) VALUES ('no-ts', NULL, 'EQ-1')")
+    db.execute_write("INSERT INTO audits (audit_uuid, timestamp, equipment_id) VALUES ('no-eq', '2024-02-01', NULL)")
+    run = BulkReauditEngine(db, chunk_size=4).run()
+    assert run['status'] == 'DONE'
+    assert run['total_rows'] == run['processed_rows'] == 10
+
+
+def test_resume_after_stop_matches_an_uninterrupted_run(db):
+    rng = random.Random(7)
+    for eq in ("EQ-A", "EQ-B", "EQ-C"):
+        _seed(db, eq, [rng.gauss(0, 8) for _ in range(30)])
+    engine = BulkReauditEngine(db, chunk_size=7)
+    chunks = iter(range(100))
+    paused = engine.run(should_stop=lambda: next(chunks) >= 3)
+    assert paused['status'] == 'PAUSED' and paused['processed_rows'] == 21
+    assert engine.list_unfinished_runs()[0]['run_id'] == paused['run_id']
+
+    done = engine.run(paused['run_id'])
+    assert done['status'] == 'DONE' and done['processed_rows'] == done['total_rows'] == 90
+    resumed = _snapshot(db)
+
+    # Même recalcul d'une traite, découpage différent : rien ne doit changer
+    again = BulkReauditEngine(db, chunk_size=50).run()
+    assert again['changed_verdicts'] == 0
+    for (uuid_a, dev_a, z_a, verdict_a), (uuid_b, dev_b, z_b, verdict_b) in zip(_snapshot(db), resumed):
+        assert (uuid_a, verdict_a) == (uuid_b, verdict_b)
+        assert dev_a == pytest.approx(dev_b) and z_a == pytest.approx(z_b)
+
+
+def test_verdicts_match_the_interactive_drift_rule(db):
+    """Dérive lente de +6 % : Z-score habitué, la règle de dérive doit rendre les audits SUSPECT"""
+    _seed(db, "EQ-1", [6.0 + (0.5 if i % 2 else -0.5) for i in range(30)])
+    BulkReauditEngine(db, chunk_size=8).run()
+    rows = db.execute_read("SELECT timestamp, deviation_pct, verdict FROM audits ORDER BY timestamp")
+
+    detector, drift = IntelligentAnomalyDetector(), DriftStore(db).detector
+    bank, history = drift.new_bank([DriftState("EQ-1")]), []
+    expected = []
+    for r in rows:
+        drift.run(bank, [0], [r['deviation_pct']], [r['timestamp']])
+        state = drift.states_from_bank(["EQ-1"], bank)[0]
+        expected.append(detector.detect_anomaly("EQ-1", r['deviation_pct'], list(reversed(history[-20:])), drift=state).verdict)
+        history.append(r['deviation_pct'])
+    assert [r['verdict'] for r in rows] == expected
+    assert "SUSPECT" in expected
+
+
+def _reset(db):
+    db.execute_write("UPDATE audits SET deviation_pct = NULL, z_score = NULL, verdict = 'NORMAL'")
+
+
+def test_resume_skips_unknown_deviations(db):
+    rng = random.Random(11)
+    for eq in ("EQ-A", "EQ-B"):
+        _seed(db, eq, [rng.gauss(0, 8) for _ in range(30)])
+    # Un audit sur cinq non recalculable : son écart reste NULL, hors de la fenêtre Z-score
+    db.execute_write("UPDATE audits SET scenario_code = 'INCONNU' WHERE rowid % 5 = 0")
+    BulkReauditEngine(db, chunk_size=50).run()
+    uninterrupted = _snapshot(db)
+
+    _reset(db)
+    engine = BulkReauditEngine(db, chunk_size=7)
+    chunks = iter(range(100))
+    paused = engine.run(should_stop=lambda: next(chunks) >= 3)
+    assert paused['status'] == 'PAUSED'
+    engine.run(paused['run_id'])
+    for (uuid_a, dev_a, z_a, verdict_a), (uuid_b, dev_b, z_b, verdict_b) in zip(_snapshot(db), uninterrupted):
+        assert (uuid_a, verdict_a) == (uuid_b, verdict_b)
+        assert dev_a == pytest.approx(dev_b) and z_a == pytest.approx(z_b)
+
+
+def test_window_is_seeded_from_archives(db):
+    archived = [2.0 + (1.0 if i % 2 else -1.0) for i in range(25)]
+    _seed(db, "EQ-1", [0.0] * 25, start=datetime(2020, 1, 1))
+    rows = db.execute_read("SELECT rowid FROM audits ORDER BY timestamp")
+    db.execute_many("UPDATE audits SET deviation_pct = ? WHERE rowid = ?", [(d, r['rowid']) for d, r in zip(archived, rows)])
+    AuditArchive(db).run(horizon_days=365)
+    _seed(db, "EQ-1", [12.0, 2.0, 3.0])
+    BulkReauditEngine(db).run()
+
+    hot = db.execute_read("SELECT deviation_pct, z_score, verdict FROM audits ORDER BY timestamp")
+    # Première saisie chaude jugée contre les écarts archivés, pas en démarrage à froid
+    expected = IntelligentAnomalyDetector().detect_anomaly("EQ-1", hot[0]['deviation_pct'], list(reversed(archived[-20:])))
+    assert hot[0]['z_score'] == pytest.approx(expected.z_score) and hot[0]['z_score'] > 3
+    assert hot[0]['verdict'] == expected.verdict
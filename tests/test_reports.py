@@ -0,0 +1,36 @@
+# ==============================================================================
+# TEST_REPORTS.PY - Rapport de flotte : documents de taille bornée
+# ==============================================================================
+import re
+from datetime import datetime
+
+from reports import PDFReportGenerator
+
+
+def _audits(n):
+    for i in range(n):
+        yield {'audit_uuid': f"A-{i}", 'equipment_name': "GE", 'user': "alice", 'fuel_declared': 110.0, 'fuel_estimated': 100.0,
+               'deviation': 10.0, 'verdict': "NORMAL", 'scenario': "GE_OFFICE_AC", 'hours': 10.0, 'timestamp': datetime(2024, 1, 1)}
+
+
+def _page_count(path):
+    with open(path, "rb") as f: return len(re.findall(rb"/Type /Page\b(?!s)", f.read()))
+
+
+def test_fleet_report_split_into_bounded_parts(tmp_path):
+    consumed = []
+    audits = (consumed.append(a) or a for a in _audits(25))
+    parts = PDFReportGenerator().generate_fleet_report_parts(audits, lambda k: str(tmp_path / f"part{k}.pdf"), max_pages=10)
+    assert parts == [10, 10, 5] and len(consumed) == 25
+    assert [_page_count(tmp_path / f"part{k}.pdf") for k in (1, 2, 3)] == [10, 10, 5]
+
+
+def test_fleet_report_stops_at_max_pages(tmp_path):
+    audits = _audits(12)
+    assert PDFReportGenerator().generate_fleet_report(audits, str(tmp_path / "a.pdf"), max_pages=10) == 10
+    assert len(list(audits)) == 2  # Restent dans l'itérateur pour la partie suivante
+
+
+def test_empty_fleet_report_is_one_part(tmp_path):
+    assert PDFReportGenerator().generate_fleet_report_parts([], lambda k: str(tmp_path / f"part{k}.pdf")) == [0]
+    assert _page_count(tmp_path / "part1.pdf") == 1
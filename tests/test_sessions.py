@@ -0,0 +1,70 @@
+# ==============================================================================
+# TEST_SESSIONS.PY - Révocation des jetons de session
+# ==============================================================================
+import time
+import uuid
+
+import jwt
+
+from security import SECRET_KEY, EnhancedSecurityManager, SessionStore
+
+
+def _token(sub="alice", iat=None, exp_in=3600, ip="127.0.0.1"):
+    iat = time.time() if iat is None else iat
+    return jwt.encode({'sub': sub, 'ip': ip, 'jti': uuid.uuid4().hex, 'iat': iat, 'exp': int(iat + exp_in)}, SECRET_KEY, algorithm='HS256')
+
+
+def _store(db):
+    store = SessionStore(db)
+    store.REFRESH_INTERVAL_S = 0.0
+    return store
+
+
+def test_logout_rejected_in_every_process(db):
+    app, other = _store(db), _store(db)
+    token = _token()
+    assert app.validate(token, "127.0.0.1") is not None
+    assert other.validate(token) is not None
+    app.revoke_token(token)
+    assert app.validate(token) is None
+    assert other.validate(token) is None
+    assert app.validate(_token()) is not None
+
+
+def test_revoke_user_keeps_new_login_of_same_second(db):
+    store = _store(db)
+    manager = EnhancedSecurityManager(db, sessions=store)
+    old = _token(iat=int(time.time()) - 10)
+    store.revoke_user("alice")
+    assert store.validate(old) is None
+    # Émis juste après la déconnexion forcée, le plus souvent dans la même seconde
+    assert store.validate(manager.create_session_token("alice", "127.0.0.1")) is not None
+    assert store.validate(_token(sub="bob", iat=int(time.time()) - 10)) is not None
+
+
+def test_revoke_user_rejects_token_of_same_second(db):
+    store, other = _store(db), _store(db)
+    manager = EnhancedSecurityManager(db, sessions=store)
+    now = time.time()
+    while int(now) != int(now + 0.05): time.sleep(0.01); now = time.time()  # Loin de la fin de la seconde
+    stolen = manager.create_session_token("alice", "127.0.0.1")
+    legacy = _token(iat=int(now))  # iat tronqué à la seconde (jetons émis avant la précision fractionnaire)
+    assert store.validate(stolen) is not None and other.validate(legacy) is not None
+    store.revoke_user("alice")
+    assert int(time.time()) == int(now)
+    for s in (store, other):
+        assert s.validate(stolen) is None and s.validate(legacy) is None
+
+
+def test_purge_keeps_live_revocations(db):
+    app, other = _store(db), _store(db)
+    expired, live = _token(iat=int(time.time()) - 7200), _token()
+    app.revoke_token(live)
+    app.revoke_token(expired)  # Rowid maximal, déjà expiré
+    other.validate(live)  # « other » a lu les révocations jusqu'au rowid 2
+    app.purge_expired()
+    assert app.validate(live) is None
+    # Nouvelle révocation après la purge : rowid non réutilisé, vue par l'autre process
+    late = _token()
+    app.revoke_token(late)
+    assert other.validate(late) is None